@@ -0,0 +1,89 @@
+""" Пакетные методы BaseDAO против вставки и обновления по одной строке
+
+Запуск против базы из переменных окружения DB_*:
+
+    python benchmarks/bulk_dao.py --rows 5000
+
+Для каждого способа строки таблицы blobs пишутся внутри транзакции, которая затем
+откатывается, так что база не меняется. Выводится время и число строк в секунду:
+BaseDAO.add в цикле против add_many, BlobDAO.add_reference в цикле против upsert_many,
+BaseDAO.update в цикле против update_many.
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.api.dao import BlobDAO  # noqa: E402
+from src.api.models import Blob  # noqa: E402
+from src.database import async_session_maker  # noqa: E402
+
+
+def make_rows(count: int) -> list[dict]:
+    return [{"hash": hashlib.sha256(os.urandom(16)).hexdigest(), "size": i, "ref_count": 1} for i in range(count)]
+
+
+async def add_per_row(db, rows):
+    for row in rows:
+        await BlobDAO.add(db, row)
+
+
+async def add_many(db, rows):
+    await BlobDAO.add_many(db, rows, returning=False)
+
+
+async def upsert_per_row(db, rows):
+    for row in rows:
+        await BlobDAO.add_reference(db, row["hash"], row["size"])
+
+
+async def upsert_many(db, rows):
+    await BlobDAO.upsert_many(
+        db, rows, index_elements=[Blob.hash],
+        set_=lambda excluded: {"ref_count": Blob.ref_count + excluded.ref_count})
+
+
+async def update_per_row(db, rows):
+    for row in rows:
+        await BlobDAO.update(db, Blob.hash == row["hash"], obj_in={"size": row["size"] + 1})
+
+
+async def update_many(db, rows):
+    await BlobDAO.update_many(db, [{"hash": row["hash"], "size": row["size"] + 1} for row in rows], key="hash")
+
+
+async def measure(name: str, func, rows: list[dict], prepare=None) -> None:
+    async with async_session_maker() as db:
+        if prepare is not None:
+            await prepare(db, rows)
+
+        started = time.perf_counter()
+        await func(db, rows)
+        elapsed = time.perf_counter() - started
+
+        await db.rollback()
+
+    print(f"{name:>16}: {elapsed * 1000:9.1f} ms, {len(rows) / elapsed:10.0f} rows/s")
+
+
+async def main(args):
+    for per_row, bulk, prepare in (
+        (add_per_row, add_many, None),
+        (upsert_per_row, upsert_many, add_many),
+        (update_per_row, update_many, add_many),
+    ):
+        rows = make_rows(args.rows)
+        await measure(per_row.__name__, per_row, rows[:args.per_row_rows], prepare)
+        await measure(bulk.__name__, bulk, rows, prepare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--per-row-rows", type=int, default=1000, help="строк для медленных способов по одной строке")
+
+    asyncio.run(main(parser.parse_args()))
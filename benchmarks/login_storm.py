@@ -0,0 +1,92 @@
+""" Нагрузка логинами и задержка посторонних запросов
+
+Запуск против работающего сервера:
+
+    uvicorn src.main:app --port 8000
+    python benchmarks/login_storm.py --url http://127.0.0.1:8000 --concurrency 64 --duration 20
+
+Пока concurrency клиентов непрерывно логинятся, отдельный клиент раз в --probe-interval
+запрашивает --probe-path. Выводятся пропускная способность логина, число 503 и перцентили
+задержки пробного запроса. Сравните результаты с PASSWORD_HASHER_EXECUTOR=thread/process
+и разными PASSWORD_HASHER_WORKERS / PASSWORD_HASHER_MAX_PENDING.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from collections import Counter
+from secrets import token_hex
+
+import httpx
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def login_worker(client: httpx.AsyncClient, credentials: dict, deadline: float, statuses: Counter, latencies: list):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.post("/login/", params=credentials)
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] += 1
+
+        if response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+
+
+async def probe(client: httpx.AsyncClient, path: str, interval: float, deadline: float, latencies: list):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await client.get(path)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+
+
+async def main(args):
+    credentials = {"username": token_hex(5), "password": token_hex(8)}
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        response = await client.post("/registration/", json={
+            **credentials,
+            "email": f"{credentials['username']}@example.com",
+            "is_superuser": False,
+        })
+        response.raise_for_status()
+
+        # Задержка пробного запроса без нагрузки, для сравнения
+        baseline = []
+        await probe(client, args.probe_path, args.probe_interval, time.perf_counter() + 2, baseline)
+
+        statuses, login_latencies, probe_latencies = Counter(), [], []
+        started = time.perf_counter()
+        deadline = started + args.duration
+
+        await asyncio.gather(
+            probe(client, args.probe_path, args.probe_interval, deadline, probe_latencies),
+            *[login_worker(client, credentials, deadline, statuses, login_latencies) for _ in range(args.concurrency)],
+        )
+        elapsed = time.perf_counter() - started
+
+    print(f"logins: {statuses[200] / elapsed:.1f}/s ok, statuses {dict(statuses)}")
+    print(f"login latency: p50 {percentile(login_latencies, 0.5) * 1000:.1f} ms, p99 {percentile(login_latencies, 0.99) * 1000:.1f} ms")
+    print(f"{args.probe_path} idle: p50 {statistics.median(baseline) * 1000:.1f} ms, p99 {percentile(baseline, 0.99) * 1000:.1f} ms")
+    print(f"{args.probe_path} under storm: p50 {percentile(probe_latencies, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(probe_latencies, 0.99) * 1000:.1f} ms, max {max(probe_latencies) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--probe-path", default="/")
+    parser.add_argument("--probe-interval", type=float, default=0.01)
+
+    asyncio.run(main(parser.parse_args()))
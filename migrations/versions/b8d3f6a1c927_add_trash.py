@@ -0,0 +1,45 @@
+"""Add trash indexes to deleted_files
+
+Revision ID: b8d3f6a1c927
+Revises: 9c4a7e2d5b18
+Create Date: 2026-10-18 23:02:31.118604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d3f6a1c927'
+down_revision: Union[str, None] = '9c4a7e2d5b18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('deleted_files', sa.Column('user_id', sa.String(), nullable=True))
+    op.execute("UPDATE deleted_files SET user_id = files.user_id FROM files WHERE files.id = deleted_files.file_id")
+    op.alter_column('deleted_files', 'user_id', nullable=False)
+    op.create_foreign_key(None, 'deleted_files', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_deleted_files_user_id_deleted_at_id', 'deleted_files', ['user_id', 'deleted_at', 'id'], unique=False)
+
+    # Как refresh_token_expiry: интервал только из секунд, поэтому функцию можно индексировать
+    op.execute(
+        """
+        CREATE FUNCTION deleted_file_expiry(deleted_at timestamptz, expires_at integer)
+        RETURNS timestamptz
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$ SELECT deleted_at + expires_at * interval '1 second' $$
+        """
+    )
+    op.create_index('ix_deleted_files_expiry', 'deleted_files', [sa.text('deleted_file_expiry(deleted_at, expires_at)')], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_deleted_files_expiry', table_name='deleted_files')
+    op.execute("DROP FUNCTION deleted_file_expiry(timestamptz, integer)")
+    op.drop_index('ix_deleted_files_user_id_deleted_at_id', table_name='deleted_files')
+    op.drop_constraint('deleted_files_user_id_fkey', 'deleted_files', type_='foreignkey')
+    op.drop_column('deleted_files', 'user_id')
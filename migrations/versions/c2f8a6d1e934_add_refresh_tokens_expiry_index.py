@@ -0,0 +1,37 @@
+"""Add refresh_tokens expiry index
+
+Revision ID: c2f8a6d1e934
+Revises: a7c9e2d4b610
+Create Date: 2026-10-18 16:20:37.512904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f8a6d1e934'
+down_revision: Union[str, None] = 'a7c9e2d4b610'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # timestamptz + interval помечен STABLE из-за дней и месяцев; интервал только из секунд
+    # от часового пояса не зависит, поэтому функцию можно объявить IMMUTABLE и индексировать
+    op.execute(
+        """
+        CREATE FUNCTION refresh_token_expiry(created_at timestamptz, expires_at integer)
+        RETURNS timestamptz
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$ SELECT created_at + expires_at * interval '1 second' $$
+        """
+    )
+    op.create_index('ix_refresh_tokens_expiry', 'refresh_tokens', [sa.text('refresh_token_expiry(created_at, expires_at)')], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_refresh_tokens_expiry', table_name='refresh_tokens')
+    op.execute("DROP FUNCTION refresh_token_expiry(timestamptz, integer)")
@@ -0,0 +1,43 @@
+"""Move files into storage backend
+
+Revision ID: e9a2d7c4f1b8
+Revises: b41f0e6c2a57
+Create Date: 2026-10-18 13:05:27.114908
+
+"""
+import logging
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9a2d7c4f1b8'
+down_revision: Union[str, None] = 'b41f0e6c2a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+
+def upgrade() -> None:
+    # Копирование содержимого зависит от кода storage backend, который будет меняться,
+    # поэтому оно вынесено в отдельную команду, а миграция только напоминает о ней
+    conn = op.get_bind()
+
+    blobs = conn.execute(sa.text("SELECT count(*) FROM blobs")).scalar_one()
+    legacy_files = conn.execute(sa.text("SELECT count(*) FROM files WHERE blob_hash IS NULL")).scalar_one()
+
+    if blobs or legacy_files:
+        logger.warning(
+            f"{blobs} blobs and {legacy_files} files without blob have to be copied into the storage backend: "
+            "run `python -m src.api.legacy_import` after the upgrade"
+        )
+
+
+def downgrade() -> None:
+    # Содержимое остается в storage backend, обратного переноса нет
+    pass
@@ -0,0 +1,47 @@
+"""Add folders.tree_path
+
+Revision ID: f1b5d8a2c364
+Revises: e6a3c9f2b718
+Create Date: 2026-10-18 18:32:05.117480
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1b5d8a2c364'
+down_revision: Union[str, None] = 'e6a3c9f2b718'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('folders', sa.Column('tree_path', sa.String(collation='C'), nullable=True))
+
+    # Заполняем пути существующих папок от корней вниз
+    op.execute(
+        """
+        WITH RECURSIVE tree AS (
+            SELECT id, '/' || id || '/' AS tree_path
+            FROM folders
+            WHERE parent_folder_id IS NULL
+            UNION ALL
+            SELECT folders.id, tree.tree_path || folders.id || '/'
+            FROM folders JOIN tree ON folders.parent_folder_id = tree.id
+        )
+        UPDATE folders SET tree_path = tree.tree_path
+        FROM tree
+        WHERE folders.id = tree.id
+        """
+    )
+
+    op.alter_column('folders', 'tree_path', nullable=False)
+    op.create_index('ix_folders_user_id_tree_path', 'folders', ['user_id', 'tree_path'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_folders_user_id_tree_path', table_name='folders')
+    op.drop_column('folders', 'tree_path')
@@ -0,0 +1,250 @@
+import struct
+import zlib
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator
+
+from starlette.concurrency import run_in_threadpool
+
+from .config import ARCHIVE_COMPRESSION_LEVEL, ARCHIVE_STORED_EXTENSIONS
+from .storage import StorageBackend
+
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP32_MAX_ENTRIES = 0xFFFF
+
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+# Старший байт version made by: 3 - UNIX, чтобы распаковщики учитывали права из external attr
+VERSION_MADE_BY = (3 << 8) | VERSION_ZIP64
+
+FILE_ATTRIBUTES = (0o100644 << 16)
+DIRECTORY_ATTRIBUTES = (0o40755 << 16) | 0x10
+
+
+@dataclass
+class ArchiveEntry:
+    name: str
+    key: str | None = None
+    size: int = 0
+    modified_at: datetime | None = None
+
+    @property
+    def is_directory(self) -> bool:
+        return self.key is None
+
+
+@dataclass
+class _Record:
+    name: bytes
+    method: int
+    flags: int
+    dos_time: int
+    dos_date: int
+    offset: int
+    crc: int = 0
+    compressed_size: int = 0
+    size: int = 0
+    external_attributes: int = FILE_ATTRIBUTES
+
+
+def _dos_datetime(value: datetime | None) -> tuple[int, int]:
+    if value is None or value.year < 1980:
+        return 0, (1 << 5) | 1
+
+    dos_time = (value.hour << 11) | (value.minute << 5) | (value.second // 2)
+    dos_date = ((value.year - 1980) << 9) | (value.month << 5) | value.day
+
+    return dos_time, dos_date
+
+
+def _should_compress(name: str) -> bool:
+    _, dot, extension = name.rpartition(".")
+    return not dot or extension.lower() not in ARCHIVE_STORED_EXTENSIONS
+
+
+def _needs_zip64(size: int) -> bool:
+    # Размер после deflate заранее неизвестен, поэтому оставляем запас на его рост
+    return size + size // 1000 + 1024 >= ZIP32_LIMIT
+
+
+def _local_header(record: _Record, zip64: bool) -> bytes:
+    extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if zip64 else b""
+    sizes = ZIP32_LIMIT if zip64 else 0
+
+    return struct.pack(
+        "<IHHHHHIIIHH",
+        0x04034b50,
+        VERSION_ZIP64 if zip64 else VERSION_DEFAULT,
+        record.flags,
+        record.method,
+        record.dos_time,
+        record.dos_date,
+        0,
+        sizes,
+        sizes,
+        len(record.name),
+        len(extra),
+    ) + record.name + extra
+
+
+def _data_descriptor(record: _Record, zip64: bool) -> bytes:
+    if zip64:
+        return struct.pack("<IIQQ", 0x08074b50, record.crc, record.compressed_size, record.size)
+
+    return struct.pack("<IIII", 0x08074b50, record.crc, record.compressed_size, record.size)
+
+
+def _central_directory_header(record: _Record) -> bytes:
+
+    """ В zip64 extra попадают только те поля, которые не поместились в 32 бита """
+
+    zip64_fields = [value for value in (record.size, record.compressed_size, record.offset) if value >= ZIP32_LIMIT]
+    extra = struct.pack(f"<HH{len(zip64_fields)}Q", 0x0001, 8 * len(zip64_fields), *zip64_fields) if zip64_fields else b""
+
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII",
+        0x02014b50,
+        VERSION_MADE_BY,
+        VERSION_ZIP64 if zip64_fields else VERSION_DEFAULT,
+        record.flags,
+        record.method,
+        record.dos_time,
+        record.dos_date,
+        record.crc,
+        min(record.compressed_size, ZIP32_LIMIT),
+        min(record.size, ZIP32_LIMIT),
+        len(record.name),
+        len(extra),
+        0,
+        0,
+        0,
+        record.external_attributes,
+        min(record.offset, ZIP32_LIMIT),
+    ) + record.name + extra
+
+
+def _end_of_central_directory(count: int, size: int, offset: int) -> bytes:
+    tail = b""
+
+    if count >= ZIP32_MAX_ENTRIES or size >= ZIP32_LIMIT or offset >= ZIP32_LIMIT:
+        zip64_offset = offset + size
+        tail += struct.pack(
+            "<IQHHIIQQQQ", 0x06064b50, 44, VERSION_MADE_BY, VERSION_ZIP64, 0, 0, count, count, size, offset)
+        tail += struct.pack("<IIQI", 0x07064b50, 0, zip64_offset, 1)
+
+    return tail + struct.pack(
+        "<IHHHHIIH",
+        0x06054b50,
+        0,
+        0,
+        min(count, ZIP32_MAX_ENTRIES),
+        min(count, ZIP32_MAX_ENTRIES),
+        min(size, ZIP32_LIMIT),
+        min(offset, ZIP32_LIMIT),
+        0,
+    )
+
+
+async def _iter_entry(
+    storage: StorageBackend,
+    entry: ArchiveEntry,
+    record: _Record,
+    compression_level: int,
+) -> AsyncIterator[bytes]:
+
+    """ Отдает содержимое записи, по пути считая CRC и размеры для data descriptor """
+
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -15) if record.method == ZIP_DEFLATED else None
+
+    async for chunk in storage.open_range(entry.key):
+        record.crc = zlib.crc32(chunk, record.crc)
+        record.size += len(chunk)
+
+        if compressor is not None:
+            chunk = await run_in_threadpool(compressor.compress, chunk)
+            if not chunk:
+                continue
+
+        record.compressed_size += len(chunk)
+        yield chunk
+
+    if compressor is not None:
+        chunk = compressor.flush()
+        record.compressed_size += len(chunk)
+        yield chunk
+
+
+async def iter_zip(
+    storage: StorageBackend,
+    entries: list[ArchiveEntry],
+    compression_level: int = ARCHIVE_COMPRESSION_LEVEL,
+) -> AsyncIterator[bytes]:
+
+    """ Потоковый ZIP64 без временных файлов: в памяти держится один чанк и заголовки записей
+
+    Размеры и CRC записей становятся известны только после чтения, поэтому они пишутся
+    в data descriptor после данных, а центральный каталог - в конце архива.
+    """
+
+    records = []
+    offset = 0
+
+    for entry in entries:
+        dos_time, dos_date = _dos_datetime(entry.modified_at)
+
+        if entry.is_directory:
+            record = _Record(
+                name=entry.name.rstrip("/").encode() + b"/",
+                method=ZIP_STORED,
+                flags=FLAG_UTF8,
+                dos_time=dos_time,
+                dos_date=dos_date,
+                offset=offset,
+                external_attributes=DIRECTORY_ATTRIBUTES,
+            )
+            header = _local_header(record, zip64=False)
+            offset += len(header)
+            records.append(record)
+            yield header
+            continue
+
+        record = _Record(
+            name=entry.name.encode(),
+            method=ZIP_DEFLATED if _should_compress(entry.name) else ZIP_STORED,
+            flags=FLAG_DATA_DESCRIPTOR | FLAG_UTF8,
+            dos_time=dos_time,
+            dos_date=dos_date,
+            offset=offset,
+        )
+        zip64 = _needs_zip64(entry.size)
+
+        header = _local_header(record, zip64)
+        offset += len(header)
+        yield header
+
+        async for chunk in _iter_entry(storage, entry, record, compression_level):
+            offset += len(chunk)
+            yield chunk
+
+        descriptor = _data_descriptor(record, zip64)
+        offset += len(descriptor)
+        records.append(record)
+        yield descriptor
+
+    central_directory_offset = offset
+    central_directory_size = 0
+
+    for record in records:
+        header = _central_directory_header(record)
+        central_directory_size += len(header)
+        yield header
+
+    yield _end_of_central_directory(len(records), central_directory_size, central_directory_offset)
@@ -6,3 +6,83 @@ load_dotenv()
 
 ROOT_DIR = os.environ.get("ROOT_DIR")
 UPLOAD_DIR = os.environ.get("UPLOAD_DIR")
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+
+UPLOAD_SESSION_TTL_SECONDS = int(os.environ.get("UPLOAD_SESSION_TTL_SECONDS", 24 * 60 * 60))
+UPLOAD_SESSION_MAX_CHUNK_SIZE = int(os.environ.get("UPLOAD_SESSION_MAX_CHUNK_SIZE", 64 * 1024 * 1024))
+UPLOAD_SESSION_GC_INTERVAL_SECONDS = int(os.environ.get("UPLOAD_SESSION_GC_INTERVAL_SECONDS", 10 * 60))
+UPLOAD_SESSION_GC_BATCH_SIZE = int(os.environ.get("UPLOAD_SESSION_GC_BATCH_SIZE", 100))
+
+# Рекурсивное удаление папок: файлы и папки удаляются пачками фоновой задачей
+DELETE_JOB_INTERVAL_SECONDS = int(os.environ.get("DELETE_JOB_INTERVAL_SECONDS", 5))
+DELETE_JOB_BATCH_SIZE = int(os.environ.get("DELETE_JOB_BATCH_SIZE", 500))
+DELETE_JOB_CONCURRENCY = int(os.environ.get("DELETE_JOB_CONCURRENCY", 16))
+# Задача в статусе running без прогресса дольше этого считается брошенной и подхватывается снова
+DELETE_JOB_STALE_SECONDS = int(os.environ.get("DELETE_JOB_STALE_SECONDS", 5 * 60))
+# После ошибки задача повторяется с экспоненциальной паузой от BASE до MAX секунд
+DELETE_JOB_RETRY_BASE_SECONDS = int(os.environ.get("DELETE_JOB_RETRY_BASE_SECONDS", 30))
+DELETE_JOB_RETRY_MAX_SECONDS = int(os.environ.get("DELETE_JOB_RETRY_MAX_SECONDS", 60 * 60))
+
+# Blob-ы без ссылок удаляются сборщиком после коммита транзакции, которая их освободила
+BLOB_GC_INTERVAL_SECONDS = int(os.environ.get("BLOB_GC_INTERVAL_SECONDS", 10 * 60))
+BLOB_GC_BATCH_SIZE = int(os.environ.get("BLOB_GC_BATCH_SIZE", 500))
+
+# Размеры папок ведутся приращениями; сверка пересчитывает их с нуля по пачкам пользователей
+FOLDER_STATS_VERIFY_INTERVAL_SECONDS = int(os.environ.get("FOLDER_STATS_VERIFY_INTERVAL_SECONDS", 24 * 60 * 60))
+FOLDER_STATS_VERIFY_BATCH_SIZE = int(os.environ.get("FOLDER_STATS_VERIFY_BATCH_SIZE", 100))
+
+# Квота на сумму размеров файлов пользователя, 0 - без ограничения
+STORAGE_QUOTA_BYTES = int(os.environ.get("STORAGE_QUOTA_BYTES", 0))
+# Число строк-слотов счетчика на пользователя: больше слотов - меньше ожидания блокировок при параллельных загрузках
+USAGE_COUNTER_SLOTS = int(os.environ.get("USAGE_COUNTER_SLOTS", 8))
+USAGE_RECONCILE_INTERVAL_SECONDS = int(os.environ.get("USAGE_RECONCILE_INTERVAL_SECONDS", 6 * 60 * 60))
+USAGE_RECONCILE_BATCH_SIZE = int(os.environ.get("USAGE_RECONCILE_BATCH_SIZE", 500))
+
+# Корзина: удаленный файл хранится TRASH_RETENTION_SECONDS, затем его удаляет фоновая очистка
+TRASH_RETENTION_SECONDS = int(os.environ.get("TRASH_RETENTION_SECONDS", 30 * 24 * 60 * 60))
+TRASH_PURGE_INTERVAL_SECONDS = int(os.environ.get("TRASH_PURGE_INTERVAL_SECONDS", 10 * 60))
+TRASH_PURGE_BATCH_SIZE = int(os.environ.get("TRASH_PURGE_BATCH_SIZE", 500))
+# За один запуск не больше стольких пачек, с паузой между ними, чтобы не забивать диск
+TRASH_PURGE_MAX_BATCHES = int(os.environ.get("TRASH_PURGE_MAX_BATCHES", 20))
+TRASH_PURGE_BATCH_PAUSE_SECONDS = float(os.environ.get("TRASH_PURGE_BATCH_PAUSE_SECONDS", 1))
+# Часы UTC, в которые работает очистка, "начало-конец" (например "1-6"); пусто - в любое время
+TRASH_PURGE_HOURS = os.environ.get("TRASH_PURGE_HOURS", "")
+
+UPLOAD_BATCH_MAX_FILES = int(os.environ.get("UPLOAD_BATCH_MAX_FILES", 1000))
+UPLOAD_BATCH_CONCURRENCY = int(os.environ.get("UPLOAD_BATCH_CONCURRENCY", 8))
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local")
+STORAGE_ROOT = os.environ.get("STORAGE_ROOT", os.path.join(ROOT_DIR or "", UPLOAD_DIR or "", ".storage"))
+
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+S3_BUCKET = os.environ.get("S3_BUCKET")
+S3_ACCESS_KEY = os.environ.get("S3_ACCESS_KEY")
+S3_SECRET_KEY = os.environ.get("S3_SECRET_KEY")
+S3_REGION = os.environ.get("S3_REGION", "us-east-1")
+S3_PART_SIZE = int(os.environ.get("S3_PART_SIZE", 8 * 1024 * 1024))
+
+MAX_RANGES = int(os.environ.get("MAX_RANGES", 16))
+GET_FILE_CACHE_CONTROL = os.environ.get("GET_FILE_CACHE_CONTROL", "private, no-cache")
+
+# stream - отдает сам воркер, sendfile - zero-copy через расширение ASGI сервера,
+# x-accel / x-sendfile - отдает nginx / apache по внутреннему заголовку
+FILE_DELIVERY_MODE = os.environ.get("FILE_DELIVERY_MODE", "stream")
+# internal location в nginx, у которой alias указывает на STORAGE_ROOT
+ACCEL_REDIRECT_PREFIX = os.environ.get("ACCEL_REDIRECT_PREFIX", "/protected_files")
+
+# Отдельный ключ HMAC для ссылок на скачивание, обязателен: без него приложение не стартует
+DOWNLOAD_URL_SECRET = os.environ.get("DOWNLOAD_URL_SECRET")
+DOWNLOAD_URL_TTL_SECONDS = int(os.environ.get("DOWNLOAD_URL_TTL_SECONDS", 5 * 60))
+DOWNLOAD_URL_MAX_TTL_SECONDS = int(os.environ.get("DOWNLOAD_URL_MAX_TTL_SECONDS", 24 * 60 * 60))
+
+ARCHIVE_COMPRESSION_LEVEL = int(os.environ.get("ARCHIVE_COMPRESSION_LEVEL", 6))
+# Уже сжатые форматы кладутся в архив как есть, повторное сжатие только тратит CPU
+ARCHIVE_STORED_EXTENSIONS = frozenset(os.environ.get(
+    "ARCHIVE_STORED_EXTENSIONS",
+    "zip,gz,tgz,bz2,xz,zst,7z,rar,jpg,jpeg,png,gif,webp,heic,avif,mp3,aac,ogg,opus,flac,m4a,"
+    "mp4,m4v,mkv,mov,avi,webm,docx,xlsx,pptx,odt,ods,odp,epub,jar,apk",
+).lower().split(","))
+
+# Отдельный пул для операций с диском, чтобы медленный том не занимал общий пул starlette
+FS_THREAD_POOL_SIZE = int(os.environ.get("FS_THREAD_POOL_SIZE", 16))
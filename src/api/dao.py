@@ -1,12 +1,701 @@
-from .models import File, Folder
-from .schemas import CreateFile, CreateFolder, UpdateFile, UpdateFolder
+import random
 
+from datetime import datetime, timezone
+from typing import AsyncIterator
+
+from sqlalchemy import BigInteger, Integer, String, and_, column, delete, func, literal, or_, select, text, tuple_, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import USAGE_COUNTER_SLOTS
+from .models import Blob, DeletedFile, DeleteJob, File, Folder, FolderStats, UploadChunk, UploadSession, UserUsage
+from .schemas import CreateFile, CreateFolder, CreateFolderDB, CreateUploadSessionDB, UpdateFile, UpdateFolder, UploadChunk as UploadChunkSchema
+
+from ..auth.models import User
 from ..dao import BaseDAO
 
 
 class FileDAO(BaseDAO[File, CreateFile, UpdateFile]):
     model = File
 
+    # Допустимые сортировки листинга; под каждую есть индекс (user_id, folder_id, колонка, id)
+    SORT_KEYS = {
+        "name": File.file_name,
+        "size": File.file_size,
+        "created_at": File.created_at,
+        "updated_at": File.updated_at,
+        "favorite": File.is_favorite,
+    }
+
+    @classmethod
+    async def find_folder_page(
+        cls,
+        db: AsyncSession,
+        user_id: str,
+        folder_id: int | None,
+        sort_key: str,
+        descending: bool,
+        after: tuple | None,
+        limit: int,
+    ) -> list[File]:
+
+        return await cls.find_all_keyset(
+            db,
+            cls.model.user_id == user_id,
+            cls.model.folder_id == folder_id,
+            cls.model.is_deleted.is_(False),
+            order_by=cls.sort_columns(sort_key),
+            after=after,
+            descending=descending,
+            limit=limit,
+        )
+
+    @classmethod
+    def sort_columns(cls, sort_key: str) -> list:
+        return [cls.SORT_KEYS[sort_key], cls.model.id]
+
+    @classmethod
+    def _subtree_filter(cls, user_id: str, folder_id: int | None) -> list:
+        filter = [cls.model.user_id == user_id, cls.model.is_deleted.is_(False)]
+
+        if folder_id is not None:
+            filter.append(cls.model.folder_id.in_(FolderDAO.subtree_ids(user_id, folder_id)))
+
+        return filter
+
+    @classmethod
+    async def find_in_subtree(cls, db: AsyncSession, user_id: str, folder_id: int | None) -> list[File]:
+
+        """ Файлы папки и всех вложенных папок; folder_id=None - все файлы пользователя """
+
+        stmt = select(cls.model).where(*cls._subtree_filter(user_id, folder_id))
+
+        result = await db.execute(stmt.order_by(cls.model.folder_id, cls.model.file_name))
+        return result.scalars().all()
+
+    @classmethod
+    def stream_in_subtree(cls, db: AsyncSession, user_id: str, folder_id: int | None, columns: list) -> AsyncIterator:
+
+        """ То же, что find_in_subtree, но кортежами из columns через серверный курсор """
+
+        return cls.stream(
+            db, *cls._subtree_filter(user_id, folder_id),
+            columns=columns, order_by=[cls.model.folder_id, cls.model.file_name])
+
+    @classmethod
+    async def add_new(cls, db: AsyncSession, files: list[CreateFile]) -> list[File]:
+
+        """ Пакетная вставка; файлы, чей путь уже занят, пропускаются и в результат не попадают """
+
+        return await cls.upsert_many(
+            db, [file.model_dump() for file in files], index_elements=[cls.model.file_path], returning=True)
+
+    @classmethod
+    async def mark_deleted_in_subtree(cls, db: AsyncSession, user_id: str, tree_path: str, old_prefix: str, new_prefix: str) -> int:
+
+        """ Помечает файлы поддерева удаленными и освобождает их пути
+
+        Возвращает число всех файлов поддерева вместе с лежащими в корзине: задача удалит и их.
+        """
+
+        in_subtree = cls.model.folder_id.in_(select(Folder.id).where(FolderDAO.in_subtree(user_id, tree_path)))
+
+        await db.execute(
+            update(cls.model)
+            .where(
+                in_subtree,
+                # Файлы из корзины уже лежат под своим путем, задача удалит их вместе с папкой
+                cls.model.is_deleted.is_(False),
+            )
+            .values(
+                is_deleted=True,
+                file_path=new_prefix + func.substr(cls.model.file_path, len(old_prefix) + 1, type_=String),
+            )
+        )
+
+        result = await db.execute(select(func.count()).select_from(cls.model).where(in_subtree))
+        return result.scalar_one()
+
+    @classmethod
+    async def delete_batch_in_subtree(cls, db: AsyncSession, user_id: str, tree_path: str, limit: int) -> list[tuple[str | None, int]]:
+
+        """ Удаляет до limit файлов поддерева, возвращает их (blob_hash, file_size) """
+
+        batch = (
+            select(cls.model.id)
+            .where(cls.model.folder_id.in_(select(Folder.id).where(FolderDAO.in_subtree(user_id, tree_path))))
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(
+            delete(cls.model).where(cls.model.id.in_(batch)).returning(cls.model.blob_hash, cls.model.file_size))
+        return result.tuples().all()
+
+
+class BlobDAO(BaseDAO[Blob, Blob, Blob]):
+    model = Blob
+
+    @classmethod
+    async def add_reference(cls, db: AsyncSession, blob_hash: str, size: int, count: int = 1) -> int:
+
+        """ Создает blob или увеличивает счетчик ссылок, возвращает новое значение """
+
+        stmt = insert(cls.model).values(hash=blob_hash, size=size, ref_count=count)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.model.hash],
+            set_={"ref_count": cls.model.ref_count + stmt.excluded.ref_count},
+        ).returning(cls.model.ref_count)
+
+        result = await db.execute(stmt)
+        return result.scalar_one()
+
+    @classmethod
+    async def add_references(cls, db: AsyncSession, blobs: dict[str, tuple[int, int]]) -> None:
+
+        """ То же для нескольких blob-ов одним запросом: {hash: (size, count)} """
+
+        # Строки в одном порядке во всех транзакциях, чтобы параллельные вставки не ловили deadlock
+        await cls.upsert_many(
+            db,
+            [{"hash": blob_hash, "size": size, "ref_count": count} for blob_hash, (size, count) in sorted(blobs.items())],
+            index_elements=[cls.model.hash],
+            set_=lambda excluded: {"ref_count": cls.model.ref_count + excluded.ref_count},
+        )
+
+    @classmethod
+    async def release_reference(cls, db: AsyncSession, blob_hash: str, count: int = 1) -> None:
+
+        """ Уменьшает счетчик ссылок; blob без ссылок удалит collect_orphaned """
+
+        await cls.release_references(db, {blob_hash: count})
+
+    @classmethod
+    async def release_references(cls, db: AsyncSession, blobs: dict[str, int]) -> None:
+
+        """ Уменьшает счетчики нескольких blob-ов: {hash: count} """
+
+        if not blobs:
+            return
+
+        hashes = sorted(blobs)
+
+        # Блокируем строки в том же порядке, что и add_references, чтобы не ловить deadlock
+        await db.execute(select(cls.model.hash).where(cls.model.hash.in_(hashes)).order_by(cls.model.hash).with_for_update())
+
+        counts = values(column("hash", String), column("count", Integer), name="released").data(
+            [(blob_hash, blobs[blob_hash]) for blob_hash in hashes])
+        await db.execute(
+            update(cls.model)
+            .where(cls.model.hash == counts.c.hash)
+            .values(ref_count=cls.model.ref_count - counts.c.count)
+        )
+
+    @classmethod
+    async def lock_orphaned(cls, db: AsyncSession, limit: int) -> list[str]:
+
+        """ Блокирует до limit blob-ов без ссылок; занятые другими транзакциями пропускаются """
+
+        result = await db.execute(
+            select(cls.model.hash)
+            .where(cls.model.ref_count <= 0)
+            .order_by(cls.model.hash)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return result.scalars().all()
+
+    @classmethod
+    async def delete_orphaned(cls, db: AsyncSession, hashes: list[str]) -> None:
+        await db.execute(delete(cls.model).where(cls.model.hash.in_(hashes), cls.model.ref_count <= 0))
+
 
 class FolderDAO(BaseDAO[Folder, CreateFolder, UpdateFolder]):
-    model = Folder
\ No newline at end of file
+    model = Folder
+
+    @staticmethod
+    def child_tree_path(parent_tree_path: str | None, folder_id: int) -> str:
+        return f"{parent_tree_path or '/'}{folder_id}/"
+
+    @staticmethod
+    def ancestor_ids(tree_path: str) -> list[int]:
+        return [int(folder_id) for folder_id in tree_path.strip("/").split("/")]
+
+    @classmethod
+    def in_subtree(cls, user_id: str, tree_path):
+
+        """ Условие на папку tree_path и всех ее потомков - диапазон по индексу (user_id, tree_path)
+
+        В пути только цифры и '/', а сравнение в collation "C" побайтовое, поэтому все пути
+        с префиксом p лежат в [p, p || '~').
+        """
+
+        return and_(
+            cls.model.user_id == user_id,
+            cls.model.tree_path >= tree_path,
+            cls.model.tree_path < tree_path + "~",
+        )
+
+    @classmethod
+    def subtree_ids(cls, user_id: str, folder_id: int):
+
+        """ id папки и всех ее потомков одним диапазонным сканом """
+
+        root_path = (
+            select(cls.model.tree_path)
+            .where(cls.model.id == folder_id, cls.model.user_id == user_id)
+            .scalar_subquery()
+        )
+        return select(cls.model.id).where(cls.in_subtree(user_id, root_path))
+
+    @classmethod
+    async def lock_tree(cls, db: AsyncSession, user_id: str, shared: bool = False) -> None:
+
+        """ Блокировка дерева пользователя до конца транзакции
+
+        Исключительную берут операции, меняющие пути и tree_path папок; разделяемую - те, что
+        читают путь папки и пишут по нему файлы: они идут параллельно, но не посреди переноса.
+        """
+
+        lock = func.pg_advisory_xact_lock_shared if shared else func.pg_advisory_xact_lock
+        await db.execute(select(lock(func.hashtext(f"folders:{user_id}"))))
+
+    @classmethod
+    async def add_node(cls, db: AsyncSession, folder: CreateFolderDB, parent_tree_path: str | None) -> Folder:
+
+        """ Вставка с готовым tree_path: id берется из последовательности заранее """
+
+        folder_id = (await db.execute(select(func.nextval(func.pg_get_serial_sequence(cls.model.__tablename__, "id"))))).scalar_one()
+
+        return await cls.add(db, {
+            **folder.model_dump(),
+            "id": folder_id,
+            "tree_path": cls.child_tree_path(parent_tree_path, folder_id),
+        })
+
+    @classmethod
+    async def find_subtree(cls, db: AsyncSession, user_id: str, folder_id: int | None) -> list[Folder]:
+
+        stmt = select(cls.model).where(cls.model.user_id == user_id, cls.model.is_deleted.is_(False))
+
+        if folder_id is not None:
+            stmt = stmt.where(cls.model.id.in_(cls.subtree_ids(user_id, folder_id)))
+
+        result = await db.execute(stmt.order_by(cls.model.id))
+        return result.scalars().all()
+
+    @classmethod
+    async def find_ancestors(cls, db: AsyncSession, user_id: str, folder: Folder) -> list[Folder]:
+
+        """ Путь от корня до папки включительно, одним запросом по первичному ключу """
+
+        result = await db.execute(
+            select(cls.model)
+            .where(cls.model.id.in_(cls.ancestor_ids(folder.tree_path)), cls.model.user_id == user_id)
+            .order_by(func.length(cls.model.tree_path))
+        )
+        return result.scalars().all()
+
+    @classmethod
+    async def find_user_ids(cls, db: AsyncSession, after: str | None, limit: int) -> list[str]:
+
+        """ Владельцы папок по возрастанию id, страница после after
+
+        Идет по первичному ключу users с проверкой по индексу папок: DISTINCT по folders
+        прочитал бы индекс целиком.
+        """
+
+        stmt = (
+            select(User.id)
+            .where(select(cls.model.id).where(cls.model.user_id == User.id).exists())
+            .order_by(User.id)
+            .limit(limit)
+        )
+        if after is not None:
+            stmt = stmt.where(User.id > after)
+
+        result = await db.execute(stmt)
+        return result.scalars().all()
+
+    @classmethod
+    async def find_tree_paths(cls, db: AsyncSession, folder_ids: list[int]) -> dict[int, str]:
+        result = await db.execute(select(cls.model.id, cls.model.tree_path).where(cls.model.id.in_(folder_ids)))
+        return dict(result.all())
+
+    @classmethod
+    async def find_children_with_stats(cls, db: AsyncSession, user_id: str, parent_id: int | None) -> list[tuple[Folder, FolderStats | None]]:
+
+        """ Дочерние папки вместе с размерами: по одной строке folder_stats на папку по первичному ключу """
+
+        result = await db.execute(
+            select(cls.model, FolderStats)
+            .outerjoin(FolderStats, FolderStats.folder_id == cls.model.id)
+            .where(
+                cls.model.parent_folder_id == parent_id,
+                cls.model.user_id == user_id,
+                cls.model.is_deleted.is_(False),
+            )
+        )
+        return result.tuples().all()
+
+    @classmethod
+    async def move_subtree(
+        cls,
+        db: AsyncSession,
+        folder: Folder,
+        parent_id: int | None,
+        tree_path: str,
+        folder_path: str,
+    ) -> None:
+
+        """ Переносит папку со всем поддеревом: по одному UPDATE на папки и файлы, независимо от глубины """
+
+        old_tree_path, old_folder_path = folder.tree_path, folder.folder_path
+
+        await db.execute(
+            update(File)
+            .where(
+                File.folder_id.in_(select(cls.model.id).where(cls.in_subtree(folder.user_id, old_tree_path))),
+                File.is_deleted.is_(False),
+            )
+            .values(file_path=folder_path + func.substr(File.file_path, len(old_folder_path) + 1, type_=String))
+        )
+        await db.execute(
+            update(cls.model)
+            .where(cls.in_subtree(folder.user_id, old_tree_path))
+            .values(
+                tree_path=tree_path + func.substr(cls.model.tree_path, len(old_tree_path) + 1, type_=String),
+                folder_path=folder_path + func.substr(cls.model.folder_path, len(old_folder_path) + 1, type_=String),
+            )
+        )
+        await db.execute(update(cls.model).where(cls.model.id == folder.id).values(parent_folder_id=parent_id))
+
+
+    @classmethod
+    async def mark_subtree_deleted(cls, db: AsyncSession, folder: Folder, new_prefix: str) -> None:
+
+        """ Помечает поддерево удаленным одним UPDATE и переносит пути под new_prefix, освобождая имена """
+
+        await db.execute(
+            update(cls.model)
+            .where(cls.in_subtree(folder.user_id, folder.tree_path))
+            .values(
+                is_deleted=True,
+                folder_path=new_prefix + func.substr(cls.model.folder_path, len(folder.folder_path) + 1, type_=String),
+            )
+        )
+
+    @classmethod
+    async def delete_batch_in_subtree(cls, db: AsyncSession, user_id: str, tree_path: str, limit: int) -> int:
+
+        """ Удаляет до limit папок поддерева, начиная с самых глубоких """
+
+        batch = (
+            select(cls.model.id)
+            .where(cls.in_subtree(user_id, tree_path))
+            .order_by(func.length(cls.model.tree_path).desc())
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(delete(cls.model).where(cls.model.id.in_(batch)).returning(cls.model.id))
+        return len(result.all())
+
+
+class FolderStatsDAO(BaseDAO[FolderStats, FolderStats, FolderStats]):
+    model = FolderStats
+
+    COLUMNS = ("direct_files", "direct_bytes", "total_files", "total_bytes")
+
+    @classmethod
+    async def add_empty(cls, db: AsyncSession, folder_id: int) -> None:
+        await db.execute(insert(cls.model).values(folder_id=folder_id).on_conflict_do_nothing())
+
+    @classmethod
+    async def find_for_update(cls, db: AsyncSession, folder_id: int) -> FolderStats | None:
+        result = await db.execute(select(cls.model).where(cls.model.folder_id == folder_id).with_for_update())
+        return result.scalars().one_or_none()
+
+    @classmethod
+    async def apply(cls, db: AsyncSession, deltas: dict[int, tuple[int, int, int, int]]) -> None:
+
+        """ Прибавляет приращения {folder_id: (direct_files, direct_bytes, total_files, total_bytes)} """
+
+        deltas = {folder_id: delta for folder_id, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return
+
+        folder_ids = sorted(deltas)
+
+        # Предки общие у многих загрузок: блокируем строки в одном порядке, чтобы не ловить deadlock
+        await db.execute(
+            select(cls.model.folder_id).where(cls.model.folder_id.in_(folder_ids))
+            .order_by(cls.model.folder_id).with_for_update()
+        )
+
+        rows = values(
+            column("folder_id", Integer), *[column(name, BigInteger) for name in cls.COLUMNS], name="deltas",
+        ).data([(folder_id, *deltas[folder_id]) for folder_id in folder_ids])
+        await db.execute(
+            update(cls.model)
+            .where(cls.model.folder_id == rows.c.folder_id)
+            .values({name: getattr(cls.model, name) + rows.c[name] for name in cls.COLUMNS})
+        )
+
+    @classmethod
+    async def rebuild(cls, db: AsyncSession, user_id: str) -> int:
+
+        """ Пересчитывает размеры всех папок пользователя с нуля, возвращает число исправленных строк
+
+        Итоги поддерева собираются без рекурсии: файлы каждой папки разносятся по id предков из tree_path.
+        """
+
+        result = await db.execute(text(REBUILD_FOLDER_STATS), {"user_id": user_id})
+        return len(result.all())
+
+
+# Строки, совпадающие с пересчетом, не перезаписываются: RETURNING отдает только расхождения
+REBUILD_FOLDER_STATS = """
+WITH user_folders AS (
+    SELECT id, tree_path FROM folders WHERE user_id = :user_id
+),
+direct AS (
+    SELECT folder_id, count(*) AS files, sum(file_size) AS bytes
+    FROM files
+    WHERE user_id = :user_id AND folder_id IS NOT NULL AND NOT is_deleted
+    GROUP BY folder_id
+),
+total AS (
+    SELECT ancestor.id::integer AS folder_id, sum(direct.files) AS files, sum(direct.bytes) AS bytes
+    FROM direct
+    JOIN user_folders ON user_folders.id = direct.folder_id
+    CROSS JOIN LATERAL unnest(string_to_array(trim(both '/' from user_folders.tree_path), '/')) AS ancestor(id)
+    GROUP BY ancestor.id
+)
+INSERT INTO folder_stats (folder_id, direct_files, direct_bytes, total_files, total_bytes)
+SELECT user_folders.id,
+       coalesce(direct.files, 0), coalesce(direct.bytes, 0),
+       coalesce(total.files, 0), coalesce(total.bytes, 0)
+FROM user_folders
+LEFT JOIN direct ON direct.folder_id = user_folders.id
+LEFT JOIN total ON total.folder_id = user_folders.id
+ON CONFLICT (folder_id) DO UPDATE SET
+    direct_files = excluded.direct_files,
+    direct_bytes = excluded.direct_bytes,
+    total_files = excluded.total_files,
+    total_bytes = excluded.total_bytes
+WHERE (folder_stats.direct_files, folder_stats.direct_bytes, folder_stats.total_files, folder_stats.total_bytes)
+    IS DISTINCT FROM (excluded.direct_files, excluded.direct_bytes, excluded.total_files, excluded.total_bytes)
+RETURNING folder_stats.folder_id
+"""
+
+
+class DeletedFileDAO(BaseDAO[DeletedFile, DeletedFile, DeletedFile]):
+    model = DeletedFile
+
+    @classmethod
+    def expiry(cls):
+        return func.deleted_file_expiry(cls.model.deleted_at, cls.model.expires_at)
+
+    @classmethod
+    async def find_user_page(
+        cls,
+        db: AsyncSession,
+        user_id: str,
+        after: tuple | None,
+        limit: int,
+    ) -> list[tuple[DeletedFile, File]]:
+
+        """ Корзина пользователя от недавно удаленных, keyset по (deleted_at, id) """
+
+        stmt = (
+            select(cls.model, File)
+            .join(File, File.id == cls.model.file_id)
+            .where(cls.model.user_id == user_id)
+        )
+
+        if after is not None:
+            columns = cls.sort_columns()
+            stmt = stmt.where(tuple_(*columns) < tuple_(*(literal(value, column.type) for column, value in zip(columns, after))))
+
+        result = await db.execute(stmt.order_by(cls.model.deleted_at.desc(), cls.model.id.desc()).limit(limit))
+        return result.tuples().all()
+
+    @classmethod
+    def sort_columns(cls) -> list:
+        return [cls.model.deleted_at, cls.model.id]
+
+    @classmethod
+    async def find_for_restore(cls, db: AsyncSession, user_id: str, file_id: str) -> tuple[DeletedFile, File] | None:
+
+        """ Запись корзины с файлом; строка блокируется, чтобы очистка пропустила ее """
+
+        result = await db.execute(
+            select(cls.model, File)
+            .join(File, File.id == cls.model.file_id)
+            .where(cls.model.file_id == file_id, cls.model.user_id == user_id)
+            .with_for_update(of=cls.model)
+        )
+        return result.tuples().first()
+
+    @classmethod
+    async def expire(cls, db: AsyncSession, user_id: str, file_id: str | None = None) -> int:
+
+        """ Отдает файлы корзины очистке прямо сейчас: срок хранения обнуляется """
+
+        stmt = update(cls.model).where(cls.model.user_id == user_id).values(expires_at=0)
+        if file_id is not None:
+            stmt = stmt.where(cls.model.file_id == file_id)
+
+        result = await db.execute(stmt.returning(cls.model.id))
+        return len(result.all())
+
+    @classmethod
+    async def purge_batch(cls, db: AsyncSession, now: datetime, limit: int) -> list[tuple[str, str | None, int]]:
+
+        """ Удаляет до limit истекших файлов; записи корзины уходят каскадом. Возвращает (user_id, blob_hash, file_size) """
+
+        expired = (
+            select(cls.model.file_id)
+            .where(cls.expiry() <= now)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(
+            delete(File).where(File.id.in_(expired)).returning(File.user_id, File.blob_hash, File.file_size))
+        return result.tuples().all()
+
+
+class UserUsageDAO(BaseDAO[UserUsage, UserUsage, UserUsage]):
+    model = UserUsage
+
+    # Ключ pg_try_advisory_xact_lock для сверки счетчиков
+    RECONCILE_LOCK_ID = 0x75737267
+
+    @classmethod
+    async def try_lock_reconcile(cls, db: AsyncSession) -> bool:
+        result = await db.execute(select(func.pg_try_advisory_xact_lock(cls.RECONCILE_LOCK_ID)))
+        return result.scalar_one()
+
+    @classmethod
+    async def add(cls, db: AsyncSession, user_id: str, files: int, size: int) -> None:
+
+        """ Прибавляет к случайному слоту без предварительного SELECT ... FOR UPDATE """
+
+        stmt = insert(cls.model).values(user_id=user_id, slot=random.randrange(USAGE_COUNTER_SLOTS), files=files, bytes=size)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.model.user_id, cls.model.slot],
+            set_={"files": cls.model.files + stmt.excluded.files, "bytes": cls.model.bytes + stmt.excluded.bytes},
+        )
+        await db.execute(stmt)
+
+    @classmethod
+    async def add_for_users(cls, db: AsyncSession, usage: dict[str, tuple[int, int]]) -> None:
+
+        """ То же для нескольких пользователей пакетом: {user_id: (files, size)} """
+
+        await cls.upsert_many(
+            db,
+            [
+                {"user_id": user_id, "slot": random.randrange(USAGE_COUNTER_SLOTS), "files": files, "bytes": size}
+                for user_id, (files, size) in sorted(usage.items())
+            ],
+            index_elements=[cls.model.user_id, cls.model.slot],
+            set_=lambda excluded: {"files": cls.model.files + excluded.files, "bytes": cls.model.bytes + excluded.bytes},
+        )
+
+    @classmethod
+    async def get(cls, db: AsyncSession, user_id: str) -> tuple[int, int]:
+
+        """ (файлов, байт) пользователя - сумма не больше USAGE_COUNTER_SLOTS строк по первичному ключу """
+
+        result = await db.execute(
+            select(func.coalesce(func.sum(cls.model.files), 0), func.coalesce(func.sum(cls.model.bytes), 0))
+            .where(cls.model.user_id == user_id)
+        )
+        return tuple(result.one())
+
+    @classmethod
+    async def reconcile(cls, db: AsyncSession, user_ids: list[str]) -> list[str]:
+
+        """ Сверяет счетчики с файлами и дописывает разницу в слот 0; возвращает пользователей с расхождением
+
+        Подсчет файлов и слотов идет в одном снимке, а файлы и счетчик меняются в одной транзакции,
+        поэтому параллельные загрузки разницу не портят. Две сверки одних пользователей допишут ее дважды:
+        вызывающий держит try_lock_reconcile в той же транзакции.
+        """
+
+        if not user_ids:
+            return []
+
+        result = await db.execute(text(RECONCILE_USER_USAGE), {"user_ids": user_ids})
+        return result.scalars().all()
+
+
+RECONCILE_USER_USAGE = """
+WITH actual AS (
+    SELECT page.user_id, count(files.id) AS files, coalesce(sum(files.file_size), 0) AS bytes
+    FROM unnest(CAST(:user_ids AS varchar[])) AS page(user_id)
+    LEFT JOIN files ON files.user_id = page.user_id
+    GROUP BY page.user_id
+),
+counted AS (
+    SELECT user_id, sum(files) AS files, sum(bytes) AS bytes
+    FROM user_usage
+    WHERE user_id = ANY(:user_ids)
+    GROUP BY user_id
+)
+INSERT INTO user_usage (user_id, slot, files, bytes)
+SELECT actual.user_id, 0, actual.files - coalesce(counted.files, 0), actual.bytes - coalesce(counted.bytes, 0)
+FROM actual LEFT JOIN counted ON counted.user_id = actual.user_id
+WHERE (actual.files, actual.bytes) <> (coalesce(counted.files, 0), coalesce(counted.bytes, 0))
+ON CONFLICT (user_id, slot) DO UPDATE SET
+    files = user_usage.files + excluded.files,
+    bytes = user_usage.bytes + excluded.bytes
+RETURNING user_usage.user_id
+"""
+
+
+class DeleteJobDAO(BaseDAO[DeleteJob, DeleteJob, DeleteJob]):
+    model = DeleteJob
+
+    @classmethod
+    async def claim(cls, db: AsyncSession, now: datetime, stale_before: datetime) -> DeleteJob | None:
+
+        """ Берет ожидающую задачу, у которой прошла пауза после ошибки, или брошенную упавшим воркером;
+        параллельные воркеры ее пропустят """
+
+        stmt = (
+            select(cls.model)
+            .where(or_(
+                and_(cls.model.status == "pending", cls.model.run_after <= now),
+                and_(cls.model.status == "running", cls.model.updated_at < stale_before),
+            ))
+            .order_by(cls.model.updated_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        job = (await db.execute(stmt)).scalars().first()
+
+        if job is not None:
+            job.status = "running"
+            job.updated_at = now
+            await db.flush()
+
+        return job
+
+
+class UploadSessionDAO(BaseDAO[UploadSession, CreateUploadSessionDB, CreateUploadSessionDB]):
+    model = UploadSession
+
+
+class UploadChunkDAO(BaseDAO[UploadChunk, UploadChunkSchema, UploadChunkSchema]):
+    model = UploadChunk
+
+    @classmethod
+    async def add_or_replace(cls, db: AsyncSession, session_id: str, chunk: UploadChunkSchema) -> None:
+        # Повторная отправка того же чанка просто перезаписывает запись
+        stmt = insert(cls.model).values(session_id=session_id, **chunk.model_dump())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.model.session_id, cls.model.chunk_index],
+            set_={"offset": stmt.excluded.offset, "size": stmt.excluded.size, "received_at": stmt.excluded.received_at},
+        )
+        await db.execute(stmt)
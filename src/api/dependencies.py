@@ -0,0 +1,47 @@
+from fastapi import Depends, Request
+from fastapi.exceptions import RequestValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import FormData, UploadFile
+
+from ..auth.dependencies import get_current_user_id
+from ..database import get_async_session
+
+from .service import FileManager
+
+
+async def check_upload_quota(
+        request: Request,
+        user_id: str = Depends(get_current_user_id),
+        db: AsyncSession = Depends(get_async_session),
+) -> None:
+
+    """ Отклоняет загрузку по Content-Length до чтения тела: multipart-параметры FastAPI
+    разбирает до зависимостей, поэтому маршруты с этой проверкой читают форму сами """
+
+    content_length = request.headers.get("content-length", "")
+    if not content_length.isdigit():
+        return
+
+    await FileManager(db).file_crud.check_quota(user_id, int(content_length))
+
+
+def get_form_files(form: FormData, field: str) -> list[UploadFile]:
+    files = [item for item in form.getlist(field) if isinstance(item, UploadFile)]
+
+    if not files:
+        raise RequestValidationError([{"type": "missing", "loc": ("body", field), "msg": "Field required", "input": None}])
+
+    return files
+
+
+def multipart_body(field: str, many: bool = False) -> dict:
+
+    """ Описание тела для OpenAPI у маршрутов, которые разбирают форму сами """
+
+    schema = {"type": "string", "format": "binary"}
+    if many:
+        schema = {"type": "array", "items": schema}
+
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": [field], "properties": {field: schema},
+    }}}}}
@@ -15,4 +15,49 @@ class FolderWasNotFound(HTTPException):
         
 class FileWasNotFound(HTTPException):
     def __init__(self):
-        super().__init__(status_code=404, detail="File was not found")
\ No newline at end of file
+        super().__init__(status_code=404, detail="File was not found")
+
+class UploadSessionWasNotFound(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=404, detail="Upload session was not found")
+
+class InvalidFileName(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=400, detail="File name must have an extension")
+
+class InvalidCursor(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=400, detail="Cursor is invalid or was issued for another sort order")
+
+class InvalidChunk(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=400, detail="Chunk index or size does not match the upload session")
+
+class InvalidChunkSize(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=400, detail="Chunk size is too large")
+
+class UploadSessionIncomplete(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=409, detail="Not all chunks have been uploaded")
+
+class InvalidFolderMove(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=400, detail="Folder cannot be moved into itself or its subfolder")
+
+class DeleteJobWasNotFound(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=404, detail="Delete job was not found")
+
+class QuotaExceeded(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=413, detail="Storage quota exceeded")
+
+class InvalidDownloadSignature(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=403, detail="Download link is invalid or has expired")
+
+
+class TooManyFiles(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=400, detail="Too many files in one request")
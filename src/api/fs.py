@@ -0,0 +1,78 @@
+import asyncio
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+
+from ..metrics import histogram
+from .config import FS_THREAD_POOL_SIZE
+
+
+FS_LATENCY = histogram("fs_operation_seconds", "Latency of filesystem operations", ["op"])
+
+
+def _remove_if_exists(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class AsyncFS:
+
+    """ Асинхронный фасад над файловой системой
+
+    Все вызовы идут в отдельный пул потоков фиксированного размера: медленный диск
+    занимает только его и не отбирает потоки у синхронных зависимостей FastAPI.
+    """
+
+    def __init__(self, max_workers: int):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fs")
+
+    async def _run(self, op: str, func, *args):
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            FS_LATENCY.observe(time.perf_counter() - started, op)
+
+    async def open(self, path: str, mode: str = "rb") -> BinaryIO:
+        return await self._run("open", open, path, mode)
+
+    async def read(self, f: BinaryIO, size: int) -> bytes:
+        return await self._run("read", f.read, size)
+
+    async def write(self, f: BinaryIO, data: bytes) -> int:
+        return await self._run("write", f.write, data)
+
+    async def seek(self, f: BinaryIO, offset: int) -> int:
+        return await self._run("seek", f.seek, offset)
+
+    async def fsync(self, f: BinaryIO) -> None:
+        def flush_and_sync():
+            f.flush()
+            os.fsync(f.fileno())
+
+        await self._run("fsync", flush_and_sync)
+
+    async def close(self, f: BinaryIO) -> None:
+        await self._run("close", f.close)
+
+    async def stat(self, path: str) -> os.stat_result:
+        return await self._run("stat", os.stat, path)
+
+    async def makedirs(self, path: str) -> None:
+        await self._run("makedirs", lambda: os.makedirs(path, exist_ok=True))
+
+    async def replace(self, src: str, dst: str) -> None:
+        await self._run("replace", os.replace, src, dst)
+
+    async def remove(self, path: str) -> None:
+
+        """ Удаляет файл, отсутствие файла не ошибка """
+
+        await self._run("remove", _remove_if_exists, path)
+
+
+fs = AsyncFS(FS_THREAD_POOL_SIZE)
@@ -0,0 +1,86 @@
+""" Перенос содержимого, записанного до storage backend
+
+Запускается один раз после alembic upgrade на базе, поднятой с ревизии до e9a2d7c4f1b8:
+
+    python -m src.api.legacy_import
+
+Blob-ы из старого каталога BLOBS_DIR копируются в backend, а файлы без blob_hash загружаются
+в него и привязываются к blob-ам. Повторный запуск пропускает уже перенесенное.
+Старые файлы не удаляются, их можно стереть вручную после проверки.
+"""
+import argparse
+import asyncio
+import os
+
+from loguru import logger
+
+from ..database import async_session_maker
+from .config import ROOT_DIR, UPLOAD_DIR
+from .dao import BlobDAO, FileDAO
+from .models import Blob, File
+from .service import BlobService
+from .storage import StorageBackend, get_storage
+from .utils import iter_file
+
+
+# Каталог, в который blob-ы писались до появления storage backend
+OLD_BLOBS_DIR = os.environ.get("BLOBS_DIR", os.path.join(ROOT_DIR or "", UPLOAD_DIR or "", ".blobs"))
+
+
+async def move_blobs(storage: StorageBackend, batch_size: int) -> int:
+    moved = 0
+
+    async with async_session_maker() as db:
+        async for blob_hash, in BlobDAO.stream(db, columns=[Blob.hash], fetch_size=batch_size):
+            old_path = os.path.join(OLD_BLOBS_DIR, blob_hash[:2], blob_hash[2:4], blob_hash)
+            blob_key = BlobService.get_blob_key(blob_hash)
+
+            if os.path.exists(old_path) and await storage.stat(blob_key) is None:
+                await storage.put_stream(blob_key, iter_file(old_path))
+                moved += 1
+
+    return moved
+
+
+async def import_files(storage: StorageBackend, batch_size: int) -> int:
+    imported = 0
+
+    # Файлы читаются курсором в своей сессии, ссылки пишутся и коммитятся пачками в другой
+    async with async_session_maker() as reader, async_session_maker() as db:
+        blob_service = BlobService(db, storage)
+        files = FileDAO.iter_batches(
+            reader, File.blob_hash.is_(None), columns=[File.id, File.file_path], fetch_size=batch_size)
+
+        async for batch in files:
+            stored = {}
+            for file_id, file_path in batch:
+                if os.path.exists(file_path):
+                    stored[file_id] = await blob_service.put_temporary(iter_file(file_path))
+
+            if not stored:
+                continue
+
+            await blob_service.store_temporary(list(stored.values()))
+            await FileDAO.update_many(db, [{"id": file_id, "blob_hash": item.sha256} for file_id, item in stored.items()])
+            await db.commit()
+
+            imported += len(stored)
+            logger.info(f"Imported {imported} legacy files")
+
+    return imported
+
+
+async def main(args) -> None:
+    storage = get_storage()
+
+    moved = await move_blobs(storage, args.batch_size)
+    imported = await import_files(storage, args.batch_size)
+
+    logger.info(f"Legacy import finished: {moved} blobs moved, {imported} files imported")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=100)
+
+    asyncio.run(main(parser.parse_args()))
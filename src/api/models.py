@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import TIMESTAMP, ForeignKey, func
+from sqlalchemy import TIMESTAMP, BigInteger, ForeignKey, Index, SmallInteger, String, func, text
 from sqlalchemy.orm import Mapped, mapped_column
 from ..database import Base
 
@@ -12,21 +12,57 @@ class File(Base):
     file_path: Mapped[str] = mapped_column(nullable=False, unique=True)
     file_name: Mapped[str] = mapped_column(nullable=False)
     file_extension: Mapped[str] = mapped_column(nullable=False)
-    file_size: Mapped[int] = mapped_column(nullable=False)
+    file_size: Mapped[int] = mapped_column(BigInteger, nullable=False)
     is_favorite: Mapped[bool] = mapped_column(nullable=False, server_default='False')
     is_deleted: Mapped[bool] = mapped_column(nullable=False, server_default='False')
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
     
-    folder_id: Mapped[int] = mapped_column(ForeignKey('folders.id', ondelete='CASCADE'), nullable=True)
+    folder_id: Mapped[int] = mapped_column(ForeignKey('folders.id', ondelete='CASCADE'), nullable=True, index=True)
+    blob_hash: Mapped[str] = mapped_column(ForeignKey('blobs.hash'), nullable=True, index=True)
+
+    # Индексы под keyset пагинацию листинга папки, по одному на ключ сортировки
+    __table_args__ = tuple(
+        Index(f"ix_files_user_folder_{name}_id", "user_id", "folder_id", column, "id")
+        for name, column in (
+            ("name", "file_name"),
+            ("size", "file_size"),
+            ("created_at", "created_at"),
+            ("updated_at", "updated_at"),
+            ("favorite", "is_favorite"),
+        )
+    )
+
+
+class Blob(Base):
+    __tablename__ = 'blobs'
+
+    hash: Mapped[str] = mapped_column(primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    ref_count: Mapped[int] = mapped_column(nullable=False, server_default='0')
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
+
+    # Blob-ы без ссылок ждут сборщика; частичный индекс содержит только их
+    __table_args__ = (
+        Index("ix_blobs_orphaned", "hash", postgresql_where=text("ref_count <= 0")),
+    )
+
     
 class DeletedFile(Base):
     __tablename__ = 'deleted_files'
     
     id: Mapped[str] = mapped_column(primary_key=True, index=True)
-    file_id: Mapped[str] = mapped_column(ForeignKey('files.id', ondelete='CASCADE'))
+    file_id: Mapped[str] = mapped_column(ForeignKey('files.id', ondelete='CASCADE'), index=True)
+    user_id: Mapped[str] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
     deleted_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
-    expires_at: Mapped[int]
+    # Сколько секунд после deleted_at файл лежит в корзине
+    expires_at: Mapped[int] = mapped_column()
+
+    # Листинг корзины - keyset по (deleted_at, id); очистка ищет истекшие по IMMUTABLE функции из миграции
+    __table_args__ = (
+        Index("ix_deleted_files_user_id_deleted_at_id", "user_id", "deleted_at", "id"),
+        Index("ix_deleted_files_expiry", func.deleted_file_expiry(deleted_at, expires_at)),
+    )
     
 class Folder(Base):
     __tablename__ = 'folders'
@@ -37,4 +73,87 @@ class Folder(Base):
     folder_path: Mapped[str] = mapped_column(nullable=False, unique=True)
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP(True), server_default=func.now()) 
     
-    parent_folder_id: Mapped[int] = mapped_column(ForeignKey('folders.id', ondelete='CASCADE'), nullable=True)
\ No newline at end of file
+    parent_folder_id: Mapped[int] = mapped_column(ForeignKey('folders.id', ondelete='CASCADE'), nullable=True)
+    # Материализованный путь из id предков и самой папки: "/1/5/12/". Поддерево - диапазон
+    # по (user_id, tree_path), сравнение побайтовое благодаря collation "C"
+    tree_path: Mapped[str] = mapped_column(String(collation="C"), nullable=False)
+    # Помечается при рекурсивном удалении; строки удаляет фоновая задача
+    is_deleted: Mapped[bool] = mapped_column(nullable=False, server_default='False')
+
+    # Дочерние папки ищутся по родителю, корневые - частичным индексом без NULL родителей в ключе
+    __table_args__ = (
+        Index("ix_folders_parent_folder_id_user_id", "parent_folder_id", "user_id"),
+        Index("ix_folders_user_id_root", "user_id", postgresql_where=text("parent_folder_id IS NULL")),
+        Index("ix_folders_user_id_tree_path", "user_id", "tree_path"),
+    )
+
+
+# Размер папки: direct_* - файлы самой папки, total_* - всего поддерева. Ведется приращениями
+# в тех же транзакциях, что меняют файлы; verify_folder_stats пересчитывает с нуля
+class FolderStats(Base):
+    __tablename__ = 'folder_stats'
+
+    folder_id: Mapped[int] = mapped_column(ForeignKey('folders.id', ondelete='CASCADE'), primary_key=True)
+    direct_files: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default='0')
+    direct_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default='0')
+    total_files: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default='0')
+    total_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default='0')
+
+
+# Занятое пользователем место, разложенное по нескольким строкам-слотам: параллельные загрузки
+# прибавляют к случайному слоту и не ждут блокировку одной строки. Использование - сумма слотов
+class UserUsage(Base):
+    __tablename__ = 'user_usage'
+
+    user_id: Mapped[str] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    slot: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    files: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default='0')
+    bytes: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default='0')
+
+
+class UploadSession(Base):
+    __tablename__ = 'upload_sessions'
+
+    id: Mapped[str] = mapped_column(primary_key=True, index=True)
+    user_id: Mapped[str] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), index=True)
+    file_name: Mapped[str] = mapped_column(nullable=False)
+    file_extension: Mapped[str] = mapped_column(nullable=False)
+    file_size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    chunk_size: Mapped[int] = mapped_column(nullable=False)
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
+    expires_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False, index=True)
+
+    folder_id: Mapped[int] = mapped_column(ForeignKey('folders.id', ondelete='CASCADE'), nullable=True)
+
+
+class UploadChunk(Base):
+    __tablename__ = 'upload_chunks'
+
+    session_id: Mapped[str] = mapped_column(ForeignKey('upload_sessions.id', ondelete='CASCADE'), primary_key=True)
+    chunk_index: Mapped[int] = mapped_column(primary_key=True)
+    offset: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    size: Mapped[int] = mapped_column(nullable=False)
+    received_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
+
+
+class DeleteJob(Base):
+    __tablename__ = 'delete_jobs'
+
+    id: Mapped[str] = mapped_column(primary_key=True, index=True)
+    user_id: Mapped[str] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), index=True)
+    # Папка удаляется в конце задачи, поэтому без внешнего ключа
+    folder_id: Mapped[int] = mapped_column(nullable=False)
+    tree_path: Mapped[str] = mapped_column(String(collation="C"), nullable=False)
+    status: Mapped[str] = mapped_column(nullable=False, server_default='pending')
+    total_files: Mapped[int] = mapped_column(nullable=False, server_default='0')
+    deleted_files: Mapped[int] = mapped_column(nullable=False, server_default='0')
+    error: Mapped[str] = mapped_column(nullable=True)
+    # Неудачная попытка возвращает задачу в pending: следующая не раньше run_after
+    attempts: Mapped[int] = mapped_column(nullable=False, server_default='0')
+    run_after: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
+    updated_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_delete_jobs_unfinished", "updated_at", postgresql_where=text("status IN ('pending', 'running')")),
+    )
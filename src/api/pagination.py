@@ -0,0 +1,42 @@
+import base64
+import json
+
+from datetime import datetime
+
+from . import exceptions
+
+
+def encode_cursor(sort_key: str, descending: bool, values: tuple) -> str:
+
+    """ Непрозрачный курсор: ключ сортировки, направление и значения последней строки страницы """
+
+    data = {
+        "k": sort_key,
+        "d": descending,
+        "v": [value.isoformat() if isinstance(value, datetime) else value for value in values],
+    }
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, sort_key: str, descending: bool, columns: list) -> tuple:
+
+    """ Значения из курсора, приведенные к типам колонок; курсор от другой сортировки - InvalidCursor """
+
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if data["k"] != sort_key or data["d"] != descending or len(data["v"]) != len(columns):
+            raise ValueError
+
+        values = []
+        for column, value in zip(columns, data["v"]):
+            python_type = column.type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif not isinstance(value, python_type):
+                raise ValueError
+            values.append(value)
+
+    except (ValueError, TypeError, KeyError):
+        raise exceptions.InvalidCursor
+
+    return tuple(values)
@@ -0,0 +1,266 @@
+import os
+
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterator
+from urllib.parse import quote
+from uuid import uuid4
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from .config import ACCEL_REDIRECT_PREFIX, FILE_DELIVERY_MODE, MAX_RANGES, STORAGE_ROOT
+from .fs import fs
+from .storage import StorageBackend
+from .utils import iter_file
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range_header(header: str | None, size: int) -> list[tuple[int, int]] | None:
+
+    """ Разбирает заголовок Range, возвращает отсортированные диапазоны (end включительно) или None """
+
+    if not header or not header.startswith("bytes="):
+        return None
+
+    ranges = []
+    for part in header[len("bytes="):].split(","):
+        start, sep, end = part.strip().partition("-")
+        if not sep:
+            return None
+
+        try:
+            if start:
+                first, last = int(start), int(end) if end else None
+                if last is not None and first > last:
+                    return None
+                if last is None:
+                    last = size - 1
+            else:
+                suffix = int(end)
+                first, last = max(size - suffix, 0), size - 1
+                if suffix == 0:
+                    continue
+        except ValueError:
+            return None
+
+        if first < size:
+            ranges.append((first, min(last, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable
+
+    # Пересекающиеся и соседние диапазоны склеиваем, чтобы не отдавать одни байты дважды
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+
+    return merged
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+
+    """ Слабое сравнение, как требуется для If-None-Match """
+
+    if header.strip() == "*":
+        return True
+
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def _parse_http_date(value: str | None) -> datetime | None:
+    if not value:
+        return None
+
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _not_modified(request: Request, etag: str | None, last_modified: datetime | None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag is not None and _etag_matches(if_none_match, etag)
+
+    if_modified_since = _parse_http_date(request.headers.get("if-modified-since"))
+    if if_modified_since is not None and last_modified is not None:
+        return int(last_modified.timestamp()) <= int(if_modified_since.timestamp())
+
+    return False
+
+
+def _range_allowed(request: Request, etag: str | None, last_modified: datetime | None) -> bool:
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+
+    # If-Range с ETag требует строгого совпадения, с датой - точного совпадения с Last-Modified
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return etag is not None and if_range.strip() == etag
+
+    if_range_date = _parse_http_date(if_range)
+    return (
+        if_range_date is not None and last_modified is not None
+        and int(last_modified.timestamp()) == int(if_range_date.timestamp())
+    )
+
+
+class SendfileResponse(Response):
+
+    """ Отдает участок локального файла через расширение ASGI http.response.zerocopysend
+
+    Сервер, поддерживающий расширение, передает файл через os.sendfile без копирования
+    в память воркера. Если расширения нет, файл читается частями в пуле потоков.
+    """
+
+    def __init__(self, path: str, offset: int, count: int, **kwargs):
+        self.path = path
+        self.offset = offset
+        self.count = count
+        super().__init__(**kwargs)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            f = await fs.open(self.path, "rb")
+            try:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f,
+                    "offset": self.offset,
+                    "count": self.count,
+                    "more_body": False,
+                })
+            finally:
+                await fs.close(f)
+            return
+
+        async for chunk in iter_file(self.path, start=self.offset, end=self.offset + self.count - 1):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _offload_response(local_path: str, delivery_mode: str, media_type: str, headers: dict[str, str]) -> Response:
+
+    """ Пустой ответ, по которому байты отдает reverse proxy (Range он обработает сам) """
+
+    if delivery_mode == "x-accel":
+        location = f"{ACCEL_REDIRECT_PREFIX.rstrip('/')}/{os.path.relpath(local_path, STORAGE_ROOT)}"
+        headers["X-Accel-Redirect"] = quote(location)
+    else:
+        headers["X-Sendfile"] = local_path
+
+    return Response(media_type=media_type, headers=headers)
+
+
+def _body_response(
+    storage: StorageBackend,
+    key: str,
+    local_path: str | None,
+    delivery_mode: str,
+    first: int,
+    last: int | None,
+    **kwargs,
+) -> Response:
+    if local_path is not None and delivery_mode == "sendfile":
+        count = int(kwargs["headers"]["Content-Length"])
+        return SendfileResponse(local_path, first, count, **kwargs)
+
+    return StreamingResponse(storage.open_range(key, first, last), **kwargs)
+
+
+async def _iter_multipart(
+    storage: StorageBackend,
+    key: str,
+    ranges: list[tuple[int, int]],
+    part_headers: list[bytes],
+    closing: bytes,
+) -> AsyncIterator[bytes]:
+    for (first, last), headers in zip(ranges, part_headers):
+        yield headers
+        async for chunk in storage.open_range(key, first, last):
+            yield chunk
+        yield b"\r\n"
+
+    yield closing
+
+
+def build_file_response(
+    request: Request,
+    storage: StorageBackend,
+    key: str,
+    size: int,
+    media_type: str,
+    etag: str | None = None,
+    last_modified: datetime | None = None,
+    cache_control: str | None = None,
+    delivery_mode: str = FILE_DELIVERY_MODE,
+) -> Response:
+
+    """ Ответ с файлом из storage с поддержкой Range, ETag и условных запросов """
+
+    headers = {"Accept-Ranges": "bytes"}
+    if etag is not None:
+        headers["ETag"] = etag
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified.timestamp(), usegmt=True)
+    if cache_control is not None:
+        headers["Cache-Control"] = cache_control
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    # Для S3 локального пути нет, такие файлы всегда отдает воркер
+    local_path = storage.local_path(key) if delivery_mode != "stream" else None
+
+    if local_path is not None and delivery_mode in ("x-accel", "x-sendfile"):
+        return _offload_response(local_path, delivery_mode, media_type, headers)
+
+    ranges = None
+    if _range_allowed(request, etag, last_modified):
+        try:
+            ranges = parse_range_header(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    # Слишком много диапазонов дешевле отдать одним ответом целиком
+    if ranges is not None and len(ranges) > MAX_RANGES:
+        ranges = None
+
+    if ranges is None:
+        headers["Content-Length"] = str(size)
+        return _body_response(
+            storage, key, local_path, delivery_mode, 0, None, media_type=media_type, headers=headers)
+
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+        headers["Content-Length"] = str(last - first + 1)
+        return _body_response(
+            storage, key, local_path, delivery_mode, first, last, status_code=206, media_type=media_type, headers=headers)
+
+    boundary = uuid4().hex
+    part_headers = [
+        f"--{boundary}\r\nContent-Type: {media_type}\r\nContent-Range: bytes {first}-{last}/{size}\r\n\r\n".encode()
+        for first, last in ranges
+    ]
+    closing = f"--{boundary}--\r\n".encode()
+
+    headers["Content-Length"] = str(
+        sum(len(part) + last - first + 1 + 2 for part, (first, last) in zip(part_headers, ranges)) + len(closing))
+
+    return StreamingResponse(
+        _iter_multipart(storage, key, ranges, part_headers, closing),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers,
+    )
@@ -1,121 +1,441 @@
-from fastapi import APIRouter, Depends, UploadFile, File
+import mimetypes
+
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
-from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..auth.dependencies import get_current_user_id
 from ..database import get_async_session
 
-from .service import FileManager
-from . import schemas
+from .archive import iter_zip
+from .config import GET_FILE_CACHE_CONTROL
+from .dependencies import check_upload_quota, get_form_files, multipart_body
+from .responses import build_file_response
+from .service import BlobService, FileManager, PathService
+from .signing import verify_download
+from .storage import get_storage
+from . import exceptions, schemas
 
 router = APIRouter()
 
 
-@router.post("/upload_file")
+@router.post("/upload_file", dependencies=[Depends(check_upload_quota)], openapi_extra=multipart_body("file"))
 async def upload_file(
-    token: str,
+    request: Request,
     folder_id: int = None,
-    file: UploadFile = File(...),
+    user_id: str = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_async_session)
     ):
     
     file_manager = FileManager(db)
     file_crud = file_manager.file_crud
-    
-    return await file_crud.upload_file(token=token, file=file, folder_id=folder_id)
+
+    async with request.form() as form:
+        file = get_form_files(form, "file")[0]
+        return await file_crud.upload_file(user_id=user_id, file=file, folder_id=folder_id)
+
+@router.post(
+    "/upload_files",
+    response_model=schemas.BatchUploadResult,
+    dependencies=[Depends(check_upload_quota)],
+    openapi_extra=multipart_body("files", many=True),
+)
+async def upload_files(
+    request: Request,
+    folder_id: int = None,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    file_crud = file_manager.file_crud
+
+    async with request.form() as form:
+        files = get_form_files(form, "files")
+        return await file_crud.upload_files(user_id=user_id, files=files, folder_id=folder_id)
+
+
+@router.get("/get_usage", response_model=schemas.StorageUsage)
+async def get_usage(
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    file_crud = file_manager.file_crud
+
+    return await file_crud.get_usage(user_id)
+
 
 @router.post("/create_folder")
 async def create_folder(
-    token: str,
     folder_data: schemas.CreateFolder,
+    user_id: str = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_async_session)
 ):
     
     file_manager = FileManager(db)
     folder_crud = file_manager.folder_crud
     
-    return await folder_crud.create_folder(folder=folder_data, token=token)
+    return await folder_crud.create_folder(folder=folder_data, user_id=user_id)
 
 
 @router.get("/get_file/{file_id}")
 async def get_file(
     file_id: str,
-    token: str,
+    request: Request,
+    user_id: str = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_async_session)
 ):
     
     file_manager = FileManager(db)
     file_crud = file_manager.file_crud
     
-    target_file = await file_crud.get_file(token=token, file_id=file_id)
-    
-    return FileResponse(target_file)
+    target_file = await file_crud.get_file(user_id=user_id, file_id=file_id)
+    media_type, _ = mimetypes.guess_type(f"{target_file.file_name}.{target_file.file_extension}")
+
+    return build_file_response(
+        request,
+        file_manager.storage,
+        PathService.get_file_key(target_file),
+        size=target_file.file_size,
+        media_type=media_type or "application/octet-stream",
+        etag=f'"{target_file.blob_hash}"',
+        last_modified=target_file.updated_at,
+        cache_control=GET_FILE_CACHE_CONTROL,
+    )
+
+
+@router.get("/get_file_link/{file_id}", response_model=schemas.DownloadLink)
+async def get_file_link(
+    file_id: str,
+    request: Request,
+    expires_in: int = Query(None, gt=0),
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    file_crud = file_manager.file_crud
+
+    params = await file_crud.get_download_params(user_id=user_id, file_id=file_id, expires_in=expires_in)
+    url = request.url_for("download_file", file_id=file_id).include_query_params(**params)
+
+    return schemas.DownloadLink(url=str(url), expires_at=datetime.fromtimestamp(params["expires"], timezone.utc))
+
+
+@router.get("/download/{file_id}")
+async def download_file(
+    file_id: str,
+    key: str,
+    name: str,
+    expires: int,
+    signature: str,
+    request: Request,
+):
+
+    # Ссылка самодостаточна: подпись проверяется в памяти, БД не нужна
+    if not verify_download(file_id, key, name, expires, signature):
+        raise exceptions.InvalidDownloadSignature
+
+    storage = get_storage()
+    stat = await storage.stat(key)
+    if stat is None:
+        raise exceptions.FileWasNotFound
 
+    media_type, _ = mimetypes.guess_type(name)
+    max_age = max(expires - int(datetime.now(timezone.utc).timestamp()), 0)
 
-@router.get("/get_folders")
+    # Содержимое адресуется хешем и не меняется, поэтому кэш может хранить ответ до истечения ссылки
+    return build_file_response(
+        request,
+        storage,
+        key,
+        size=stat.size,
+        media_type=media_type or "application/octet-stream",
+        etag=f'"{BlobService.get_blob_hash(key)}"',
+        cache_control=f"public, max-age={max_age}, immutable",
+    )
+
+
+@router.get("/get_folders", response_model=list[schemas.FolderListItem])
 async def get_folders(
-    token: str, 
     folder_id: int = None, 
+    user_id: str = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_async_session)
 ):
     
     folder_manager = FileManager(db)
     folder_crud = folder_manager.folder_crud
     
-    target_folder = await folder_crud.get_folders(token=token, folder_id=folder_id)
+    target_folder = await folder_crud.get_folders(user_id=user_id, folder_id=folder_id)
     
     return target_folder
 
 
+@router.get("/get_folder_stats", response_model=schemas.FolderListItem)
+async def get_folder_stats(
+    folder_id: int,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    folder_crud = file_manager.folder_crud
+
+    return await folder_crud.get_folder_stats(user_id, folder_id)
+
+
+@router.get("/get_folder_ancestors")
+async def get_folder_ancestors(
+    folder_id: int,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    folder_crud = file_manager.folder_crud
+
+    return await folder_crud.get_folder_ancestors(user_id, folder_id)
+
+
+@router.patch("/move_folder")
+async def move_folder(
+    folder_id: int,
+    parent_folder_id: int = None,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    folder_crud = file_manager.folder_crud
+
+    return await folder_crud.move_folder(user_id, folder_id, parent_folder_id)
+
+
+@router.get("/download_folder")
+async def download_folder(
+    folder_id: int = None,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    folder_crud = file_manager.folder_crud
+
+    archive_name, entries = await folder_crud.get_archive_entries(user_id=user_id, folder_id=folder_id)
+
+    # Архив может отдаваться долго, соединение с БД ему больше не нужно
+    await file_manager.commit()
+
+    return StreamingResponse(
+        iter_zip(file_manager.storage, entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(archive_name)}"},
+    )
+
+
 @router.get("/get_folder_files")
 async def get_folder_files(
-    token: str,
+    response: Response,
     folder_id: int = None,
-    order_by: str = None,
-    limit: int = 10,
-    offset: int = 0,
+    order_by: schemas.FileSortKey = schemas.FileSortKey.created_at,
+    descending: bool = True,
+    limit: int = Query(10, gt=0, le=1000),
+    cursor: str = None,
+    user_id: str = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_async_session)
 ):
-        
+
+    """ Страница файлов папки; курсор следующей страницы - в заголовке X-Next-Cursor """
+
     file_manager = FileManager(db)
     file_crud = file_manager.file_crud
-    
-    return await file_crud.get_folder_files(token=token, folder_id=folder_id, limit=limit, offset=offset, order_by=order_by)
+
+    files, next_cursor = await file_crud.get_folder_files(
+        user_id=user_id, folder_id=folder_id, limit=limit,
+        sort_key=order_by.value, descending=descending, cursor=cursor)
+
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return files
 
 @router.patch("/switch_favorite_file")
 async def switch_favorite_file(
-    token: str,
     file_id: str,
+    user_id: str = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_async_session)
 ):
     
     file_manager = FileManager(db)
     file_crud = file_manager.file_crud
     
-    return await file_crud.switch_favorite_file(token=token, file_id=file_id)
+    return await file_crud.switch_favorite_file(user_id=user_id, file_id=file_id)
     
     
 @router.delete("/delete_file")
 async def delete_file(
-    token: str,
     file_id: str,
+    permanent: bool = False,
+    user_id: str = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_async_session)
 ):
+
+    """ Файл уходит в корзину; permanent=true удаляет его сразу """
     
     file_manager = FileManager(db)
     file_crud = file_manager.file_crud
     
-    return await file_crud.delete_file(token, file_id)
+    return await file_crud.delete_file(user_id, file_id, permanent)
+
+
+@router.get("/get_trash", response_model=list[schemas.TrashItem])
+async def get_trash(
+    response: Response,
+    limit: int = Query(50, gt=0, le=1000),
+    cursor: str = None,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    """ Страница корзины; курсор следующей страницы - в заголовке X-Next-Cursor """
+
+    file_manager = FileManager(db)
+    trash_crud = file_manager.trash_crud
+
+    items, next_cursor = await trash_crud.get_trash(user_id, limit, cursor)
+
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return items
 
 
-@router.delete("/delete_folder")
+@router.post("/restore_file")
+async def restore_file(
+    file_id: str,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    trash_crud = file_manager.trash_crud
+
+    return await trash_crud.restore_file(user_id, file_id)
+
+
+@router.delete("/empty_trash")
+async def empty_trash(
+    file_id: str = None,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    """ Всю корзину или один file_id - в очистку, без ожидания срока хранения """
+
+    file_manager = FileManager(db)
+    trash_crud = file_manager.trash_crud
+
+    return {"expired": await trash_crud.empty_trash(user_id, file_id)}
+
+
+@router.delete("/delete_folder", response_model=schemas.DeleteJobStatus, status_code=202)
 async def delete_folder(
-    token: str, 
     folder_id: int, 
+    user_id: str = Depends(get_current_user_id),
     db: AsyncSession = Depends(get_async_session)
 ):
-    
+
+    """ Папка со всем содержимым сразу пропадает из листингов; ход удаления - в /delete_jobs/{job_id} """
+
     file_manager = FileManager(db)
     folder_crud = file_manager.folder_crud
 
-    return await folder_crud.delete_folder(token, folder_id)
\ No newline at end of file
+    return await folder_crud.delete_folder(user_id, folder_id)
+
+
+@router.get("/delete_jobs/{job_id}", response_model=schemas.DeleteJobStatus)
+async def get_delete_job(
+    job_id: str,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    delete_job_crud = file_manager.delete_job_crud
+
+    return await delete_job_crud.get_job(user_id, job_id)
+
+
+@router.post("/create_upload_session", response_model=schemas.UploadSessionStatus)
+async def create_upload_session(
+    session_data: schemas.CreateUploadSession,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    upload_session_crud = file_manager.upload_session_crud
+
+    return await upload_session_crud.create_session(user_id=user_id, session=session_data)
+
+
+@router.put("/upload_chunk/{session_id}/{chunk_index}", response_model=schemas.UploadChunk)
+async def upload_chunk(
+    session_id: str,
+    chunk_index: int,
+    request: Request,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    upload_session_crud = file_manager.upload_session_crud
+
+    return await upload_session_crud.upload_chunk(
+        user_id=user_id, session_id=session_id, chunk_index=chunk_index, chunks=request.stream())
+
+
+@router.get("/get_upload_session/{session_id}", response_model=schemas.UploadSessionStatus)
+async def get_upload_session(
+    session_id: str,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    upload_session_crud = file_manager.upload_session_crud
+
+    return await upload_session_crud.get_session(user_id=user_id, session_id=session_id)
+
+
+@router.post("/finalize_upload_session/{session_id}")
+async def finalize_upload_session(
+    session_id: str,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    upload_session_crud = file_manager.upload_session_crud
+
+    return await upload_session_crud.finalize_session(user_id=user_id, session_id=session_id)
+
+
+@router.delete("/delete_upload_session/{session_id}")
+async def delete_upload_session(
+    session_id: str,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncSession = Depends(get_async_session)
+):
+
+    file_manager = FileManager(db)
+    upload_session_crud = file_manager.upload_session_crud
+
+    return await upload_session_crud.delete_session(user_id=user_id, session_id=session_id)
+
@@ -1,4 +1,7 @@
-from pydantic import BaseModel
+from datetime import datetime
+from enum import Enum
+
+from pydantic import BaseModel, Field
 
 
 class FileBase(BaseModel):
@@ -8,6 +11,7 @@ class FileBase(BaseModel):
     file_size: int
     user_id: str
     folder_id: int | None = None
+    blob_hash: str | None = None
 
 
 class CreateFile(FileBase):
@@ -19,6 +23,14 @@ class UpdateFile(FileBase):
     file_extension: str | None = None 
 
 
+class FileSortKey(str, Enum):
+    name = "name"
+    size = "size"
+    created_at = "created_at"
+    updated_at = "updated_at"
+    favorite = "favorite"
+
+
 class FolderBase(BaseModel):
     folder_name: str | None = None
     parent_folder_id: int | None = None
@@ -31,4 +43,108 @@ class CreateFolderDB(CreateFolder):
     folder_path: str
     
 class UpdateFolder(BaseModel):
-    pass
\ No newline at end of file
+    pass
+
+
+class FolderListItem(BaseModel):
+    id: int
+    user_id: str
+    folder_name: str
+    folder_path: str
+    parent_folder_id: int | None = None
+    tree_path: str
+    is_deleted: bool
+    created_at: datetime
+    direct_files: int = 0
+    direct_bytes: int = 0
+    total_files: int = 0
+    total_bytes: int = 0
+
+
+class CreateUploadSession(BaseModel):
+    file_name: str
+    file_size: int = Field(ge=0)
+    chunk_size: int = Field(gt=0)
+    folder_id: int | None = None
+
+
+class CreateUploadSessionDB(BaseModel):
+    id: str
+    user_id: str
+    file_name: str
+    file_extension: str
+    file_size: int
+    chunk_size: int
+    expires_at: datetime
+    folder_id: int | None = None
+
+
+class UploadChunk(BaseModel):
+    chunk_index: int
+    offset: int
+    size: int
+
+    class Config:
+        from_attributes = True
+
+
+class UploadSessionStatus(BaseModel):
+    id: str
+    file_name: str
+    file_extension: str
+    file_size: int
+    chunk_size: int
+    chunk_count: int
+    folder_id: int | None = None
+    expires_at: datetime
+    received: list[UploadChunk]
+    missing: list[int]
+
+
+
+class DeleteJobStatus(BaseModel):
+    id: str
+    folder_id: int
+    status: str
+    total_files: int
+    deleted_files: int
+    error: str | None = None
+    attempts: int = 0
+    run_after: datetime | None = None
+    created_at: datetime
+    updated_at: datetime
+
+
+class DownloadLink(BaseModel):
+    url: str
+    expires_at: datetime
+
+
+class BatchUploadItem(BaseModel):
+    file_name: str
+    file_id: str | None = None
+    file_size: int | None = None
+    blob_hash: str | None = None
+    error: str | None = None
+
+
+class BatchUploadResult(BaseModel):
+    uploaded: int
+    failed: int
+    files: list[BatchUploadItem]
+
+
+class StorageUsage(BaseModel):
+    files: int
+    bytes: int
+    quota: int | None = None
+
+
+class TrashItem(BaseModel):
+    file_id: str
+    file_name: str
+    file_extension: str
+    file_size: int
+    folder_id: int | None = None
+    deleted_at: datetime
+    expires_at: datetime
@@ -1,25 +1,55 @@
+import asyncio
 import os
 
+from collections import Counter, defaultdict
+from uuid import uuid4
+
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+
 from loguru import logger
 
 from fastapi import UploadFile
-from sqlalchemy import and_
+from sqlalchemy import and_, exists
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .models import File, Folder
+from .archive import ArchiveEntry
+from .models import DeletedFile, DeleteJob, File, Folder, FolderStats, UploadChunk, UploadSession
 
 from . import schemas, exceptions
-from .dao import FileDAO, FolderDAO
-from .config import ROOT_DIR, UPLOAD_DIR
+from .dao import BlobDAO, DeletedFileDAO, DeleteJobDAO, FileDAO, FolderDAO, FolderStatsDAO, UploadChunkDAO, UploadSessionDAO, UserUsageDAO
+from .config import (
+    ROOT_DIR,
+    UPLOAD_DIR,
+    UPLOAD_SESSION_TTL_SECONDS,
+    UPLOAD_SESSION_MAX_CHUNK_SIZE,
+    UPLOAD_SESSION_GC_BATCH_SIZE,
+    UPLOAD_BATCH_MAX_FILES,
+    DELETE_JOB_BATCH_SIZE,
+    DELETE_JOB_CONCURRENCY,
+    DELETE_JOB_RETRY_BASE_SECONDS,
+    DELETE_JOB_RETRY_MAX_SECONDS,
+    DELETE_JOB_STALE_SECONDS,
+    UPLOAD_BATCH_CONCURRENCY,
+    DOWNLOAD_URL_TTL_SECONDS,
+    DOWNLOAD_URL_MAX_TTL_SECONDS,
+    STORAGE_QUOTA_BYTES,
+    TRASH_PURGE_BATCH_SIZE,
+    TRASH_RETENTION_SECONDS,
+)
+from .pagination import decode_cursor, encode_cursor
+from .signing import sign_download
+from .storage import ObjectStat, StorageBackend, get_storage
+from .utils import iter_upload_file
 
-from ..auth.service import DatabaseManager
 from ..utils import get_unique_id
 
 
 class PathService:
 
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, storage: StorageBackend):
         self.db = db
+        self.storage = storage
         self.root_path = f"{ROOT_DIR}{UPLOAD_DIR}"
 
     async def get_folder_path(self, parent_folder_id: int, user_id: str) -> str:
@@ -27,54 +57,255 @@ class PathService:
         if parent_folder_id is None:
             return os.path.join(self.root_path, user_id)
 
-        parent_folder = await FolderDAO.find_one_or_none(self.db, and_(
-            Folder.id == parent_folder_id, Folder.user_id == user_id))
+        parent_folder = await self.get_folder(parent_folder_id, user_id)
+
+        return parent_folder.folder_path
+
+    async def get_folder(self, folder_id: int, user_id: str) -> Folder:
 
-        if not parent_folder:
+        folder = await FolderDAO.find_one_or_none(self.db, and_(
+            Folder.id == folder_id, Folder.user_id == user_id, Folder.is_deleted.is_(False)))
+
+        if not folder:
             raise exceptions.FolderWasNotFound
 
-        return parent_folder.folder_path
+        return folder
     
-    async def get_file_path(self, file_id: int, user_id: str) -> str:
-        
+    async def get_file(self, file_id: str, user_id: str) -> File:
+
         file = await FileDAO.find_one_or_none(self.db, and_(
-            File.id == file_id, File.user_id == user_id))
-        
+            File.id == file_id, File.user_id == user_id, File.is_deleted.is_(False)))
+
         if not file:
             raise exceptions.FileWasNotFound
-        
-        return file.file_path
-    
+
+        return file
+
+    async def get_file_path(self, file_id: str, user_id: str) -> str | None:
+
+        """ Путь к содержимому файла на локальном диске, если backend его предоставляет """
+
+        file = await self.get_file(file_id, user_id)
+
+        return self.storage.local_path(self.get_file_key(file))
+
+    @staticmethod
+    def get_file_key(file: File) -> str:
+
+        if file.blob_hash is None:
+            raise exceptions.FileWasNotFound
+
+        return BlobService.get_blob_key(file.blob_hash)
+
+    @staticmethod
+    def split_file_name(file_name: str) -> tuple[str, str]:
+        try:
+            name, extension = file_name.split('.')
+        except ValueError:
+            raise exceptions.InvalidFileName
+
+        return name, extension
+
+
+class BlobService:
+
+    """ Контентно-адресуемое хранилище: одинаковые байты хранятся один раз """
+
+    def __init__(self, db: AsyncSession, storage: StorageBackend):
+        self.db = db
+        self.storage = storage
+
+    async def put_temporary(self, chunks: AsyncIterator[bytes]) -> ObjectStat:
+
+        """ Пишет байты во временный объект, БД не трогает - можно вызывать параллельно """
+
+        return await self.storage.put_stream(f"tmp/{uuid4().hex}", chunks)
+
+    async def store_temporary(self, stored: list[ObjectStat]) -> None:
+
+        """ Добавляет ссылки на blob-ы одним запросом и переносит недостающие объекты из временных """
+
+        blobs = {}
+        for item in stored:
+            size, count = blobs.get(item.sha256, (item.size, 0))
+            blobs[item.sha256] = (size, count + 1)
+
+        try:
+            await BlobDAO.add_references(self.db, blobs)
+
+            sources = {}
+            for item in stored:
+                sources.setdefault(item.sha256, item.key)
+
+            await self._gather(*[self._promote(blob_hash, tmp_key) for blob_hash, tmp_key in sources.items()])
+
+        finally:
+            await self._gather(*[self.storage.delete(item.key) for item in stored])
+
+    async def discard_temporary(self, stored: list[ObjectStat]) -> None:
+        await self._gather(*[self.storage.delete(item.key) for item in stored])
+
+    async def _promote(self, blob_hash: str, tmp_key: str) -> None:
+        blob_key = self.get_blob_key(blob_hash)
+
+        # Объект мог остаться от транзакции, которая откатилась, поэтому проверяем хранилище
+        if await self.storage.stat(blob_key) is not None:
+            logger.info(f"Blob {blob_hash} already stored")
+        else:
+            await self.storage.move(tmp_key, blob_key)
+
     @staticmethod
-    async def ensure_upload_folder_exists(user_id: str) -> None:
-        upload_folder = os.path.join(ROOT_DIR, UPLOAD_DIR)
-        user_folder = os.path.join(upload_folder, user_id)
+    async def _gather(*aws) -> None:
+
+        # Дожидаемся всех операций, прежде чем пробрасывать первую ошибку
+        for result in await asyncio.gather(*aws, return_exceptions=True):
+            if isinstance(result, BaseException):
+                raise result
+
+    async def release_many(self, blobs: dict[str, int]) -> None:
+
+        """ То же для пачки: {hash: count} """
+
+        await BlobDAO.release_references(self.db, blobs)
+
+    async def release(self, blob_hash: str) -> None:
+
+        # Объект не трогаем: транзакция еще может откатиться и вернуть ссылку.
+        # Blob без ссылок удалит collect_orphaned после коммита
+        await BlobDAO.release_reference(self.db, blob_hash)
+
+    async def collect_orphaned(self, limit: int) -> int:
+
+        """ Удаляет пачку blob-ов без ссылок вместе с объектами, возвращает их число
+
+        Строки заблокированы до коммита: загрузка тех же байтов дождется его, не найдет объект
+        в хранилище и запишет его заново. Если коммит не пройдет, строки без ссылок
+        останутся и будут удалены следующим запуском.
+        """
+
+        orphaned = await BlobDAO.lock_orphaned(self.db, limit)
+        if not orphaned:
+            return 0
+
+        semaphore = asyncio.Semaphore(DELETE_JOB_CONCURRENCY)
+
+        async def delete(blob_hash: str) -> None:
+            async with semaphore:
+                await self.storage.delete(self.get_blob_key(blob_hash))
+
+        await self._gather(*(delete(blob_hash) for blob_hash in orphaned))
+        await BlobDAO.delete_orphaned(self.db, orphaned)
+        await self.db.commit()
+
+        logger.info(f"Removed {len(orphaned)} blobs without references")
+
+        return len(orphaned)
+
+    @staticmethod
+    def get_blob_key(blob_hash: str) -> str:
+        return f"blobs/{blob_hash}"
+
+    @staticmethod
+    def get_blob_hash(key: str) -> str:
+        return key.removeprefix("blobs/")
+
+
+class FolderStatsService:
+
+    """ Приращения размеров папок: папке файла - direct и total, ее предкам - только total
+
+    Вызывается в транзакции, которая меняет файлы, поэтому размеры коммитятся вместе с ними.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def add_files(self, files: list[File], sign: int = 1) -> None:
+
+        direct = defaultdict(lambda: [0, 0])
+        for file in files:
+            if file.folder_id is not None:
+                direct[file.folder_id][0] += sign
+                direct[file.folder_id][1] += sign * file.file_size
+
+        if not direct:
+            return
+
+        tree_paths = await FolderDAO.find_tree_paths(self.db, list(direct))
+
+        deltas = defaultdict(lambda: [0, 0, 0, 0])
+        for folder_id, (files_count, size) in direct.items():
+            deltas[folder_id][0] += files_count
+            deltas[folder_id][1] += size
+
+            for ancestor_id in FolderDAO.ancestor_ids(tree_paths[folder_id]):
+                deltas[ancestor_id][2] += files_count
+                deltas[ancestor_id][3] += size
+
+        await FolderStatsDAO.apply(self.db, deltas)
+
+    async def remove_files(self, files: list[File]) -> None:
+        await self.add_files(files, sign=-1)
+
+    async def move_subtree(self, folder: Folder, old_tree_path: str, new_tree_path: str) -> None:
+
+        """ Итоги поддерева уходят от старых предков к новым; общие предки не меняются
+
+        Вызывается под исключительной блокировкой дерева, поэтому файлы поддерева не меняются до коммита;
+        строка папки блокируется, чтобы итоги читались уже после всех закоммиченных приращений.
+        """
+
+        stats = await FolderStatsDAO.find_for_update(self.db, folder.id)
+        if stats is None:
+            return
+
+        deltas = defaultdict(lambda: [0, 0, 0, 0])
+        for ancestor_id in FolderDAO.ancestor_ids(old_tree_path)[:-1]:
+            deltas[ancestor_id][2] -= stats.total_files
+            deltas[ancestor_id][3] -= stats.total_bytes
+
+        for ancestor_id in FolderDAO.ancestor_ids(new_tree_path)[:-1]:
+            deltas[ancestor_id][2] += stats.total_files
+            deltas[ancestor_id][3] += stats.total_bytes
 
-        for folder in [upload_folder, user_folder]:
-            if not os.path.exists(folder):
-                os.makedirs(folder)
+        await FolderStatsDAO.apply(self.db, deltas)
+
+    async def remove_subtree(self, folder: Folder) -> None:
+
+        """ Удаляемое поддерево вычитается из предков сразу; строки самих папок уйдут вместе с ними """
+
+        await self.move_subtree(folder, folder.tree_path, FolderDAO.child_tree_path(None, folder.id))
 
 
 class FileCRUD:
 
-    def __init__(self, db: AsyncSession, path_service: PathService):
+    def __init__(self, db: AsyncSession, path_service: PathService, blob_service: BlobService, folder_stats: FolderStatsService):
         self.db = db
         self.path_service = path_service
+        self.blob_service = blob_service
+        self.folder_stats = folder_stats
 
-    async def upload_file(self, token: str, file: UploadFile, folder_id: int) -> File:
+    async def upload_file(self, user_id: str, file: UploadFile, folder_id: int) -> File:
 
         try:
-            user_id = await self._get_user_id_from_token(token)
-            await self.path_service.ensure_upload_folder_exists(user_id)
-            
-            folder_path = await self.path_service.get_folder_path(folder_id, user_id)
+            # Папка проверяется до записи байтов, а путь к ней берется уже под блокировкой дерева
+            await self.path_service.get_folder_path(folder_id, user_id)
             file_name, file_extension = file.filename.split('.')
+
+            stored = await self.blob_service.put_temporary(iter_upload_file(file))
+            await self._check_stored_quota(user_id, [stored])
+
+            folder_path = await self._lock_folder_path(user_id, folder_id, [stored])
             file_path = os.path.join(folder_path, f"{file_name}.{file_extension}")
 
             logger.info(f"User {user_id} creates file: {file.filename} into {file_path}")
 
-            await self._create_file(file, file_path)
-            db_file = await self._upload_file(file_name, file_extension, file_path, user_id, folder_id, file.size)
+            await self.blob_service.store_temporary([stored])
+
+            blob_hash, file_size = stored.sha256, stored.size
+            logger.info(f"File {file_path} stored: {file_size} bytes, sha256 {blob_hash}")
+
+            db_file = await self._upload_file(file_name, file_extension, file_path, user_id, folder_id, file_size, blob_hash)
 
             return db_file
 
@@ -82,7 +313,98 @@ class FileCRUD:
             logger.opt(exception=e).critical("Error in upload_file")
             raise e
 
-    async def _upload_file(self, file_name, file_extension, file_path, user_id, folder_id, file_size) -> File:
+    async def upload_files(self, user_id: str, files: list[UploadFile], folder_id: int) -> schemas.BatchUploadResult:
+
+        """ Пакетная загрузка: пользователь и папка определяются один раз,
+        байты пишутся параллельно, строки вставляются одним запросом и одним коммитом """
+
+        if len(files) > UPLOAD_BATCH_MAX_FILES:
+            raise exceptions.TooManyFiles
+
+        await self.path_service.get_folder_path(folder_id, user_id)
+
+        logger.info(f"User {user_id} uploads {len(files)} files into folder {folder_id}")
+
+        results = [schemas.BatchUploadItem(file_name=file.filename or "") for file in files]
+        semaphore = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+
+        async def put(file: UploadFile) -> ObjectStat:
+            async with semaphore:
+                return await self.blob_service.put_temporary(iter_upload_file(file))
+
+        names, pending = set(), []
+        for index, file in enumerate(files):
+            try:
+                file_name, file_extension = self.path_service.split_file_name(file.filename or "")
+            except exceptions.InvalidFileName as e:
+                results[index].error = e.detail
+                continue
+
+            name = f"{file_name}.{file_extension}"
+            if name in names:
+                results[index].error = exceptions.FileAlreadyExists().detail
+                continue
+
+            names.add(name)
+            pending.append((index, file_name, file_extension, name))
+
+        stored = await asyncio.gather(*[put(files[index]) for index, *_ in pending], return_exceptions=True)
+
+        received, temporary = [], []
+        for (index, file_name, file_extension, name), item in zip(pending, stored):
+            if isinstance(item, Exception):
+                logger.opt(exception=item).error(f"Error in upload_files: {name}")
+                results[index].error = "File was not stored"
+                continue
+
+            temporary.append(item)
+            received.append((index, file_name, file_extension, name, item))
+
+        await self._check_stored_quota(user_id, temporary)
+
+        folder_path = await self._lock_folder_path(user_id, folder_id, temporary)
+
+        db_files = []
+        for index, file_name, file_extension, name, item in received:
+            db_files.append((index, schemas.CreateFile(
+                id=await get_unique_id(),
+                file_name=file_name,
+                file_extension=file_extension,
+                file_path=os.path.join(folder_path, name),
+                file_size=item.size,
+                user_id=user_id,
+                folder_id=folder_id,
+                blob_hash=item.sha256,
+            )))
+
+        try:
+            await self.blob_service.store_temporary(temporary)
+            inserted = {db_file.file_path: db_file for db_file in await FileDAO.add_new(self.db, [file for _, file in db_files])}
+
+            for index, file in db_files:
+                db_file = inserted.get(file.file_path)
+                if db_file is None:
+                    # Путь уже занят: ссылку на blob, добавленную выше, возвращаем
+                    await self.blob_service.release(file.blob_hash)
+                    results[index].error = exceptions.FileAlreadyExists().detail
+                    continue
+
+                results[index].file_id = db_file.id
+                results[index].file_size = db_file.file_size
+                results[index].blob_hash = db_file.blob_hash
+
+            await self.folder_stats.add_files(list(inserted.values()))
+            await UserUsageDAO.add(self.db, user_id, len(inserted), sum(db_file.file_size for db_file in inserted.values()))
+            await self.db.commit()
+
+        except Exception as e:
+            logger.opt(exception=e).critical("Error in upload_files")
+            raise
+
+        uploaded = sum(item.error is None for item in results)
+        return schemas.BatchUploadResult(uploaded=uploaded, failed=len(results) - uploaded, files=results)
+
+    async def _upload_file(self, file_name, file_extension, file_path, user_id, folder_id, file_size, blob_hash=None) -> File:
         db_file = await FileDAO.add(
             self.db,
             schemas.CreateFile(
@@ -92,79 +414,167 @@ class FileCRUD:
                 file_path=file_path,
                 file_size=file_size,
                 user_id=user_id,
-                folder_id=folder_id
+                folder_id=folder_id,
+                blob_hash=blob_hash
             )
         )
+        await self.folder_stats.add_files([db_file])
+        await UserUsageDAO.add(self.db, user_id, 1, file_size)
         await self.db.commit()
         return db_file
 
-    async def get_file(self, token: str, file_id: str) -> str:
+    async def get_usage(self, user_id: str) -> schemas.StorageUsage:
+        files, size = await UserUsageDAO.get(self.db, user_id)
+        return schemas.StorageUsage(files=files, bytes=size, quota=STORAGE_QUOTA_BYTES or None)
+
+    async def check_quota(self, user_id: str, size: int) -> None:
+
+        """ Квота проверяется по счетчику без блокировок, поэтому параллельные загрузки
+        могут превысить ее не больше чем на свой размер """
+
+        if not STORAGE_QUOTA_BYTES:
+            return
+
+        _, used = await UserUsageDAO.get(self.db, user_id)
+        if used + size > STORAGE_QUOTA_BYTES:
+            raise exceptions.QuotaExceeded
+
+    async def _check_stored_quota(self, user_id: str, stored: list[ObjectStat]) -> None:
+
+        # Без Content-Length размер известен только после записи: лишние байты удаляем сразу
+        try:
+            await self.check_quota(user_id, sum(item.size for item in stored))
+        except exceptions.QuotaExceeded:
+            await self.blob_service.discard_temporary(stored)
+            raise
+
+    async def _lock_folder_path(self, user_id: str, folder_id: int | None, stored: list[ObjectStat]) -> str:
 
-        user_id = await self._get_user_id_from_token(token)
+        """ Путь папки под разделяемой блокировкой дерева: перенос папки дождется коммита файлов
+
+        Байты к этому моменту уже записаны, поэтому блокировка не держится, пока идет загрузка.
+        """
+
+        try:
+            await FolderDAO.lock_tree(self.db, user_id, shared=True)
+            return await self.path_service.get_folder_path(folder_id, user_id)
+        except Exception:
+            await self.blob_service.discard_temporary(stored)
+            raise
+
+    async def get_file(self, user_id: str, file_id: str) -> File:
 
         logger.info(f"User {user_id} gets file {file_id}")
 
         try:
-            target_file = await self.path_service.get_file_path(file_id, user_id)
+            target_file = await self.path_service.get_file(file_id, user_id)
             return target_file
 
         except Exception as e:
             logger.opt(exception=e).critical("Error in get_file")
             raise
 
-    async def get_folder_files(self, token: str, folder_id: str, limit: int, offset: int, order_by: str) -> list[File]:
+    async def get_download_params(self, user_id: str, file_id: str, expires_in: int | None = None) -> dict:
 
-        user_id = await self._get_user_id_from_token(token)
+        """ Параметры подписанной ссылки, по которой файл отдается без токена и без обращения к БД """
 
-        target_files = await FileDAO.find_all_ordered(self.db, and_(
-            File.user_id == user_id,
-            File.folder_id == folder_id),
-            limit=limit, offset=offset,
-            order_by=order_by
-        )
-        
-        return target_files
+        target_file = await self.get_file(user_id=user_id, file_id=file_id)
+
+        expires_in = min(expires_in or DOWNLOAD_URL_TTL_SECONDS, DOWNLOAD_URL_MAX_TTL_SECONDS)
+        expires = int(datetime.now(timezone.utc).timestamp()) + expires_in
+
+        key = self.path_service.get_file_key(target_file)
+        name = f"{target_file.file_name}.{target_file.file_extension}"
+
+        return {
+            "key": key,
+            "name": name,
+            "expires": expires,
+            "signature": sign_download(target_file.id, key, name, expires),
+        }
+
+    async def get_folder_files(
+        self,
+        user_id: str,
+        folder_id: int | None,
+        limit: int,
+        sort_key: str,
+        descending: bool,
+        cursor: str | None = None,
+    ) -> tuple[list[File], str | None]:
+
+        """ Страница файлов папки и курсор следующей страницы (None, если это последняя) """
 
-    async def delete_file(self, token: str, file_id: str) -> str:
+        columns = FileDAO.sort_columns(sort_key)
+        after = decode_cursor(cursor, sort_key, descending, columns) if cursor else None
+
+        # Лишняя строка показывает, есть ли следующая страница
+        files = await FileDAO.find_folder_page(
+            self.db, user_id, folder_id, sort_key, descending, after, limit + 1)
+
+        if len(files) <= limit:
+            return files, None
+
+        files = files[:limit]
+        last = files[-1]
+        next_cursor = encode_cursor(sort_key, descending, tuple(getattr(last, column.key) for column in columns))
+
+        return files, next_cursor
+
+    async def delete_file(self, user_id: str, file_id: str, permanent: bool = False) -> dict:
+
+        """ По умолчанию файл уходит в корзину: флаг и запись DeletedFile, байты не трогаются """
 
         try:
-            file_path = await self.path_service.get_file_path(file_id)           
-            user_id = await self._get_user_id_from_token(token)
-            logger.info(f"User {user_id} deletes file by file_path: {file_path}")
+            # Размеры предков берутся из tree_path папки: перенос или удаление папки не должны пройти посередине
+            await FolderDAO.lock_tree(self.db, user_id, shared=True)
 
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                await self._delete_file_db(user_id, file_path)    
-                return {"Message": f"File {file_path} was deleted by user {user_id} successfully"}
+            file = await self.path_service.get_file(file_id, user_id)
 
-            return {"Message": f"File {file_id} does not exist"}        
+            if permanent:
+                logger.info(f"User {user_id} deletes file by file_path: {file.file_path}")
+                await self._delete_file_db(user_id, file)
+                return {"Message": f"File {file.file_path} was deleted by user {user_id} successfully"}
+
+            logger.info(f"User {user_id} moves file to trash: {file.file_path}")
+            await self._trash_file_db(user_id, file)
+            return {"Message": f"File {file.file_path} was moved to trash by user {user_id} successfully"}
 
         except Exception as e:
             logger.opt(exception=e).critical("Error in delete_file")
             raise
         
-    async def _delete_file_db(self, user_id: str, file_path: str) -> None:
+    async def _delete_file_db(self, user_id: str, file: File) -> None:
         
-        await FileDAO.delete(self.db, and_(user_id == File.user_id, file_path == File.file_path))
-        await self.db.commit()
+        await FileDAO.delete(self.db, and_(user_id == File.user_id, file.id == File.id))
+        await self.folder_stats.remove_files([file])
+        await UserUsageDAO.add(self.db, user_id, -1, -file.file_size)
 
-    async def _get_user_id_from_token(self, token: str):
+        if file.blob_hash is not None:
+            await self.blob_service.release(file.blob_hash)
 
-        db_manager = DatabaseManager(self.db)
-        token_service = db_manager.token_crud
+        await self.db.commit()
 
-        user_id = await token_service.get_access_token_payload(token)
-        return user_id
+    async def _trash_file_db(self, user_id: str, file: File) -> None:
 
-    @staticmethod
-    async def _create_file(file: UploadFile, file_path: str) -> None:
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        deleted_id = await get_unique_id()
 
+        # Путь освобождается сразу; при восстановлении он собирается заново из папки и имени
+        await FileDAO.update(self.db, File.id == file.id, obj_in={
+            "is_deleted": True,
+            "file_path": os.path.join(self.path_service.root_path, ".trash", deleted_id),
+        })
+        await DeletedFileDAO.add(self.db, {
+            "id": deleted_id,
+            "file_id": file.id,
+            "user_id": user_id,
+            "expires_at": TRASH_RETENTION_SECONDS,
+        })
+        await self.folder_stats.remove_files([file])
 
-    async def switch_favorite_file(self, file_id: int, token: str):
-        user_id = await self._get_user_id_from_token(token)
+        await self.db.commit()
+
+    async def switch_favorite_file(self, file_id: int, user_id: str):
         
         file = await FileDAO.find_one_or_none(self.db, and_(
             File.user_id==user_id,
@@ -182,15 +592,18 @@ class FileCRUD:
 
 class FolderCRUD:
 
-    def __init__(self, db: AsyncSession, path_service: PathService):
+    def __init__(self, db: AsyncSession, path_service: PathService, folder_stats: FolderStatsService):
         self.db = db
         self.path_service = path_service
+        self.folder_stats = folder_stats
 
-    async def create_folder(self, folder: schemas.CreateFolder, token: str):
+    async def create_folder(self, folder: schemas.CreateFolder, user_id: str):
 
         try:
 
-            user_id = await self._get_user_id_from_token(token)
+            # Путь родителя читается под блокировкой, иначе параллельный перенос оставит папке старый путь
+            await FolderDAO.lock_tree(self.db, user_id)
+
             folder_path = await self._create_folder(folder.folder_name, user_id, folder.parent_folder_id)
 
             db_folder = await self._create_folder_db(folder, user_id, folder_path)
@@ -204,70 +617,573 @@ class FolderCRUD:
 
     async def _create_folder(self,folder_name: str, user_id: str, parent_folder_id: int = None):
 
-        await self.path_service.ensure_upload_folder_exists(user_id)
         parent_folder_path = await self.path_service.get_folder_path(parent_folder_id, user_id)
         folder_path = os.path.join(parent_folder_path, folder_name)
 
-        # Создаем папку, если она не существует
-        os.makedirs(folder_path, exist_ok=False)
+        # Папки существуют только в базе, содержимое файлов лежит в storage
+        if await FolderDAO.find_one_or_none(self.db, Folder.folder_path == folder_path):
+            raise exceptions.FolderAlreadyExists
 
         return folder_path
 
     async def _create_folder_db(self, folder: schemas.CreateFolder, user_id: str, folder_path: str):
-        
-        db_folder = await FolderDAO.add(
+
+        parent_tree_path = None
+        if folder.parent_folder_id is not None:
+            parent_tree_path = (await self.path_service.get_folder(folder.parent_folder_id, user_id)).tree_path
+
+        db_folder = await FolderDAO.add_node(
                 self.db,
                 schemas.CreateFolderDB(
                     user_id=user_id,
                     folder_path=folder_path,
                     **folder.model_dump()
-                )
+                ),
+                parent_tree_path,
             )
+        await FolderStatsDAO.add_empty(self.db, db_folder.id)
         await self.db.commit()      
         return db_folder
 
-    async def get_folders(self, folder_id: int | None, token: str) -> list[Folder]:
+    async def move_folder(self, user_id: str, folder_id: int, parent_folder_id: int | None) -> Folder:
 
-        user_id = await self._get_user_id_from_token(token)
-        
-        folder = await FolderDAO.find_all(
-            self.db, Folder.parent_folder_id == folder_id,
-            Folder.user_id==user_id
-        )
+        """ Переносит папку со всем содержимым в parent_folder_id (None - в корень) """
+
+        # Перемещения одного пользователя выполняются по очереди, иначе два встречных переноса дадут цикл
+        await FolderDAO.lock_tree(self.db, user_id)
+
+        folder = await self.path_service.get_folder(folder_id, user_id)
+
+        parent_tree_path = None
+        if parent_folder_id is not None:
+            parent_tree_path = (await self.path_service.get_folder(parent_folder_id, user_id)).tree_path
+
+            if parent_tree_path.startswith(folder.tree_path):
+                raise exceptions.InvalidFolderMove
 
+        folder_path = os.path.join(await self.path_service.get_folder_path(parent_folder_id, user_id), folder.folder_name)
+        if folder_path != folder.folder_path and await FolderDAO.find_one_or_none(self.db, Folder.folder_path == folder_path):
+            raise exceptions.FolderAlreadyExists
+
+        tree_path = FolderDAO.child_tree_path(parent_tree_path, folder.id)
+        await self.folder_stats.move_subtree(folder, folder.tree_path, tree_path)
+        await FolderDAO.move_subtree(self.db, folder, parent_folder_id, tree_path, folder_path)
+        await self.db.commit()
+
+        logger.info(f"User {user_id} moved folder {folder_id} into {parent_folder_id}")
+
+        await self.db.refresh(folder)
         return folder
 
-    async def _get_user_id_from_token(self, token: str) -> str:
+    async def get_folder_ancestors(self, user_id: str, folder_id: int) -> list[Folder]:
 
-        db_manager = DatabaseManager(self.db)
-        token_service = db_manager.token_crud
+        """ Хлебные крошки: папки от корня до folder_id """
 
-        user_id = await token_service.get_access_token_payload(token)
-        return user_id
-    
-    async def delete_folder(self, token: str, folder_id: int) -> str:
-        
-        user_id = await self._get_user_id_from_token(token)      
-        folder_path = await self.path_service.get_folder_path(folder_id, user_id)
-        
-        if os.path.exists(folder_path):
-            os.remove(folder_path)
-            await self._delete_folder_db(folder_id, user_id)
-            return {"Message":f"Folder {folder_id} was deleted by user {user_id} successfully"}  
-        
-        return {"Message": f"folder {folder_id} does not exist"}           
+        folder = await self.path_service.get_folder(folder_id, user_id)
+
+        return await FolderDAO.find_ancestors(self.db, user_id, folder)
+
+    async def get_folders(self, folder_id: int | None, user_id: str) -> list[schemas.FolderListItem]:
+
+        folders = await FolderDAO.find_children_with_stats(self.db, user_id, folder_id)
 
-    async def _delete_folder_db(self, folder_id, user_id):
-         
-        await FolderDAO.delete(self.db, and_(Folder.id == folder_id, Folder.user_id == user_id))
+        return [self._list_item(folder, stats) for folder, stats in folders]
+
+    async def get_folder_stats(self, user_id: str, folder_id: int) -> schemas.FolderListItem:
+
+        folder = await self.path_service.get_folder(folder_id, user_id)
+        stats = await FolderStatsDAO.find_one_or_none(self.db, FolderStats.folder_id == folder.id)
+
+        return self._list_item(folder, stats)
+
+    async def rebuild_stats(self, user_id: str) -> int:
+
+        """ Пересчитывает размеры папок пользователя с нуля; возвращает число расходившихся строк """
+
+        # Под блокировкой дерева переносы и удаления папок не сдвинут tree_path посреди пересчета
+        await FolderDAO.lock_tree(self.db, user_id)
+        fixed = await FolderStatsDAO.rebuild(self.db, user_id)
+        await self.db.commit()
+
+        if fixed:
+            logger.warning(f"Folder stats of user {user_id} drifted: {fixed} rows rebuilt")
+
+        return fixed
+
+    @staticmethod
+    def _list_item(folder: Folder, stats: FolderStats | None) -> schemas.FolderListItem:
+        sizes = {name: getattr(stats, name) for name in FolderStatsDAO.COLUMNS} if stats is not None else {}
+        return schemas.FolderListItem.model_validate({
+            **{column.key: getattr(folder, column.key) for column in Folder.__table__.columns},
+            **sizes,
+        })
+
+    async def get_archive_entries(self, user_id: str, folder_id: int | None) -> tuple[str, list[ArchiveEntry]]:
+
+        """ Имя архива и его записи: все вложенные папки и файлы с путями относительно folder_id """
+
+        folders = {folder.id: folder for folder in await FolderDAO.find_subtree(self.db, user_id, folder_id)}
+        if folder_id is not None and folder_id not in folders:
+            raise exceptions.FolderWasNotFound
+
+        paths = {folder_id: ""}
+
+        def get_path(target_id: int) -> str:
+            if target_id not in paths:
+                folder = folders[target_id]
+                paths[target_id] = f"{get_path(folder.parent_folder_id)}{self._archive_name(folder.folder_name)}/"
+            return paths[target_id]
+
+        entries = [
+            ArchiveEntry(name=get_path(folder.id), modified_at=folder.created_at)
+            for folder in folders.values() if folder.id != folder_id
+        ]
+        entries.sort(key=lambda entry: entry.name)
+
+        # Для архива хватает нескольких колонок: кортежи с курсора вместо ORM объектов всего поддерева
+        files = FileDAO.stream_in_subtree(self.db, user_id, folder_id, columns=[
+            File.folder_id, File.file_name, File.file_extension, File.file_size, File.updated_at, File.blob_hash,
+        ])
+        file_count = 0
+
+        async for file in files:
+            if file.blob_hash is None:
+                continue
+
+            file_count += 1
+            entries.append(ArchiveEntry(
+                name=get_path(file.folder_id) + self._archive_name(f"{file.file_name}.{file.file_extension}"),
+                key=self.path_service.get_file_key(file),
+                size=file.file_size,
+                modified_at=file.updated_at,
+            ))
+
+        archive_name = folders[folder_id].folder_name if folder_id is not None else "files"
+        logger.info(f"User {user_id} downloads folder {folder_id}: {file_count} files")
+
+        return f"{archive_name}.zip", entries
+
+    @staticmethod
+    def _archive_name(name: str) -> str:
+        # Имена из базы не должны выводить распаковку за пределы каталога
+        name = name.replace("/", "_").replace("\\", "_")
+        return "_" if name in ("", ".", "..") else name
+
+    async def delete_folder(self, user_id: str, folder_id: int) -> DeleteJob:
+
+        """ Рекурсивное удаление: поддерево сразу скрывается, строки и blob-ы удаляет фоновая задача """
+
+        await FolderDAO.lock_tree(self.db, user_id)
+
+        folder = await self.path_service.get_folder(folder_id, user_id)
+        job_id = await get_unique_id()
+
+        # Пути удаляемых папок и файлов уводим под отдельный префикс, чтобы имена сразу освободились
+        deleted_prefix = os.path.join(self.path_service.root_path, ".deleted", job_id)
+
+        await self.folder_stats.remove_subtree(folder)
+        total_files = await FileDAO.mark_deleted_in_subtree(
+            self.db, user_id, folder.tree_path, folder.folder_path, deleted_prefix)
+        await FolderDAO.mark_subtree_deleted(self.db, folder, deleted_prefix)
+
+        job = await DeleteJobDAO.add(self.db, {
+            "id": job_id,
+            "user_id": user_id,
+            "folder_id": folder.id,
+            "tree_path": folder.tree_path,
+            "total_files": total_files,
+        })
+        await self.db.commit()
+
+        logger.info(f"User {user_id} deletes folder {folder_id} with {total_files} files, job {job_id}")
+
+        return job
+
+
+class TrashCRUD:
+
+    def __init__(self, db: AsyncSession, path_service: PathService, blob_service: BlobService, folder_stats: FolderStatsService):
+        self.db = db
+        self.path_service = path_service
+        self.blob_service = blob_service
+        self.folder_stats = folder_stats
+
+    async def get_trash(self, user_id: str, limit: int, cursor: str | None = None) -> tuple[list[schemas.TrashItem], str | None]:
+
+        """ Страница корзины от недавно удаленных и курсор следующей страницы """
+
+        columns = DeletedFileDAO.sort_columns()
+        after = decode_cursor(cursor, "deleted_at", True, columns) if cursor else None
+
+        rows = await DeletedFileDAO.find_user_page(self.db, user_id, after, limit + 1)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1][0]
+            next_cursor = encode_cursor("deleted_at", True, tuple(getattr(last, column.key) for column in columns))
+
+        items = [
+            schemas.TrashItem(
+                file_id=file.id,
+                file_name=file.file_name,
+                file_extension=file.file_extension,
+                file_size=file.file_size,
+                folder_id=file.folder_id,
+                deleted_at=deleted.deleted_at,
+                expires_at=deleted.deleted_at + timedelta(seconds=deleted.expires_at),
+            )
+            for deleted, file in rows
+        ]
+        return items, next_cursor
+
+    async def restore_file(self, user_id: str, file_id: str) -> File:
+
+        """ Возвращает файл в его папку под прежним именем """
+
+        await FolderDAO.lock_tree(self.db, user_id, shared=True)
+
+        row = await DeletedFileDAO.find_for_restore(self.db, user_id, file_id)
+        if row is None:
+            raise exceptions.FileWasNotFound
+
+        deleted, file = row
+
+        # Папку могли удалить, пока файл лежал в корзине - тогда он уйдет вместе с ней
+        folder_path = await self.path_service.get_folder_path(file.folder_id, user_id)
+        file_path = os.path.join(folder_path, f"{file.file_name}.{file.file_extension}")
+
+        if await FileDAO.find_one_or_none(self.db, File.file_path == file_path):
+            raise exceptions.FileAlreadyExists
+
+        restored = await FileDAO.update(self.db, File.id == file.id, obj_in={"is_deleted": False, "file_path": file_path})
+        await DeletedFileDAO.delete(self.db, DeletedFile.id == deleted.id)
+        await self.folder_stats.add_files([restored])
+        await self.db.commit()
+
+        logger.info(f"User {user_id} restored file {file_id} into {file_path}")
+
+        return restored
+
+    async def empty_trash(self, user_id: str, file_id: str | None = None) -> int:
+
+        """ Отдает корзину (или один файл из нее) очистке; байты удалит фоновая задача """
+
+        expired = await DeletedFileDAO.expire(self.db, user_id, file_id)
+        await self.db.commit()
+
+        if file_id is not None and not expired:
+            raise exceptions.FileWasNotFound
+
+        logger.info(f"User {user_id} empties trash: {expired} files")
+
+        return expired
+
+    async def purge_expired(self, limit: int = TRASH_PURGE_BATCH_SIZE) -> int:
+
+        """ Удаляет пачку истекших файлов корзины вместе с blob-ами, на которые не осталось ссылок """
+
+        purged = await DeletedFileDAO.purge_batch(self.db, datetime.now(timezone.utc), limit)
+        if not purged:
+            return 0
+
+        await self.blob_service.release_many(Counter(blob_hash for _, blob_hash, _ in purged if blob_hash is not None))
+
+        usage = defaultdict(lambda: [0, 0])
+        for user_id, _, file_size in purged:
+            usage[user_id][0] += 1
+            usage[user_id][1] += file_size
+
+        await UserUsageDAO.add_for_users(self.db, {user_id: (-files, -size) for user_id, (files, size) in usage.items()})
+
+        await self.db.commit()
+
+        return len(purged)
+
+
+class DeleteJobCRUD:
+
+    def __init__(self, db: AsyncSession, blob_service: BlobService):
+        self.db = db
+        self.blob_service = blob_service
+
+    async def get_job(self, user_id: str, job_id: str) -> DeleteJob:
+
+        job = await DeleteJobDAO.find_one_or_none(self.db, and_(DeleteJob.id == job_id, DeleteJob.user_id == user_id))
+
+        if not job:
+            raise exceptions.DeleteJobWasNotFound
+
+        return job
+
+    async def run_next_job(self, batch_size: int = DELETE_JOB_BATCH_SIZE) -> bool:
+
+        """ Выполняет одну задачу удаления до конца; False, если задач нет """
+
+        now = datetime.now(timezone.utc)
+        job = await DeleteJobDAO.claim(self.db, now, now - timedelta(seconds=DELETE_JOB_STALE_SECONDS))
+        await self.db.commit()
+
+        if job is None:
+            return False
+
+        try:
+            # Сначала файлы, чтобы освободить blob-ы, затем папки от листьев к корню
+            while await self._delete_files_batch(job, batch_size):
+                pass
+
+            while await FolderDAO.delete_batch_in_subtree(self.db, job.user_id, job.tree_path, batch_size):
+                await self._save_progress(job)
+
+            job.status = "done"
+            job.error = None
+            await self._save_progress(job)
+            logger.info(f"Delete job {job.id} finished: {job.deleted_files} files")
+
+        except Exception as e:
+            logger.opt(exception=e).error(f"Error in delete job {job.id}")
+            await self.db.rollback()
+            await self.db.refresh(job)
+
+            # Поддерево уже скрыто и занимает квоту, поэтому задача не бросается, а повторяется с паузой;
+            # сделанные пачки закоммичены, повтор продолжит с оставшихся строк
+            job.attempts += 1
+            delay = min(DELETE_JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1), DELETE_JOB_RETRY_MAX_SECONDS)
+
+            job.status = "pending"
+            job.error = str(e)
+            job.run_after = datetime.now(timezone.utc) + timedelta(seconds=delay)
+            await self._save_progress(job)
+
+        return True
+
+    async def _delete_files_batch(self, job: DeleteJob, batch_size: int) -> int:
+
+        deleted = await FileDAO.delete_batch_in_subtree(self.db, job.user_id, job.tree_path, batch_size)
+        if not deleted:
+            return 0
+
+        await self.blob_service.release_many(Counter(blob_hash for blob_hash, _ in deleted if blob_hash is not None))
+        await UserUsageDAO.add(self.db, job.user_id, -len(deleted), -sum(file_size for _, file_size in deleted))
+
+        job.deleted_files += len(deleted)
+        await self._save_progress(job)
+
+        return len(deleted)
+
+    async def _save_progress(self, job: DeleteJob) -> None:
+        job.updated_at = datetime.now(timezone.utc)
+        await self.db.commit()
+
+
+class UploadSessionCRUD:
+
+    def __init__(self, db: AsyncSession, path_service: PathService, file_crud: FileCRUD, storage: StorageBackend):
+        self.db = db
+        self.path_service = path_service
+        self.file_crud = file_crud
+        self.storage = storage
+
+    async def create_session(self, user_id: str, session: schemas.CreateUploadSession) -> schemas.UploadSessionStatus:
+
+        if session.chunk_size > UPLOAD_SESSION_MAX_CHUNK_SIZE:
+            raise exceptions.InvalidChunkSize
+
+        file_name, file_extension = self.path_service.split_file_name(session.file_name)
+
+        # Проверяем, что папка существует и принадлежит пользователю
+        await self.path_service.get_folder_path(session.folder_id, user_id)
+        # Размер объявлен заранее, поэтому сверх квоты не примем ни одного чанка
+        await self.file_crud.check_quota(user_id, session.file_size)
+
+        db_session = await UploadSessionDAO.add(
+            self.db,
+            schemas.CreateUploadSessionDB(
+                id=await get_unique_id(),
+                user_id=user_id,
+                file_name=file_name,
+                file_extension=file_extension,
+                file_size=session.file_size,
+                chunk_size=session.chunk_size,
+                folder_id=session.folder_id,
+                expires_at=datetime.now(timezone.utc) + timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS)
+            )
+        )
+        await self.db.commit()
+
+        logger.info(f"User {user_id} opens upload session {db_session.id} for {session.file_name}")
+
+        return self._build_status(db_session, [])
+
+    async def upload_chunk(self, user_id: str, session_id: str, chunk_index: int, chunks: AsyncIterator[bytes]) -> schemas.UploadChunk:
+
+        session = await self._get_session(session_id, user_id)
+
+        if not 0 <= chunk_index < self._chunk_count(session):
+            raise exceptions.InvalidChunk
+
+        offset = chunk_index * session.chunk_size
+        expected_size = min(session.chunk_size, session.file_size - offset)
+
+        chunk_key = self._get_chunk_key(session.id, chunk_index)
+        stored = await self.storage.put_stream(chunk_key, self._limit_stream(chunks, expected_size))
+
+        if stored.size != expected_size:
+            await self.storage.delete(chunk_key)
+            raise exceptions.InvalidChunk
+
+        chunk = schemas.UploadChunk(chunk_index=chunk_index, offset=offset, size=stored.size)
+        await UploadChunkDAO.add_or_replace(self.db, session.id, chunk)
+        await self.db.commit()
+
+        return chunk
+
+    async def get_session(self, user_id: str, session_id: str) -> schemas.UploadSessionStatus:
+
+        session = await self._get_session(session_id, user_id)
+        chunks = await UploadChunkDAO.find_all(self.db, UploadChunk.session_id == session.id)
+
+        return self._build_status(session, chunks)
+
+    async def finalize_session(self, user_id: str, session_id: str) -> File:
+
+        session = await self._get_session(session_id, user_id)
+        chunks = await UploadChunkDAO.find_all(self.db, UploadChunk.session_id == session.id)
+
+        if len(chunks) != self._chunk_count(session):
+            raise exceptions.UploadSessionIncomplete
+
+        folder_path = await self.path_service.get_folder_path(session.folder_id, user_id)
+        file_path = os.path.join(folder_path, f"{session.file_name}.{session.file_extension}")
+
+        if await FileDAO.find_one_or_none(self.db, File.file_path == file_path):
+            raise exceptions.FileAlreadyExists
+
+        await self.file_crud.check_quota(user_id, session.file_size)
+
+        logger.info(f"User {user_id} finalizes upload session {session.id} into {file_path}")
+
+        blob_service = self.file_crud.blob_service
+        stored = await blob_service.put_temporary(self._iter_chunks(session))
+
+        # Папку могли перенести, пока собирался файл: путь берется заново под блокировкой дерева
+        folder_path = await self.file_crud._lock_folder_path(user_id, session.folder_id, [stored])
+        file_path = os.path.join(folder_path, f"{session.file_name}.{session.file_extension}")
+
+        await blob_service.store_temporary([stored])
+        blob_hash, file_size = stored.sha256, stored.size
+        logger.info(f"File {file_path} stored: {file_size} bytes, sha256 {blob_hash}")
+
+        await UploadSessionDAO.delete(self.db, UploadSession.id == session.id)
+        db_file = await self.file_crud._upload_file(
+            session.file_name, session.file_extension, file_path, user_id, session.folder_id, file_size, blob_hash)
+
+        await self._delete_chunks(session)
+
+        return db_file
+
+    async def delete_session(self, user_id: str, session_id: str) -> dict:
+
+        session = await self._get_session(session_id, user_id)
+
+        await UploadSessionDAO.delete(self.db, UploadSession.id == session.id)
         await self.db.commit()
 
+        await self._delete_chunks(session)
+
+        return {"Message": f"Upload session {session.id} was deleted by user {user_id} successfully"}
+
+    async def collect_expired_sessions(self, limit: int = UPLOAD_SESSION_GC_BATCH_SIZE) -> int:
+
+        """ Удаляет брошенные сессии: истекшие и без чанков за последний TTL """
+
+        now = datetime.now(timezone.utc)
+        recent_chunk = exists().where(and_(
+            UploadChunk.session_id == UploadSession.id,
+            UploadChunk.received_at > now - timedelta(seconds=UPLOAD_SESSION_TTL_SECONDS)))
+
+        sessions = await UploadSessionDAO.find_all(
+            self.db, UploadSession.expires_at < now, ~recent_chunk, limit=limit)
+
+        if not sessions:
+            return 0
+
+        await UploadSessionDAO.delete(self.db, UploadSession.id.in_([session.id for session in sessions]))
+        await self.db.commit()
+
+        for session in sessions:
+            await self._delete_chunks(session)
+
+        logger.info(f"Collected {len(sessions)} abandoned upload sessions")
+
+        return len(sessions)
+
+    async def _get_session(self, session_id: str, user_id: str) -> UploadSession:
+
+        session = await UploadSessionDAO.find_one_or_none(self.db, and_(
+            UploadSession.id == session_id, UploadSession.user_id == user_id))
+
+        if not session:
+            raise exceptions.UploadSessionWasNotFound
+
+        return session
+
+    async def _iter_chunks(self, session: UploadSession) -> AsyncIterator[bytes]:
+        for chunk_index in range(self._chunk_count(session)):
+            async for data in self.storage.open_range(self._get_chunk_key(session.id, chunk_index)):
+                yield data
+
+    async def _delete_chunks(self, session: UploadSession) -> None:
+        for chunk_index in range(self._chunk_count(session)):
+            await self.storage.delete(self._get_chunk_key(session.id, chunk_index))
+
+    @staticmethod
+    async def _limit_stream(chunks: AsyncIterator[bytes], limit: int) -> AsyncIterator[bytes]:
+        received = 0
+        async for data in chunks:
+            received += len(data)
+            if received > limit:
+                raise exceptions.InvalidChunk
+            yield data
+
+    @staticmethod
+    def _chunk_count(session: UploadSession) -> int:
+        return max(1, -(-session.file_size // session.chunk_size))
+
+    @staticmethod
+    def _get_chunk_key(session_id: str, chunk_index: int) -> str:
+        return f"upload_sessions/{session_id}/{chunk_index}"
+
+    def _build_status(self, session: UploadSession, chunks: list[UploadChunk]) -> schemas.UploadSessionStatus:
+        chunk_count = self._chunk_count(session)
+        received = {chunk.chunk_index for chunk in chunks}
+
+        return schemas.UploadSessionStatus(
+            id=session.id,
+            file_name=session.file_name,
+            file_extension=session.file_extension,
+            file_size=session.file_size,
+            chunk_size=session.chunk_size,
+            chunk_count=chunk_count,
+            folder_id=session.folder_id,
+            expires_at=session.expires_at,
+            received=sorted((schemas.UploadChunk.model_validate(chunk) for chunk in chunks), key=lambda c: c.chunk_index),
+            missing=[index for index in range(chunk_count) if index not in received],
+        )
+
+
 class FileManager:
     def __init__(self, db: AsyncSession):
         self.db = db
-        self._path_service = PathService(db)
-        self.file_crud = FileCRUD(db, self._path_service)
-        self.folder_crud = FolderCRUD(db, self._path_service)
+        self.storage = get_storage()
+        self._path_service = PathService(db, self.storage)
+        self._blob_service = BlobService(db, self.storage)
+        self._folder_stats = FolderStatsService(db)
+        self.file_crud = FileCRUD(db, self._path_service, self._blob_service, self._folder_stats)
+        self.folder_crud = FolderCRUD(db, self._path_service, self._folder_stats)
+        self.upload_session_crud = UploadSessionCRUD(db, self._path_service, self.file_crud, self.storage)
+        self.trash_crud = TrashCRUD(db, self._path_service, self._blob_service, self._folder_stats)
+        self.delete_job_crud = DeleteJobCRUD(db, self._blob_service)
 
     async def commit(self):
         await self.db.commit()
@@ -0,0 +1,39 @@
+import base64
+import hashlib
+import hmac
+import time
+
+from .config import DOWNLOAD_URL_SECRET
+
+
+def check_download_secret(secret: str | None = DOWNLOAD_URL_SECRET) -> None:
+
+    """ Вызывается при старте приложения, чтобы без ключа оно падало сразу, а не на первой ссылке """
+
+    if not secret:
+        raise RuntimeError("DOWNLOAD_URL_SECRET is not set")
+
+
+def sign_download(file_id: str, key: str, name: str, expires: int, secret: str = DOWNLOAD_URL_SECRET) -> str:
+
+    """ Подпись ссылки на скачивание: id файла, ключ в storage, имя и время истечения """
+
+    message = "\n".join([file_id, key, name, str(expires)]).encode()
+    digest = hmac.new(secret.encode(), message, hashlib.sha256).digest()
+
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def verify_download(
+    file_id: str,
+    key: str,
+    name: str,
+    expires: int,
+    signature: str,
+    secret: str = DOWNLOAD_URL_SECRET,
+) -> bool:
+
+    if expires < time.time():
+        return False
+
+    return hmac.compare_digest(sign_download(file_id, key, name, expires, secret), signature)
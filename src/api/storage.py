@@ -0,0 +1,379 @@
+import hashlib
+import hmac
+import os
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import AsyncIterator
+from urllib.parse import quote
+from xml.etree import ElementTree
+
+import httpx
+
+from .config import (
+    STORAGE_BACKEND,
+    STORAGE_ROOT,
+    S3_ACCESS_KEY,
+    S3_BUCKET,
+    S3_ENDPOINT_URL,
+    S3_PART_SIZE,
+    S3_REGION,
+    S3_SECRET_KEY,
+)
+from .fs import fs
+from .utils import iter_file, write_stream
+
+
+class StorageError(Exception):
+    pass
+
+
+class ObjectNotFound(StorageError):
+    pass
+
+
+@dataclass
+class ObjectStat:
+    key: str
+    size: int
+    sha256: str | None = None
+    modified_at: float | None = None
+
+
+class StorageBackend(ABC):
+
+    """ Хранилище байтов по ключу, не знающее о логическом дереве папок """
+
+    @abstractmethod
+    async def put_stream(self, key: str, chunks: AsyncIterator[bytes]) -> ObjectStat:
+        ...
+
+    @abstractmethod
+    def open_range(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def stat(self, key: str) -> ObjectStat | None:
+        ...
+
+    @abstractmethod
+    async def move(self, src_key: str, dst_key: str) -> None:
+        ...
+
+    def local_path(self, key: str) -> str | None:
+
+        """ Путь к объекту на локальном диске, если backend его предоставляет """
+
+        return None
+
+
+class LocalStorage(StorageBackend):
+
+    """ Локальный диск, объекты разложены по двум уровням каталогов по хешу ключа """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    async def put_stream(self, key: str, chunks: AsyncIterator[bytes]) -> ObjectStat:
+        path = self.local_path(key)
+        await fs.makedirs(os.path.dirname(path))
+
+        size, sha256 = await write_stream(chunks, path)
+        return ObjectStat(key=key, size=size, sha256=sha256)
+
+    async def open_range(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in iter_file(self.local_path(key), start=start, end=end):
+                yield chunk
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+
+    async def delete(self, key: str) -> None:
+        await fs.remove(self.local_path(key))
+
+    async def stat(self, key: str) -> ObjectStat | None:
+        try:
+            result = await fs.stat(self.local_path(key))
+        except FileNotFoundError:
+            return None
+
+        return ObjectStat(key=key, size=result.st_size, modified_at=result.st_mtime)
+
+    async def move(self, src_key: str, dst_key: str) -> None:
+        dst_path = self.local_path(dst_key)
+        await fs.makedirs(os.path.dirname(dst_path))
+
+        try:
+            await fs.replace(self.local_path(src_key), dst_path)
+        except FileNotFoundError:
+            raise ObjectNotFound(src_key)
+
+
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+
+def sign_v4(
+    method: str,
+    url: str,
+    headers: dict[str, str],
+    access_key: str,
+    secret_key: str,
+    region: str,
+    now: datetime,
+    service: str = "s3",
+) -> dict[str, str]:
+
+    """ Подписывает запрос AWS Signature V4, возвращает заголовки с Authorization """
+
+    parsed = httpx.URL(url)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date_stamp = now.strftime("%Y%m%d")
+
+    headers = {name.lower(): value.strip() for name, value in headers.items()}
+    headers["host"] = parsed.netloc.decode()
+    headers["x-amz-date"] = amz_date
+    headers.setdefault("x-amz-content-sha256", UNSIGNED_PAYLOAD)
+
+    query = sorted(
+        (quote(name, safe="-_.~"), quote(value, safe="-_.~"))
+        for name, value in httpx.QueryParams(parsed.query.decode()).multi_items()
+    )
+    signed_headers = ";".join(sorted(headers))
+
+    canonical_request = "\n".join([
+        method,
+        parsed.raw_path.split(b"?")[0].decode() or "/",
+        "&".join(f"{name}={value}" for name, value in query),
+        "".join(f"{name}:{headers[name]}\n" for name in sorted(headers)),
+        signed_headers,
+        headers["x-amz-content-sha256"],
+    ])
+
+    scope = f"{date_stamp}/{region}/{service}/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256",
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode()).hexdigest(),
+    ])
+
+    signing_key = f"AWS4{secret_key}".encode()
+    for part in (date_stamp, region, service, "aws4_request"):
+        signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+
+    signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    headers["authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+        f"SignedHeaders={signed_headers}, Signature={signature}"
+    )
+
+    return headers
+
+
+class S3Storage(StorageBackend):
+
+    """ S3-совместимое хранилище (AWS, MinIO) поверх httpx с подписью SigV4 """
+
+    # Ограничение S3 на размер одного CopyObject
+    MAX_COPY_SIZE = 5 * 1024 ** 3
+    COPY_PART_SIZE = 1024 ** 3
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        access_key: str,
+        secret_key: str,
+        region: str = "us-east-1",
+        part_size: int = 8 * 1024 * 1024,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.part_size = part_size
+        self._client = httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(60.0, connect=10.0))
+
+    async def put_stream(self, key: str, chunks: AsyncIterator[bytes]) -> ObjectStat:
+        digest = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        upload_id = None
+        parts: list[str] = []
+
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                buffer += chunk
+
+                # В памяти держим не больше одной части multipart-загрузки
+                while len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = await self._create_multipart_upload(key)
+
+                    part = bytes(buffer[:self.part_size])
+                    del buffer[:self.part_size]
+                    parts.append(await self._upload_part(key, upload_id, len(parts) + 1, part))
+
+            if upload_id is None:
+                await self._request("PUT", key, content=bytes(buffer))
+            else:
+                if buffer:
+                    parts.append(await self._upload_part(key, upload_id, len(parts) + 1, bytes(buffer)))
+                await self._complete_multipart_upload(key, upload_id, parts)
+
+        except BaseException:
+            if upload_id is not None:
+                await self._request("DELETE", key, params={"uploadId": upload_id}, check=False)
+            raise
+
+        return ObjectStat(key=key, size=size, sha256=digest.hexdigest())
+
+    async def open_range(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        headers = {}
+        if start or end is not None:
+            headers["range"] = f"bytes={start}-{'' if end is None else end}"
+
+        response = await self._request("GET", key, headers=headers, stream=True)
+        try:
+            async for chunk in response.aiter_bytes():
+                yield chunk
+        finally:
+            await response.aclose()
+
+    async def delete(self, key: str) -> None:
+        await self._request("DELETE", key)
+
+    async def stat(self, key: str) -> ObjectStat | None:
+        try:
+            response = await self._request("HEAD", key)
+        except ObjectNotFound:
+            return None
+
+        modified_at = None
+        if "last-modified" in response.headers:
+            modified_at = parsedate_to_datetime(response.headers["last-modified"]).timestamp()
+
+        return ObjectStat(key=key, size=int(response.headers["content-length"]), modified_at=modified_at)
+
+    async def move(self, src_key: str, dst_key: str) -> None:
+        source = await self.stat(src_key)
+        if source is None:
+            raise ObjectNotFound(src_key)
+
+        copy_source = f"/{self.bucket}/{quote(src_key, safe='/~')}"
+
+        if source.size <= self.MAX_COPY_SIZE:
+            await self._request("PUT", dst_key, headers={"x-amz-copy-source": copy_source})
+        else:
+            upload_id = await self._create_multipart_upload(dst_key)
+            parts = []
+            try:
+                for offset in range(0, source.size, self.COPY_PART_SIZE):
+                    last = min(offset + self.COPY_PART_SIZE, source.size) - 1
+                    response = await self._request(
+                        "PUT", dst_key,
+                        params={"partNumber": str(len(parts) + 1), "uploadId": upload_id},
+                        headers={"x-amz-copy-source": copy_source, "x-amz-copy-source-range": f"bytes={offset}-{last}"},
+                    )
+                    parts.append(self._find_xml_text(response.content, "ETag"))
+                await self._complete_multipart_upload(dst_key, upload_id, parts)
+            except BaseException:
+                await self._request("DELETE", dst_key, params={"uploadId": upload_id}, check=False)
+                raise
+
+        await self.delete(src_key)
+
+    async def _create_multipart_upload(self, key: str) -> str:
+        response = await self._request("POST", key, params={"uploads": ""})
+        return self._find_xml_text(response.content, "UploadId")
+
+    async def _upload_part(self, key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        response = await self._request(
+            "PUT", key, params={"partNumber": str(part_number), "uploadId": upload_id}, content=data)
+        return response.headers["etag"]
+
+    async def _complete_multipart_upload(self, key: str, upload_id: str, parts: list[str]) -> None:
+        body = "".join(
+            f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+            for number, etag in enumerate(parts, start=1)
+        )
+        await self._request(
+            "POST", key, params={"uploadId": upload_id},
+            content=f"<CompleteMultipartUpload>{body}</CompleteMultipartUpload>".encode())
+
+    async def _request(
+        self,
+        method: str,
+        key: str,
+        params: dict[str, str] | None = None,
+        headers: dict[str, str] | None = None,
+        content: bytes | None = None,
+        stream: bool = False,
+        check: bool = True,
+    ) -> httpx.Response:
+        url = f"{self.endpoint_url}/{self.bucket}/{quote(key, safe='/~')}"
+        if params:
+            url += "?" + "&".join(
+                f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}" for name, value in sorted(params.items()))
+
+        signed_headers = sign_v4(
+            method, url, headers or {}, self.access_key, self.secret_key, self.region, datetime.now(timezone.utc))
+
+        request = self._client.build_request(method, url, headers=signed_headers, content=content)
+        response = await self._client.send(request, stream=stream)
+
+        if not check or response.is_success:
+            return response
+
+        if stream:
+            await response.aread()
+            await response.aclose()
+
+        if response.status_code == 404:
+            # Удаление отсутствующего объекта ошибкой не считаем
+            if method == "DELETE":
+                return response
+            raise ObjectNotFound(key)
+
+        raise StorageError(f"S3 {method} {key} failed with {response.status_code}: {response.text}")
+
+    @staticmethod
+    def _find_xml_text(content: bytes, tag: str) -> str:
+        for element in ElementTree.fromstring(content).iter():
+            if element.tag.rsplit("}", 1)[-1] == tag:
+                return element.text
+
+        raise StorageError(f"S3 response has no {tag}")
+
+
+@lru_cache
+def get_storage() -> StorageBackend:
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(STORAGE_ROOT)
+
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(
+            endpoint_url=S3_ENDPOINT_URL,
+            bucket=S3_BUCKET,
+            access_key=S3_ACCESS_KEY,
+            secret_key=S3_SECRET_KEY,
+            region=S3_REGION,
+            part_size=S3_PART_SIZE,
+        )
+
+    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
@@ -0,0 +1,115 @@
+import asyncio
+
+from datetime import datetime, timezone
+
+from loguru import logger
+
+from ..auth.dao import UserDAO
+from ..auth.models import User
+from ..database import async_session_maker
+from ..metrics import counter
+
+from .config import (
+    BLOB_GC_BATCH_SIZE,
+    FOLDER_STATS_VERIFY_BATCH_SIZE,
+    TRASH_PURGE_BATCH_PAUSE_SECONDS,
+    TRASH_PURGE_BATCH_SIZE,
+    TRASH_PURGE_HOURS,
+    TRASH_PURGE_MAX_BATCHES,
+    USAGE_RECONCILE_BATCH_SIZE,
+)
+from .dao import FolderDAO, UserUsageDAO
+from .service import BlobService, FileManager
+from .storage import get_storage
+
+
+BLOBS_COLLECTED = counter("blobs_collected_total", "Blobs without references removed from storage")
+FOLDER_STATS_REBUILT = counter("folder_stats_rebuilt_total", "Folder stats rows corrected by the verifier")
+TRASH_FILES_PURGED = counter("trash_files_purged_total", "Expired trash files deleted by the purger")
+USAGE_RECONCILED = counter("user_usage_reconciled_total", "Users whose usage counter was corrected by reconciliation")
+
+
+async def collect_upload_sessions() -> None:
+    async with async_session_maker() as db:
+        upload_session_crud = FileManager(db).upload_session_crud
+
+        # Чистим пачками, пока есть что удалять
+        while await upload_session_crud.collect_expired_sessions():
+            pass
+
+
+async def run_delete_jobs() -> None:
+    async with async_session_maker() as db:
+        delete_job_crud = FileManager(db).delete_job_crud
+
+        while await delete_job_crud.run_next_job():
+            pass
+
+
+async def collect_orphaned_blobs() -> None:
+    async with async_session_maker() as db:
+        blob_service = BlobService(db, get_storage())
+
+        while collected := await blob_service.collect_orphaned(BLOB_GC_BATCH_SIZE):
+            BLOBS_COLLECTED.inc(collected)
+
+
+async def verify_folder_stats() -> None:
+    async with async_session_maker() as db:
+        folder_crud = FileManager(db).folder_crud
+        after = None
+
+        # Пользователи по одному: транзакция и блокировка дерева держатся только на время его пересчета
+        while user_ids := await FolderDAO.find_user_ids(db, after, FOLDER_STATS_VERIFY_BATCH_SIZE):
+            for user_id in user_ids:
+                FOLDER_STATS_REBUILT.inc(await folder_crud.rebuild_stats(user_id))
+
+            after = user_ids[-1]
+
+
+async def reconcile_user_usage() -> None:
+    # id читаются одним курсором в своей сессии: commit пачек в db его бы закрыл
+    async with async_session_maker() as reader, async_session_maker() as db:
+        users = UserDAO.iter_batches(reader, columns=[User.id], fetch_size=USAGE_RECONCILE_BATCH_SIZE)
+
+        async for batch in users:
+            # Блокировка на пачку: если сверку ведет другой воркер, этот запуск пропускается
+            if not await UserUsageDAO.try_lock_reconcile(db):
+                await db.rollback()
+                return
+
+            drifted = await UserUsageDAO.reconcile(db, [user_id for user_id, in batch])
+            await db.commit()
+
+            if drifted:
+                logger.warning(f"Usage counters of {len(drifted)} users drifted: {drifted[:10]}")
+                USAGE_RECONCILED.inc(len(drifted))
+
+
+def in_hours(hours: str, hour: int) -> bool:
+
+    """ Попадает ли час в окно "начало-конец"; окно может переходить через полночь """
+
+    if not hours:
+        return True
+
+    start, end = (int(value) for value in hours.split("-"))
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+async def purge_trash() -> None:
+    if not in_hours(TRASH_PURGE_HOURS, datetime.now(timezone.utc).hour):
+        return
+
+    async with async_session_maker() as db:
+        trash_crud = FileManager(db).trash_crud
+
+        # Ограниченное число пачек с паузами: остаток дочистит следующий запуск
+        for _ in range(TRASH_PURGE_MAX_BATCHES):
+            purged = await trash_crud.purge_expired(TRASH_PURGE_BATCH_SIZE)
+            TRASH_FILES_PURGED.inc(purged)
+
+            if purged < TRASH_PURGE_BATCH_SIZE:
+                break
+
+            await asyncio.sleep(TRASH_PURGE_BATCH_PAUSE_SECONDS)
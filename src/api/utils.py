@@ -0,0 +1,66 @@
+import hashlib
+
+from typing import AsyncIterator
+from uuid import uuid4
+
+from fastapi import UploadFile
+
+from .config import UPLOAD_CHUNK_SIZE
+from .fs import fs
+
+
+async def iter_upload_file(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+async def iter_file(file_path: str, chunk_size: int = UPLOAD_CHUNK_SIZE, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+
+    """ Читает файл с диска частями, не блокируя event loop; end включительно """
+
+    f = await fs.open(file_path, "rb")
+    try:
+        if start:
+            await fs.seek(f, start)
+
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = await fs.read(f, size)
+            if not chunk:
+                break
+
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        await fs.close(f)
+
+
+async def write_stream(chunks: AsyncIterator[bytes], file_path: str) -> tuple[int, str]:
+
+    """ Пишет поток байтов в file_path через временный файл, возвращает размер и sha256 """
+
+    # Временный файл лежит рядом с целевым, чтобы os.replace был атомарным
+    tmp_path = f"{file_path}.{uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+
+    f = await fs.open(tmp_path, "wb")
+    try:
+        async for chunk in chunks:
+            digest.update(chunk)
+            size += len(chunk)
+            await fs.write(f, chunk)
+
+        await fs.fsync(f)
+        await fs.close(f)
+        await fs.replace(tmp_path, file_path)
+
+    except BaseException:
+        await fs.close(f)
+        await fs.remove(tmp_path)
+        raise
+
+    return size, digest.hexdigest()
+
@@ -18,3 +18,55 @@ MAX_USERNAME_LENGTH = os.environ.get("MAX_USERNAME_LENGTH")
 
 MIN_PASSWORD_LENGTH = os.environ.get("MIN_PASSWORD_LENGTH")
 MAX_PASSWORD_LENGTH = os.environ.get("MAX_PASSWORD_LENGTH")
+
+
+# thread - hashlib отпускает GIL на время PBKDF2, process - полная изоляция от воркера
+PASSWORD_HASHER_EXECUTOR = os.environ.get("PASSWORD_HASHER_EXECUTOR", "thread")
+PASSWORD_HASHER_WORKERS = int(os.environ.get("PASSWORD_HASHER_WORKERS", os.cpu_count() or 1))
+# Сколько хеширований может ждать очереди; сверх этого сразу отвечаем 503
+PASSWORD_HASHER_MAX_PENDING = int(os.environ.get("PASSWORD_HASHER_MAX_PENDING", 4 * PASSWORD_HASHER_WORKERS))
+PASSWORD_HASHER_RETRY_AFTER_SECONDS = int(os.environ.get("PASSWORD_HASHER_RETRY_AFTER_SECONDS", 1))
+
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 10_000))
+# Как долго воркер доверяет закэшированной версии токенов пользователя, т.е. задержка отзыва
+TOKEN_VERSION_TTL_SECONDS = float(os.environ.get("TOKEN_VERSION_TTL_SECONDS", 5))
+
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10_000))
+USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", 60))
+# При нескольких воркерах изменения пользователя рассылаются через LISTEN/NOTIFY
+USER_CACHE_NOTIFY_ENABLED = os.environ.get("USER_CACHE_NOTIFY_ENABLED", "false").lower() == "true"
+USER_CACHE_NOTIFY_CHANNEL = os.environ.get("USER_CACHE_NOTIFY_CHANNEL", "user_cache_invalidate")
+
+# Каталог с PEM ключами EdDSA/ES256, kid - имя файла. Без него токены подписываются TOKEN_SECRET_KEY.
+# Ротация: положить новый приватный ключ (он станет подписывающим, если JWT_SIGNING_KID не задан),
+# старый заменить его публичной частью и удалить после истечения выданных им токенов
+JWT_KEYS_DIR = os.environ.get("JWT_KEYS_DIR")
+JWT_SIGNING_KID = os.environ.get("JWT_SIGNING_KID")
+JWKS_MAX_AGE_SECONDS = int(os.environ.get("JWKS_MAX_AGE_SECONDS", 300))
+
+# Узлы без ключей проверяют токены по публичным ключам из JWKS основного API
+JWKS_URL = os.environ.get("JWKS_URL")
+JWKS_CACHE_TTL_SECONDS = float(os.environ.get("JWKS_CACHE_TTL_SECONDS", 300))
+JWKS_MIN_REFRESH_SECONDS = float(os.environ.get("JWKS_MIN_REFRESH_SECONDS", 30))
+
+# Удаление истекших refresh токенов: раз в interval секунд пачками по batch_size строк
+REFRESH_TOKEN_SWEEP_INTERVAL_SECONDS = int(os.environ.get("REFRESH_TOKEN_SWEEP_INTERVAL_SECONDS", 60 * 60))
+REFRESH_TOKEN_SWEEP_BATCH_SIZE = int(os.environ.get("REFRESH_TOKEN_SWEEP_BATCH_SIZE", 1000))
+
+# Token bucket на /login/ и /refresh_tokens: memory - в каждом воркере свой, redis - общий
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+RATE_LIMIT_SHARDS = int(os.environ.get("RATE_LIMIT_SHARDS", 16))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", 100_000))
+# Брать адрес клиента из X-Forwarded-For; включать только за доверенным прокси
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.environ.get("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+LOGIN_USERNAME_RATE_PER_MINUTE = float(os.environ.get("LOGIN_USERNAME_RATE_PER_MINUTE", 5))
+LOGIN_USERNAME_BURST = int(os.environ.get("LOGIN_USERNAME_BURST", 10))
+LOGIN_IP_RATE_PER_MINUTE = float(os.environ.get("LOGIN_IP_RATE_PER_MINUTE", 30))
+LOGIN_IP_BURST = int(os.environ.get("LOGIN_IP_BURST", 30))
+REFRESH_TOKEN_RATE_PER_MINUTE = float(os.environ.get("REFRESH_TOKEN_RATE_PER_MINUTE", 10))
+REFRESH_TOKEN_BURST = int(os.environ.get("REFRESH_TOKEN_BURST", 10))
+REFRESH_IP_RATE_PER_MINUTE = float(os.environ.get("REFRESH_IP_RATE_PER_MINUTE", 60))
+REFRESH_IP_BURST = int(os.environ.get("REFRESH_IP_BURST", 60))
@@ -1,3 +1,8 @@
+from datetime import datetime
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from .models import User, Refresh_token
 from .schemas import RefreshTokenCreate, RefreshTokenUpdate, UserCreateDB, UserUpdate
 
@@ -7,6 +12,48 @@ from ..dao import BaseDAO
 class UserDAO(BaseDAO[User, UserCreateDB, UserUpdate]):
     model = User
 
+    @classmethod
+    async def get_token_version(cls, db: AsyncSession, user_id: str) -> int | None:
+        result = await db.execute(select(cls.model.token_version).where(cls.model.id == user_id))
+        return result.scalar_one_or_none()
+
+    @classmethod
+    async def increment_token_version(cls, db: AsyncSession, user_id: str) -> int | None:
+        result = await db.execute(
+            update(cls.model)
+            .where(cls.model.id == user_id)
+            .values(token_version=cls.model.token_version + 1)
+            .returning(cls.model.token_version)
+        )
+        return result.scalar_one_or_none()
+
 
 class RefreshTokenDAO(BaseDAO[Refresh_token, RefreshTokenCreate, RefreshTokenUpdate]):
     model = Refresh_token
+
+    # Ключ pg_try_advisory_xact_lock для очистки истекших токенов
+    SWEEP_LOCK_ID = 0x72746B73
+
+    @classmethod
+    def expiry(cls):
+        return func.refresh_token_expiry(cls.model.created_at, cls.model.expires_at)
+
+    @classmethod
+    async def try_lock_sweep(cls, db: AsyncSession) -> bool:
+        result = await db.execute(select(func.pg_try_advisory_xact_lock(cls.SWEEP_LOCK_ID)))
+        return result.scalar_one()
+
+    @classmethod
+    async def delete_expired(cls, db: AsyncSession, now: datetime, limit: int) -> int:
+
+        """ Удаляет не больше limit истекших токенов по индексу ix_refresh_tokens_expiry """
+
+        expired = (
+            select(cls.model.id)
+            .where(cls.expiry() <= now)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(delete(cls.model).where(cls.model.id.in_(expired)).returning(cls.model.id))
+
+        return len(result.all())
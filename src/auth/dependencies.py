@@ -1,14 +1,39 @@
+import hashlib
+
 from fastapi import Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import exceptions
+from .config import (
+    LOGIN_IP_BURST,
+    LOGIN_IP_RATE_PER_MINUTE,
+    LOGIN_USERNAME_BURST,
+    LOGIN_USERNAME_RATE_PER_MINUTE,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMIT_TRUST_FORWARDED_FOR,
+    REFRESH_IP_BURST,
+    REFRESH_IP_RATE_PER_MINUTE,
+    REFRESH_TOKEN_BURST,
+    REFRESH_TOKEN_RATE_PER_MINUTE,
+)
+from .rate_limit import RateLimit, check_rate_limits, rate_limiter
 from .service import DatabaseManager
-from .models import User
 
 from ..database import get_async_session
-from ..utils import check_record_existence
 
 
+async def get_current_user_id(
+        token: str,
+        db: AsyncSession = Depends(get_async_session),
+) -> str:
+
+    """ id пользователя из access токена в query; один раз на запрос, проверенные токены кэшируются """
+
+    db_manager = DatabaseManager(db)
+    token_crud = db_manager.token_crud
+
+    return await token_crud.get_access_token_payload(token)
+
 
 async def get_current_user(
         request: Request,
@@ -18,11 +43,60 @@ async def get_current_user(
     db_manager = DatabaseManager(db)
     token_crud = db_manager.token_crud
 
-    try:
-        user_id = await token_crud.get_access_token_payload(request.cookies.get('access_token'))
-
-    except KeyError:
+    access_token = request.cookies.get('access_token')
+    if access_token is None:
         raise exceptions.InvalidCredentials
 
-    user = await check_record_existence(db, User, user_id)
+    user_id = await token_crud.get_access_token_payload(access_token)
+
+    user = await db_manager.user_crud.get_user_by_id(user_id)
+    if user is None:
+        raise exceptions.UserDoesNotExist
+
     return user
+
+
+LOGIN_USERNAME_LIMIT = RateLimit(LOGIN_USERNAME_RATE_PER_MINUTE, LOGIN_USERNAME_BURST)
+LOGIN_IP_LIMIT = RateLimit(LOGIN_IP_RATE_PER_MINUTE, LOGIN_IP_BURST)
+REFRESH_TOKEN_LIMIT = RateLimit(REFRESH_TOKEN_RATE_PER_MINUTE, REFRESH_TOKEN_BURST)
+REFRESH_IP_LIMIT = RateLimit(REFRESH_IP_RATE_PER_MINUTE, REFRESH_IP_BURST)
+
+
+def get_client_ip(request: Request) -> str:
+    forwarded_for = request.headers.get("x-forwarded-for")
+
+    if RATE_LIMIT_TRUST_FORWARDED_FOR and forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+
+    return request.client.host if request.client else "unknown"
+
+
+async def limit_login(request: Request, username: str) -> None:
+
+    """ Отсекает перебор паролей до PBKDF2: лимиты на имя пользователя и на адрес клиента """
+
+    if not RATE_LIMIT_ENABLED:
+        return
+
+    retry_after = await check_rate_limits(rate_limiter, [
+        (f"login:user:{username.lower()}", LOGIN_USERNAME_LIMIT),
+        (f"login:ip:{get_client_ip(request)}", LOGIN_IP_LIMIT),
+    ])
+    if retry_after:
+        raise exceptions.TooManyRequests(retry_after)
+
+
+async def limit_refresh(request: Request, token: str) -> None:
+
+    if not RATE_LIMIT_ENABLED:
+        return
+
+    # Сам refresh токен в хранилище лимитов не попадает
+    token_key = hashlib.sha256(token.encode()).hexdigest()[:32]
+
+    retry_after = await check_rate_limits(rate_limiter, [
+        (f"refresh:token:{token_key}", REFRESH_TOKEN_LIMIT),
+        (f"refresh:ip:{get_client_ip(request)}", REFRESH_IP_LIMIT),
+    ])
+    if retry_after:
+        raise exceptions.TooManyRequests(retry_after)
@@ -59,3 +59,21 @@ class UserAlreadyExists(HTTPException):
 class UserAlreadyActive(HTTPException):
     def __init__(self):
         super().__init__(status_code=409, detail="User is already active")
+
+
+class ServiceBusy(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=503,
+            detail="Service is busy, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class TooManyRequests(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail="Too many requests, try again later",
+            headers={"Retry-After": str(retry_after)},
+        )
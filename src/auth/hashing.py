@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import time
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from ..metrics import histogram
+from . import exceptions
+from .config import (
+    PASSWORD_HASHER_EXECUTOR,
+    PASSWORD_HASHER_MAX_PENDING,
+    PASSWORD_HASHER_RETRY_AFTER_SECONDS,
+    PASSWORD_HASHER_WORKERS,
+)
+
+
+PASSWORD_HASH_LATENCY = histogram("password_hash_seconds", "Time from submitting a password hash to its result")
+
+
+def pbkdf2(password: str, salt: str, iterations: int) -> str:
+    return hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), iterations).hex()
+
+
+class PasswordHasher:
+
+    """ Считает PBKDF2 вне event loop в пуле ограниченного размера
+
+    Очередь ограничена max_pending: при всплеске логинов лишние запросы сразу получают 503
+    вместо того, чтобы копиться и отнимать время у остальных запросов воркера.
+    """
+
+    def __init__(self, executor_type: str, max_workers: int, max_pending: int, retry_after: int):
+        self.executor_type = executor_type
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.pending = 0
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        # Пул создается при первом обращении, чтобы процессы не порождались при импорте
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pbkdf2")
+
+        return self._executor
+
+    async def hash(self, password: str, salt: str, iterations: int) -> str:
+        if self.pending >= self.max_pending:
+            raise exceptions.ServiceBusy(self.retry_after)
+
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+
+        future = self.executor.submit(pbkdf2, password, salt, iterations)
+        self.pending += 1
+
+        # Место в очереди освобождается, когда пул закончил работу: отмена ожидающего запроса
+        # (клиент отключился) не останавливает уже начатый PBKDF2
+        future.add_done_callback(lambda _: self._call_in_loop(loop, self._done, started))
+
+        return await asyncio.wrap_future(future)
+
+    def _done(self, started: float) -> None:
+        self.pending -= 1
+        PASSWORD_HASH_LATENCY.observe(time.perf_counter() - started)
+
+    @staticmethod
+    def _call_in_loop(loop: asyncio.AbstractEventLoop, callback, *args) -> None:
+        # Колбэк future вызывается в потоке пула, счетчик меняем только из event loop
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Loop уже закрыт при остановке воркера, считать больше некому
+            pass
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    PASSWORD_HASHER_EXECUTOR,
+    PASSWORD_HASHER_WORKERS,
+    PASSWORD_HASHER_MAX_PENDING,
+    PASSWORD_HASHER_RETRY_AFTER_SECONDS,
+)
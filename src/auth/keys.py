@@ -0,0 +1,193 @@
+import os
+import time
+
+from dataclasses import dataclass
+from functools import lru_cache
+
+import httpx
+import jwt
+
+from loguru import logger
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+from .config import (
+    ALGORITHM,
+    JWKS_CACHE_TTL_SECONDS,
+    JWKS_MIN_REFRESH_SECONDS,
+    JWKS_URL,
+    JWT_KEYS_DIR,
+    JWT_SIGNING_KID,
+    TOKEN_SECRET_KEY,
+)
+
+
+@dataclass(frozen=True)
+class TokenKey:
+    kid: str
+    algorithm: str
+    public_key: object
+    private_key: object | None = None
+
+
+def _algorithm_for(public_key) -> str:
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        return "EdDSA"
+
+    if isinstance(public_key, ec.EllipticCurvePublicKey) and isinstance(public_key.curve, ec.SECP256R1):
+        return "ES256"
+
+    raise ValueError(f"Unsupported key type: {type(public_key).__name__}")
+
+
+def _load_pem(kid: str, data: bytes) -> TokenKey:
+    try:
+        private_key = serialization.load_pem_private_key(data, password=None)
+        public_key = private_key.public_key()
+    except ValueError:
+        private_key = None
+        public_key = serialization.load_pem_public_key(data)
+
+    return TokenKey(kid=kid, algorithm=_algorithm_for(public_key), public_key=public_key, private_key=private_key)
+
+
+class KeyStore:
+
+    """ Ключи подписи access токенов
+
+    Приватные ключи подписывают и проверяют, публичные только проверяют: так выводится из
+    ротации старый ключ, пока не истекут выданные им токены.
+    """
+
+    def __init__(self, keys: list[TokenKey], signing_kid: str | None = None):
+        self.keys = {key.kid: key for key in keys}
+
+        private_kids = sorted(key.kid for key in keys if key.private_key is not None)
+        self.signing_kid = signing_kid or (private_kids[-1] if private_kids else None)
+
+        if self.signing_kid is not None and self.signing_kid not in private_kids:
+            raise ValueError(f"No private key for kid {self.signing_kid}")
+
+    @classmethod
+    def from_directory(cls, path: str | None, signing_kid: str | None = None) -> "KeyStore":
+
+        """ *.pem из каталога, kid - имя файла без расширения """
+
+        keys = []
+        if path:
+            for file_name in sorted(os.listdir(path)):
+                kid, extension = os.path.splitext(file_name)
+                if extension == ".pem":
+                    with open(os.path.join(path, file_name), "rb") as f:
+                        keys.append(_load_pem(kid, f.read()))
+
+        return cls(keys, signing_kid)
+
+    @property
+    def signing_key(self) -> TokenKey | None:
+        return self.keys.get(self.signing_kid) if self.signing_kid else None
+
+    def get(self, kid: str) -> TokenKey | None:
+        return self.keys.get(kid)
+
+    def jwks(self) -> dict:
+        return {"keys": [_to_jwk(key) for key in self.keys.values()]}
+
+
+def _to_jwk(key: TokenKey) -> dict:
+    algorithm = jwt.get_algorithm_by_name(key.algorithm)
+    jwk = algorithm.to_jwk(key.public_key, as_dict=True)
+
+    return {**jwk, "kid": key.kid, "alg": key.algorithm, "use": "sig"}
+
+
+class JWKSCache:
+
+    """ Публичные ключи с удаленного JWKS для узлов без доступа к ключам API
+
+    Набор ключей обновляется раз в ttl, а при незнакомом kid - не чаще раза в min_refresh,
+    чтобы токены с мусорным kid не превращались в поток запросов к API.
+    """
+
+    def __init__(self, url: str, ttl: float, min_refresh: float, transport: httpx.AsyncBaseTransport | None = None):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh = min_refresh
+        self.transport = transport
+        self._keys: dict[str, TokenKey] = {}
+        self._fetched_at = float("-inf")
+
+    async def get(self, kid: str) -> TokenKey | None:
+        age = time.monotonic() - self._fetched_at
+
+        if age >= self.ttl or (kid not in self._keys and age >= self.min_refresh):
+            try:
+                await self._refresh()
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                # Остаемся на прежних ключах и пробуем снова через min_refresh
+                logger.opt(exception=e).error(f"Error in JWKS refresh from {self.url}")
+                self._fetched_at = time.monotonic() - self.ttl + self.min_refresh
+
+        return self._keys.get(kid)
+
+    async def _refresh(self) -> None:
+        async with httpx.AsyncClient(transport=self.transport) as client:
+            response = await client.get(self.url)
+            response.raise_for_status()
+
+        keys = {}
+        for jwk in response.json()["keys"]:
+            if jwk.get("alg") not in ("EdDSA", "ES256"):
+                continue
+
+            public_key = jwt.PyJWK(jwk).key
+            keys[jwk["kid"]] = TokenKey(kid=jwk["kid"], algorithm=jwk["alg"], public_key=public_key)
+
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+
+def encode_access_token(payload: dict, key_store: KeyStore) -> str:
+    signing_key = key_store.signing_key
+
+    if signing_key is None:
+        return jwt.encode(payload, TOKEN_SECRET_KEY, algorithm=ALGORITHM)
+
+    return jwt.encode(payload, signing_key.private_key, algorithm=signing_key.algorithm, headers={"kid": signing_key.kid})
+
+
+async def decode_access_token(token: str, key_store: KeyStore, jwks_cache: JWKSCache | None = None) -> dict:
+
+    """ Проверяет подпись по kid из заголовка; токены без kid - прежний общий секрет
+
+    Алгоритм берется из ключа, а не из заголовка токена, поэтому подменить его нельзя.
+    Ошибки - исключения PyJWT.
+    """
+
+    kid = jwt.get_unverified_header(token).get("kid")
+
+    if kid is None:
+        if not TOKEN_SECRET_KEY:
+            raise jwt.InvalidTokenError("Token has no kid")
+
+        return jwt.decode(token, TOKEN_SECRET_KEY, algorithms=[ALGORITHM])
+
+    key = key_store.get(kid)
+    if key is None and jwks_cache is not None:
+        key = await jwks_cache.get(kid)
+
+    if key is None:
+        raise jwt.InvalidKeyError(f"Unknown kid {kid}")
+
+    return jwt.decode(token, key.public_key, algorithms=[key.algorithm])
+
+
+@lru_cache
+def get_key_store() -> KeyStore:
+    return KeyStore.from_directory(JWT_KEYS_DIR, JWT_SIGNING_KID)
+
+
+@lru_cache
+def get_jwks_cache() -> JWKSCache | None:
+    return JWKSCache(JWKS_URL, JWKS_CACHE_TTL_SECONDS, JWKS_MIN_REFRESH_SECONDS) if JWKS_URL else None
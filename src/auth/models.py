@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import TIMESTAMP, ForeignKey
+from sqlalchemy import TIMESTAMP, ForeignKey, Index
 from sqlalchemy.orm import  Mapped, mapped_column
 from sqlalchemy.sql import func
 
@@ -15,6 +15,7 @@ class User(Base):
     username: Mapped[str] = mapped_column(nullable=False, unique=True)
     is_superuser: Mapped[bool] = mapped_column(nullable=False, default=False)
     hashed_password: Mapped[str] = mapped_column(nullable=False)
+    token_version: Mapped[int] = mapped_column(nullable=False, server_default='0')
 
 
 class Refresh_token(Base):
@@ -22,6 +23,11 @@ class Refresh_token(Base):
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     refresh_token: Mapped[str] = mapped_column(index=True)
-    expires_at: Mapped[int]
+    expires_at: Mapped[int] = mapped_column()
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), server_default=func.now())
-    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    user_id: Mapped[str] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), index=True)
+
+    # refresh_token_expiry - IMMUTABLE функция из миграции: timestamptz + interval сам по себе лишь STABLE
+    __table_args__ = (
+        Index("ix_refresh_tokens_expiry", func.refresh_token_expiry(created_at, expires_at)),
+    )
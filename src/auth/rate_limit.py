@@ -0,0 +1,143 @@
+import math
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from loguru import logger
+
+from .config import (
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_REDIS_URL,
+    RATE_LIMIT_SHARDS,
+)
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    per_minute: float
+    burst: int
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60
+
+
+class MemoryRateLimiter:
+
+    """ Token bucket в памяти воркера
+
+    Корзины разложены по шардам, у каждого свой LRU ограниченного размера: вытеснение
+    и рост словаря затрагивают только один шард, а память не растет от перебора ключей.
+    При нескольких воркерах лимит действует на каждый воркер отдельно.
+    """
+
+    def __init__(self, shards: int, max_keys: int):
+        self.max_keys_per_shard = max(1, max_keys // shards)
+        self._shards: list[OrderedDict[str, tuple[float, float]]] = [OrderedDict() for _ in range(shards)]
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+
+        """ Берет токен из корзины; 0 - разрешено, иначе сколько секунд ждать """
+
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+
+        tokens, updated_at = shard.get(key, (limit.burst, now))
+        tokens = min(limit.burst, tokens + (now - updated_at) * limit.rate)
+
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / limit.rate
+
+        shard[key] = (tokens, now)
+        shard.move_to_end(key)
+
+        while len(shard) > self.max_keys_per_shard:
+            shard.popitem(last=False)
+
+        return wait
+
+    async def close(self) -> None:
+        pass
+
+
+# Время берется у Redis, чтобы расхождение часов воркеров не влияло на пополнение корзин.
+# Число возвращается строкой: Redis обрезает дробные числа из Lua до целых
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimiter:
+
+    """ Token bucket в Redis, общий для всех воркеров и узлов; корзина обновляется атомарно скриптом """
+
+    KEY_PREFIX = "rate_limit:"
+
+    def __init__(self, client):
+        self.client = client
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisRateLimiter":
+        # redis - необязательная зависимость, нужна только с RATE_LIMIT_BACKEND=redis
+        import redis.asyncio
+
+        return cls(redis.asyncio.from_url(url))
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        wait = await self._script(keys=[self.KEY_PREFIX + key], args=[limit.rate, limit.burst])
+        return float(wait)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+async def check_rate_limits(limiter, limits: list[tuple[str, RateLimit]]) -> float:
+
+    """ Проверяет все корзины запроса; возвращает целое число секунд до повтора или 0
+
+    Если хранилище недоступно, запрос пропускается: логин важнее лимита.
+    """
+
+    wait = 0.0
+    for key, limit in limits:
+        try:
+            wait = max(wait, await limiter.acquire(key, limit))
+        except Exception as e:
+            logger.opt(exception=e).error(f"Error in rate limiter for {key}")
+
+    return math.ceil(wait)
+
+
+def create_rate_limiter():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisRateLimiter.from_url(RATE_LIMIT_REDIS_URL)
+
+    return MemoryRateLimiter(RATE_LIMIT_SHARDS, RATE_LIMIT_MAX_KEYS)
+
+
+rate_limiter = create_rate_limiter()
@@ -1,12 +1,15 @@
 from typing import List
 
 from fastapi import APIRouter, Depends, Request, Response
+from fastapi.responses import JSONResponse
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import schemas
 
-from .dependencies import get_current_user
+from .config import JWKS_MAX_AGE_SECONDS
+from .dependencies import get_current_user, limit_login, limit_refresh
+from .keys import get_key_store
 from .models import User
 from .service import DatabaseManager
 from ..database import get_async_session
@@ -27,7 +30,7 @@ async def create_user(
     return await user_crud.create_user(user=user_data)
 
 
-@router.post("/login/")
+@router.post("/login/", dependencies=[Depends(limit_login)])
 async def login(
     response: Response,
     username: str,
@@ -53,9 +56,7 @@ async def logout(
     db_manager = DatabaseManager(db)
     user_crud = db_manager.user_crud
 
-    await user_crud.logout(refresh_token=request.cookies.get('refresh_token'))
-
-    return response
+    return await user_crud.logout(refresh_token=request.cookies.get('refresh_token'))
 
 
 @router.get("/me", response_model=schemas.User)
@@ -101,7 +102,7 @@ async def get_all_users(
     return await user_crud.get_all_users(offset=offset, limit=limit)
 
 
-@router.patch("/refresh_tokens")
+@router.patch("/refresh_tokens", dependencies=[Depends(limit_refresh)])
 async def refresh_token(
     token: str,
     request: Request,
@@ -147,3 +148,13 @@ async def delete_user(
     response = await user_crud.delete_user(username=username, email=email, user_id=user_id)
 
     return response
+
+
+@router.get("/.well-known/jwks.json")
+async def get_jwks():
+
+    # Публичные ключи для проверки access токенов на других узлах без обращения к API
+    return JSONResponse(
+        get_key_store().jwks(),
+        headers={"Cache-Control": f"public, max-age={JWKS_MAX_AGE_SECONDS}"},
+    )
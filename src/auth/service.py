@@ -5,19 +5,23 @@ from datetime import datetime, timedelta, timezone
 from fastapi import Response
 from fastapi.responses import JSONResponse
 
-from sqlalchemy import or_
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 from loguru import logger
 
 from . import models, exceptions, schemas, utils
 from .config import (
-    TOKEN_SECRET_KEY,
-    ALGORITHM,
     ACCESS_TOKEN_EXPIRE_MINUTES,
-    REFRESH_TOKEN_EXPIRE_DAYS
+    REFRESH_TOKEN_EXPIRE_DAYS,
+    REFRESH_TOKEN_SWEEP_BATCH_SIZE,
+    USER_CACHE_NOTIFY_CHANNEL,
+    USER_CACHE_NOTIFY_ENABLED,
 )
 from .dao import RefreshTokenDAO, UserDAO
+from .keys import decode_access_token, encode_access_token, get_jwks_cache, get_key_store
 from .models import Refresh_token, User
+from .token_cache import VerifiedToken, token_cache
+from .user_cache import user_cache
 
 from ..utils import get_unique_id
 
@@ -73,6 +77,7 @@ class UserCRUD:
 
         if refresh_session:
             await RefreshTokenDAO.delete(self.db, id=refresh_session.id)
+            await TokenCrud(self.db).revoke_tokens(refresh_session.user_id)
 
         response = JSONResponse(content={
             "message": "logout successful",
@@ -85,20 +90,47 @@ class UserCRUD:
 
         return response
 
-    async def get_existing_user(self, email: str = None, username: str = None, user_id: str = None, token: str = None) -> User:
+    async def get_existing_user(self, email: str = None, username: str = None, user_id: str = None, token: str = None) -> User | None:
 
         if not email and not username and not user_id and not token:
             raise exceptions.NoUserData
 
         if token:
-            user_id = await TokenCrud.get_access_token_payload(db=self.db, access_token=token)
+            user_id = await TokenCrud(self.db).get_access_token_payload(token)
 
-        user = await UserDAO.find_one_or_none(self.db, or_(
-            User.email == email,
-            User.username == username,
-            User.id == user_id))
+        # Отдельный запрос на каждый идентификатор, чтобы каждый шел по своему уникальному индексу
+        for field, value in (("id", user_id), ("username", username), ("email", email)):
+            if value:
+                user = await self._get_user_by(field, value)
+                if user:
+                    return user
 
-        return user
+        return None
+
+    async def get_user_by_id(self, user_id: str) -> User | None:
+        return await self._get_user_by("id", user_id)
+
+    async def get_user_by_username(self, username: str) -> User | None:
+        return await self._get_user_by("username", username)
+
+    async def get_user_by_email(self, email: str) -> User | None:
+        return await self._get_user_by("email", email)
+
+    async def _get_user_by(self, field: str, value: str) -> User | None:
+
+        column = getattr(User, field)
+
+        return await user_cache.get(field, value, lambda: UserDAO.find_one_or_none(self.db, column == value))
+
+    async def _notify_user_changed(self, user_id: str) -> None:
+
+        """ Уведомление другим воркерам; NOTIFY доставляется только при коммите транзакции """
+
+        if USER_CACHE_NOTIFY_ENABLED:
+            await self.db.execute(
+                text("SELECT pg_notify(:channel, :user_id)"),
+                {"channel": USER_CACHE_NOTIFY_CHANNEL, "user_id": user_id},
+            )
 
     # Получение списка всех пользователей с поддержкой пагинации
 
@@ -116,7 +148,7 @@ class UserCRUD:
 
     async def get_user_by_access_token(self, access_token: str) -> User | None:
 
-        user_id = await TokenCrud.get_access_token_payload(self.db, access_token=access_token)
+        user_id = await TokenCrud(self.db).get_access_token_payload(access_token)
 
         return await self.get_existing_user(user_id=user_id)
 
@@ -135,13 +167,11 @@ class UserCRUD:
         if refresh_token:
             await RefreshTokenDAO.delete(self.db, user_id=refresh_token.user_id)
 
-        await UserDAO.update(
-            self.db,
-            User.id == user.id,
-            obj_in={'is_active': False},
-        )
+        await TokenCrud(self.db).revoke_tokens(user.id)
+        await self._notify_user_changed(user.id)
 
         await self.db.commit()
+        user_cache.invalidate(user.id)
 
         return {"message": "Delete successful"}
 
@@ -160,12 +190,14 @@ class UserCRUD:
         if refresh_token:
             await RefreshTokenDAO.delete(self.db, user_id=refresh_token.user_id)
 
-        await UserDAO.delete(self.db, or_(
-            user_id == User.id,
-            username == User.username,
-            email == User.email))
+        await UserDAO.delete(self.db, User.id == user.id)
+        await self._notify_user_changed(user.id)
 
         await self.db.commit()
+        user_cache.invalidate(user.id)
+
+        # Версии у удаленного пользователя нет, его токены перестанут проходить проверку
+        token_cache.forget_user(user.id)
 
         return {"Message": "Delete was successful"}
 
@@ -177,12 +209,13 @@ class TokenCrud:
 
     # Функция для создания access токена с указанием срока действия
 
-    async def _create_access_token(self, data: str):
+    async def _create_access_token(self, data: str, version: int = 0):
 
         """ Создает access токен """
 
         data_dict = {
-            "sub": data
+            "sub": data,
+            "ver": version,
         }
 
         # Создание словаря с данными для кодирования
@@ -192,9 +225,8 @@ class TokenCrud:
         expire = datetime.utcnow() + timedelta(minutes=int(ACCESS_TOKEN_EXPIRE_MINUTES))
         to_encode.update({"exp": expire})
 
-        # Кодирование токена с использованием секретного ключа и алгоритма
-        encoded_jwt = jwt.encode(
-            to_encode, TOKEN_SECRET_KEY, algorithm=ALGORITHM)
+        # Подпись текущим ключом из хранилища (с kid) или общим секретом, если ключей нет
+        encoded_jwt = encode_access_token(to_encode, get_key_store())
 
         return encoded_jwt
 
@@ -206,7 +238,7 @@ class TokenCrud:
     async def create_tokens(self, user_id: str, response: Response, isDev: bool = False):
 
         # Создание access и refresh токенов на основе payload
-        access_token = await self._create_access_token(user_id)
+        access_token = await self._create_access_token(user_id, await self._get_token_version(user_id))
         refresh_token = await self._create_refresh_token()
 
         refresh_token_expires = timedelta(
@@ -242,28 +274,76 @@ class TokenCrud:
             httponly=True
         )
 
-    async def get_access_token_payload(db: AsyncSession, access_token: str):
+    async def get_access_token_payload(self, access_token: str) -> str:
+
+        """ Возвращает id пользователя из access токена
+
+        Проверенные токены берутся из кэша до истечения exp, отозванные отсекаются по версии.
+        """
+
+        verified = token_cache.get(access_token)
+
+        if verified is None:
+            verified = await self._decode_access_token(access_token)
+            token_cache.put(access_token, verified)
+
+        current_version = await self._get_token_version(verified.user_id)
+        if current_version is None or verified.version < current_version:
+            raise exceptions.InvalidToken
+
+        return verified.user_id
+
+    @staticmethod
+    async def _decode_access_token(access_token: str) -> VerifiedToken:
         try:
-            payload = jwt.decode(access_token,
-                                 TOKEN_SECRET_KEY,
-                                 algorithms=[ALGORITHM])
-            user_id = payload.get("sub")
-            return user_id
+            payload = await decode_access_token(access_token, get_key_store(), get_jwks_cache())
 
         except jwt.ExpiredSignatureError as e:
-            logger.opt(exception=e).critical("Error in delete_file")
+            logger.opt(exception=e).critical("Error in get_access_token_payload")
             raise exceptions.TokenExpired
 
-        except jwt.DecodeError as e:
+        except jwt.PyJWTError as e:
             logger.opt(exception=e).critical(
                 "Error in get_access_token_payload")
             raise exceptions.InvalidToken
 
+        if payload.get("sub") is None:
+            raise exceptions.InvalidToken
+
+        # Токены, выданные до появления версий, имеют версию 0
+        return VerifiedToken(
+            user_id=payload["sub"],
+            version=payload.get("ver", 0),
+            expires_at=payload.get("exp", 0),
+        )
+
+    async def _get_token_version(self, user_id: str) -> int | None:
+
+        version = token_cache.get_version(user_id)
+
+        if version is None:
+            version = await UserDAO.get_token_version(self.db, user_id)
+            if version is not None:
+                token_cache.set_version(user_id, version)
+
+        return version
+
+    async def revoke_tokens(self, user_id: str) -> None:
+
+        """ Отзывает все выданные пользователю access токены; коммитит вызывающий """
+
+        version = await UserDAO.increment_token_version(self.db, user_id)
+
+        # Свой воркер узнает о новой версии сразу, остальные - по истечении TOKEN_VERSION_TTL_SECONDS.
+        # Если транзакция откатится, кэш лишь временно отвергнет еще действующие токены
+        if version is not None:
+            token_cache.set_version(user_id, version)
+
     async def refresh_token(self, token: str, response: Response) -> schemas.Token:
 
         refresh_token_session, user = await self._check_refresh_token_session(token)
 
-        access_token = await self._create_access_token(data=user.id)
+        access_token = await self._create_access_token(data=user.id, version=user.token_version)
         refresh_token = await self._create_refresh_token()
 
         refresh_token_expires = timedelta(days=int(REFRESH_TOKEN_EXPIRE_DAYS))
@@ -292,7 +372,8 @@ class TokenCrud:
 
         if datetime.now(timezone.utc) >= refresh_token_session.created_at + timedelta(seconds=refresh_token_session.expires_at):
 
-            await RefreshTokenDAO.delete(id=refresh_token_session.id)
+            await RefreshTokenDAO.delete(self.db, id=refresh_token_session.id)
+            await self.db.commit()
             raise exceptions.TokenExpired
 
         user = await UserDAO.find_one_or_none(self.db, id=refresh_token_session.user_id)
@@ -302,6 +383,23 @@ class TokenCrud:
 
         return refresh_token_session, user
 
+    async def collect_expired_refresh_tokens(self, limit: int = REFRESH_TOKEN_SWEEP_BATCH_SIZE) -> int:
+
+        """ Удаляет пачку истекших refresh токенов, если очистку не ведет другой воркер
+
+        Блокировка транзакционная и берется на каждую пачку, поэтому соединение
+        между пачками спокойно возвращается в пул.
+        """
+
+        if not await RefreshTokenDAO.try_lock_sweep(self.db):
+            await self.db.rollback()
+            return 0
+
+        deleted = await RefreshTokenDAO.delete_expired(self.db, datetime.now(timezone.utc), limit)
+        await self.db.commit()
+
+        return deleted
+
 # Определение класса для управления всеми crud-классами
 
 
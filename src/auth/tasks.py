@@ -0,0 +1,38 @@
+import time
+
+from loguru import logger
+
+from ..database import async_session_maker
+from ..metrics import counter, histogram
+from .config import REFRESH_TOKEN_SWEEP_BATCH_SIZE
+from .service import DatabaseManager
+
+
+REFRESH_TOKENS_SWEPT = counter("refresh_tokens_swept_total", "Expired refresh tokens deleted by the sweeper")
+REFRESH_TOKEN_SWEEP_ROWS = histogram(
+    "refresh_token_sweep_rows", "Expired refresh tokens deleted per sweeper run",
+    buckets=(0, 10, 100, 1000, 10_000, 100_000, 1_000_000))
+REFRESH_TOKEN_SWEEP_SECONDS = histogram("refresh_token_sweep_seconds", "Duration of a sweeper run")
+
+
+async def sweep_refresh_tokens() -> None:
+    started = time.perf_counter()
+    total = 0
+
+    async with async_session_maker() as db:
+        token_crud = DatabaseManager(db).token_crud
+
+        # Неполная пачка - значит истекших больше нет или очистку ведет другой воркер
+        while True:
+            deleted = await token_crud.collect_expired_refresh_tokens(REFRESH_TOKEN_SWEEP_BATCH_SIZE)
+            total += deleted
+            REFRESH_TOKENS_SWEPT.inc(deleted)
+
+            if deleted < REFRESH_TOKEN_SWEEP_BATCH_SIZE:
+                break
+
+    REFRESH_TOKEN_SWEEP_ROWS.observe(total)
+    REFRESH_TOKEN_SWEEP_SECONDS.observe(time.perf_counter() - started)
+
+    if total:
+        logger.info(f"Deleted {total} expired refresh tokens")
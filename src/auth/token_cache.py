@@ -0,0 +1,72 @@
+import time
+
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .config import TOKEN_CACHE_SIZE, TOKEN_VERSION_TTL_SECONDS
+
+
+@dataclass(frozen=True)
+class VerifiedToken:
+    user_id: str
+    version: int
+    expires_at: float
+
+
+class TokenCache:
+
+    """ Кэш проверенных access токенов воркера
+
+    Подпись токена не меняется, поэтому проверенный payload можно хранить до exp.
+    Отзыв работает через версию токенов пользователя: она кэшируется на version_ttl секунд,
+    так что logout в другом воркере вступает в силу не позже чем через version_ttl.
+    """
+
+    def __init__(self, max_size: int, version_ttl: float):
+        self.max_size = max_size
+        self.version_ttl = version_ttl
+        self._tokens: OrderedDict[str, VerifiedToken] = OrderedDict()
+        self._versions: OrderedDict[str, tuple[int, float]] = OrderedDict()
+
+    def get(self, token: str) -> VerifiedToken | None:
+        verified = self._tokens.get(token)
+        if verified is None:
+            return None
+
+        if verified.expires_at <= time.time():
+            del self._tokens[token]
+            return None
+
+        self._tokens.move_to_end(token)
+        return verified
+
+    def put(self, token: str, verified: VerifiedToken) -> None:
+        self._tokens[token] = verified
+        self._tokens.move_to_end(token)
+
+        while len(self._tokens) > self.max_size:
+            self._tokens.popitem(last=False)
+
+    def get_version(self, user_id: str) -> int | None:
+        cached = self._versions.get(user_id)
+        if cached is None or cached[1] <= time.monotonic():
+            return None
+
+        return cached[0]
+
+    def set_version(self, user_id: str, version: int) -> None:
+        self._versions[user_id] = (version, time.monotonic() + self.version_ttl)
+        self._versions.move_to_end(user_id)
+
+        while len(self._versions) > self.max_size:
+            self._versions.popitem(last=False)
+
+    def forget_user(self, user_id: str) -> None:
+        self._versions.pop(user_id, None)
+
+    def clear(self) -> None:
+        self._tokens.clear()
+        self._versions.clear()
+
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_VERSION_TTL_SECONDS)
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import asyncpg
+
+from loguru import logger
+
+from ..config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+from .config import USER_CACHE_NOTIFY_CHANNEL, USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS
+from .models import User
+
+
+LOOKUP_FIELDS = ("id", "username", "email")
+
+
+class UserCache:
+
+    """ LRU пользователей воркера с поиском по id, username и email
+
+    Хранятся словари колонок, а не ORM объекты: объект привязан к сессии запроса,
+    поэтому на каждый hit собирается новый transient User.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._aliases: dict[tuple[str, str], str] = {}
+
+    async def get(self, field: str, value: str, loader: Callable[[], Awaitable[User | None]]) -> User | None:
+        row = self._get_row(field, value)
+
+        if row is None:
+            user = await loader()
+            if user is None:
+                return None
+
+            row = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+            self._put(row)
+
+        return User(**row)
+
+    def _get_row(self, field: str, value: str) -> dict | None:
+        user_id = value if field == "id" else self._aliases.get((field, value))
+        cached = self._users.get(user_id) if user_id is not None else None
+
+        if cached is None:
+            return None
+
+        row, expires_at = cached
+        if expires_at <= time.monotonic() or row[field] != value:
+            self.invalidate(user_id)
+            return None
+
+        self._users.move_to_end(user_id)
+        return row
+
+    def _put(self, row: dict) -> None:
+        self.invalidate(row["id"])
+
+        self._users[row["id"]] = (row, time.monotonic() + self.ttl)
+        for field in LOOKUP_FIELDS[1:]:
+            self._aliases[(field, row[field])] = row["id"]
+
+        while len(self._users) > self.max_size:
+            self.invalidate(next(iter(self._users)))
+
+    def invalidate(self, user_id: str) -> None:
+        cached = self._users.pop(user_id, None)
+        if cached is None:
+            return
+
+        for field in LOOKUP_FIELDS[1:]:
+            if self._aliases.get((field, cached[0][field])) == user_id:
+                del self._aliases[(field, cached[0][field])]
+
+    def clear(self) -> None:
+        self._users.clear()
+        self._aliases.clear()
+
+
+class UserCacheListener:
+
+    """ Сбрасывает кэш по NOTIFY из других воркеров на отдельном соединении asyncpg """
+
+    RECONNECT_DELAY = 5
+
+    def __init__(self, cache: UserCache, channel: str):
+        self.cache = cache
+        self.channel = channel
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="user_cache_listener")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self.cache.invalidate(payload)
+
+    async def _run(self) -> None:
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(
+                    host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASS, database=DB_NAME)
+
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(self.channel, self._on_notify)
+
+                # Пока соединения не было, уведомления могли потеряться
+                self.cache.clear()
+                await closed.wait()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.opt(exception=e).error("Error in user cache listener")
+
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+            self.cache.clear()
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+user_cache_listener = UserCacheListener(user_cache, USER_CACHE_NOTIFY_CHANNEL)
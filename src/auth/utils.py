@@ -1,8 +1,13 @@
-import hashlib
+import hmac
 import random
 import string
 
 from . import exceptions
+from .hashing import password_hasher
+
+
+PASSWORD_HASH_ITERATIONS = 100_000
+
 
 # Генерация случайной строки заданной длины
 async def get_random_string(length=16):
@@ -21,7 +26,7 @@ async def validate_password(password: str, hashed_password: str):
     salt, hashed = hashed_password.split("$")
 
     # Сравнение хешированного пароля
-    if not await hash_password(password, salt) == hashed:
+    if not hmac.compare_digest(await hash_password(password, salt), hashed):
         raise exceptions.InvalidAuthenthicationCredential
 
 
@@ -34,11 +39,8 @@ async def hash_password(password: str, salt: str = None):
     if salt is None:
         salt = await get_random_string()
 
-    # Применение хэш-функции PBKDF2 к паролю и соли
-    enc = hashlib.pbkdf2_hmac(
-        "sha256", password.encode(), salt.encode(), 100_000)
-
-    return enc.hex()
+    # PBKDF2 считается в отдельном пуле, event loop в это время обслуживает другие запросы
+    return await password_hasher.hash(password, salt, PASSWORD_HASH_ITERATIONS)
 
 
 async def get_hashed_password(password: str):
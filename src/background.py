@@ -0,0 +1,42 @@
+import asyncio
+
+from typing import Awaitable, Callable
+
+from loguru import logger
+
+
+class PeriodicTask:
+
+    """ Фоновая задача, которая запускается каждые interval секунд внутри воркера """
+
+    def __init__(self, name: str, func: Callable[[], Awaitable], interval: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.func()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.opt(exception=e).error(f"Error in periodic task {self.name}")
+
+            await asyncio.sleep(self.interval)
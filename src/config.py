@@ -15,3 +15,5 @@ TEST_DB_PORT = os.environ.get("TEST_DB_PORT")
 TEST_DB_NAME = os.environ.get("TEST_DB_NAME")
 TEST_DB_USER = os.environ.get("TEST_DB_USER")
 TEST_DB_PASS = os.environ.get("TEST_DB_PASS")
+
+BACKGROUND_TASKS_ENABLED = os.environ.get("BACKGROUND_TASKS_ENABLED", "true").lower() == "true"
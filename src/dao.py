@@ -1,8 +1,9 @@
-from typing import Any, Dict, Generic, List, Optional, TypeVar, Union
+from typing import Any, AsyncIterator, Callable, Dict, Generic, Iterator, List, Optional, Sequence, TypeVar, Union
 from fastapi import HTTPException
 from loguru import logger
 
-from sqlalchemy import delete, insert, select, update, func, desc
+from sqlalchemy import column, delete, insert, select, update, func, desc, literal, tuple_, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
@@ -14,6 +15,14 @@ ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
+# Строк в одном запросе пакетных методов; вместе с числом колонок ограничено лимитом
+# PostgreSQL на параметры запроса
+BULK_CHUNK_SIZE = 1000
+MAX_BIND_PARAMS = 32767
+
+# Строк, которые серверный курсор отдает за одно обращение при потоковом чтении
+STREAM_FETCH_SIZE = 1000
+
 
 class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
     model = None
@@ -49,6 +58,125 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             raise HTTPException(status_code=500, detail=msg)
 
 
+    @staticmethod
+    def _dump(obj_in: Union[CreateSchemaType, UpdateSchemaType, Dict[str, Any]]) -> Dict[str, Any]:
+        return obj_in if isinstance(obj_in, dict) else obj_in.model_dump(exclude_unset=True)
+
+    @staticmethod
+    def _chunks(rows: List[Dict[str, Any]], chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+        columns = max(len(row) for row in rows)
+        chunk_size = max(1, min(chunk_size, MAX_BIND_PARAMS // max(columns, 1)))
+
+        for start in range(0, len(rows), chunk_size):
+            yield rows[start:start + chunk_size]
+
+    @classmethod
+    async def add_many(
+        cls,
+        db: AsyncSession,
+        objs_in: Sequence[Union[CreateSchemaType, Dict[str, Any]]],
+        returning: bool = True,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> List[ModelType]:
+
+        """ Вставка многих строк: multi-VALUES на пачку вместо запроса на строку
+
+        С returning объекты возвращаются в порядке objs_in.
+        """
+
+        return await cls._insert_many(db, insert(cls.model), objs_in, returning, chunk_size)
+
+    @classmethod
+    async def upsert_many(
+        cls,
+        db: AsyncSession,
+        objs_in: Sequence[Union[CreateSchemaType, Dict[str, Any]]],
+        index_elements: list,
+        set_: Union[List[str], Callable[[Any], Dict[str, Any]], None] = None,
+        returning: bool = False,
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> List[ModelType]:
+
+        """ INSERT ... ON CONFLICT (index_elements) пачками
+
+        set_ - None (DO NOTHING, в returning попадут только вставленные строки), список колонок,
+        которые берутся из вставляемой строки, или функция от excluded, возвращающая выражения.
+        С set_ строки returning идут в порядке objs_in; с DO NOTHING порядок не гарантирован,
+        строки нужно сопоставлять по уникальному ключу.
+        """
+
+        stmt = pg_insert(cls.model)
+
+        if set_ is None:
+            stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+        else:
+            update_values = set_(stmt.excluded) if callable(set_) else {name: stmt.excluded[name] for name in set_}
+            stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=update_values)
+
+        # DO NOTHING не возвращает строк для конфликтов, а сортировка по параметрам ждет строку на каждый
+        return await cls._insert_many(db, stmt, objs_in, returning, chunk_size, ordered=set_ is not None)
+
+    @classmethod
+    async def _insert_many(
+        cls, db: AsyncSession, stmt, objs_in, returning: bool, chunk_size: int, ordered: bool = True,
+    ) -> List[ModelType]:
+        rows = [cls._dump(obj_in) for obj_in in objs_in]
+        if not rows:
+            return []
+
+        if returning:
+            # Строки, уже загруженные в сессию, обновляются значениями из RETURNING;
+            # sort_by_parameter_order возвращает их в порядке objs_in, даже если пачка делится на запросы
+            stmt = stmt.returning(cls.model, sort_by_parameter_order=ordered).execution_options(populate_existing=True)
+
+        result = []
+        for chunk in cls._chunks(rows, chunk_size):
+            # Список параметров SQLAlchemy отправляет как multi-VALUES (insertmanyvalues), в том числе с RETURNING
+            chunk_result = await db.execute(stmt, chunk)
+            if returning:
+                result += chunk_result.scalars().all()
+
+        return result
+
+    @classmethod
+    async def update_many(
+        cls,
+        db: AsyncSession,
+        objs_in: Sequence[Union[UpdateSchemaType, Dict[str, Any]]],
+        key: str = "id",
+        chunk_size: int = BULK_CHUNK_SIZE,
+    ) -> int:
+
+        """ Обновляет строки по ключу key: UPDATE ... FROM (VALUES ...) одним запросом на пачку
+
+        У всех строк должен быть одинаковый набор колонок; загруженные в сессию объекты не обновляются.
+        Возвращает число обновленных строк.
+        """
+
+        rows = [cls._dump(obj_in) for obj_in in objs_in]
+        if not rows:
+            return 0
+
+        names = list(rows[0])
+        if key not in names or any(set(row) != set(names) for row in rows):
+            raise ValueError(f"All rows must have the same columns including {key}")
+
+        table = cls.model.__table__
+        updated = 0
+
+        for chunk in cls._chunks(rows, chunk_size):
+            data = values(*[column(name, table.c[name].type) for name in names], name="updated").data(
+                [tuple(row[name] for name in names) for row in chunk])
+
+            result = await db.execute(
+                update(table)
+                .where(table.c[key] == data.c[key])
+                .values({name: data.c[name] for name in names if name != key})
+            )
+            updated += result.rowcount
+
+        return updated
+
     @classmethod
     async def find_one_or_none(cls, db: AsyncSession, *filter, **filter_by) -> Optional[ModelType]:
 
@@ -107,6 +235,93 @@ class BaseDAO(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         result = await db.execute(stmt)
         return result.scalars().all()
 
+    @classmethod
+    async def find_all_keyset(
+        cls,
+        db: AsyncSession,
+        *filter,
+        order_by: list,
+        after: tuple | None = None,
+        descending: bool = False,
+        limit: int = 100,
+    ) -> List[ModelType]:
+
+        """ Страница строк, следующих за ключом after, без OFFSET
+
+        order_by должен заканчиваться уникальной колонкой, тогда сравнение кортежей
+        однозначно продолжает выборку и идет по составному индексу с теми же колонками.
+        """
+
+        stmt = select(cls.model).filter(*filter)
+
+        if after is not None:
+            key = tuple_(*order_by)
+            position = tuple_(*(literal(value, column.type) for column, value in zip(order_by, after)))
+            stmt = stmt.filter(key < position if descending else key > position)
+
+        stmt = stmt.order_by(*(column.desc() if descending else column.asc() for column in order_by)).limit(limit)
+
+        result = await db.execute(stmt)
+        return result.scalars().all()
+
+    @classmethod
+    async def stream(
+        cls,
+        db: AsyncSession,
+        *filter,
+        columns: list | None = None,
+        order_by: list | None = None,
+        fetch_size: int = STREAM_FETCH_SIZE,
+        **filter_by
+    ) -> AsyncIterator[Any]:
+
+        """ Строки выборки по одной через серверный курсор; см. iter_batches """
+
+        async for batch in cls.iter_batches(
+                db, *filter, columns=columns, order_by=order_by, fetch_size=fetch_size, **filter_by):
+            for row in batch:
+                yield row
+
+    @classmethod
+    async def iter_batches(
+        cls,
+        db: AsyncSession,
+        *filter,
+        columns: list | None = None,
+        order_by: list | None = None,
+        fetch_size: int = STREAM_FETCH_SIZE,
+        **filter_by
+    ) -> AsyncIterator[List[Any]]:
+
+        """ Выборка пачками по fetch_size строк без лимита и без загрузки всего результата в память
+
+        Без columns отдаются объекты модели, с columns - легкие кортежи (Row) только с этими колонками.
+        Курсор живет в транзакции сессии: commit или rollback этой сессии до конца чтения его закрывает,
+        поэтому изменения по ходу чтения пишутся через другую сессию.
+        """
+
+        stmt = select(*columns) if columns else select(cls.model)
+        stmt = stmt.filter(*filter).filter_by(**filter_by)
+
+        if order_by:
+            stmt = stmt.order_by(*order_by)
+
+        async for batch in cls._stream_batches(db, stmt, fetch_size, scalars=not columns):
+            yield batch
+
+    @staticmethod
+    async def _stream_batches(db: AsyncSession, stmt, fetch_size: int, scalars: bool = False) -> AsyncIterator[List[Any]]:
+        # yield_per включает серверный курсор: строки приходят с сервера по fetch_size, а не все сразу
+        result = await db.stream(stmt.execution_options(yield_per=fetch_size))
+        if scalars:
+            result = result.scalars()
+
+        try:
+            async for batch in result.partitions(fetch_size):
+                yield batch
+        finally:
+            await result.close()
+
     @classmethod
     async def update(
         cls,
@@ -1,12 +1,66 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
+from src.api.config import (
+    BLOB_GC_INTERVAL_SECONDS,
+    DELETE_JOB_INTERVAL_SECONDS,
+    FOLDER_STATS_VERIFY_INTERVAL_SECONDS,
+    TRASH_PURGE_INTERVAL_SECONDS,
+    UPLOAD_SESSION_GC_INTERVAL_SECONDS,
+    USAGE_RECONCILE_INTERVAL_SECONDS,
+)
 from src.api.routers import router as api_router
+from src.api.signing import check_download_secret
+from src.api.tasks import collect_orphaned_blobs, collect_upload_sessions, purge_trash, reconcile_user_usage, run_delete_jobs, verify_folder_stats
+from src.auth.hashing import password_hasher
+from src.auth.rate_limit import rate_limiter
+from src.auth.config import REFRESH_TOKEN_SWEEP_INTERVAL_SECONDS, USER_CACHE_NOTIFY_ENABLED
 from src.auth.routers import router as auth_router
+from src.auth.tasks import sweep_refresh_tokens
+from src.auth.user_cache import user_cache_listener
+from src.background import PeriodicTask
+from src.config import BACKGROUND_TASKS_ENABLED
+from src.metrics import registry
+
+
+periodic_tasks = [
+    PeriodicTask("collect_upload_sessions", collect_upload_sessions, UPLOAD_SESSION_GC_INTERVAL_SECONDS),
+    PeriodicTask("run_delete_jobs", run_delete_jobs, DELETE_JOB_INTERVAL_SECONDS),
+    PeriodicTask("sweep_refresh_tokens", sweep_refresh_tokens, REFRESH_TOKEN_SWEEP_INTERVAL_SECONDS),
+    PeriodicTask("verify_folder_stats", verify_folder_stats, FOLDER_STATS_VERIFY_INTERVAL_SECONDS),
+    PeriodicTask("reconcile_user_usage", reconcile_user_usage, USAGE_RECONCILE_INTERVAL_SECONDS),
+    PeriodicTask("purge_trash", purge_trash, TRASH_PURGE_INTERVAL_SECONDS),
+    PeriodicTask("collect_orphaned_blobs", collect_orphaned_blobs, BLOB_GC_INTERVAL_SECONDS),
+]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    check_download_secret()
+
+    if BACKGROUND_TASKS_ENABLED:
+        for task in periodic_tasks:
+            task.start()
 
+    if USER_CACHE_NOTIFY_ENABLED:
+        user_cache_listener.start()
 
-app = FastAPI()
+    yield
+
+    for task in periodic_tasks:
+        await task.stop()
+
+    await user_cache_listener.stop()
+
+    password_hasher.shutdown()
+
+    await rate_limiter.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "*"
@@ -32,3 +86,8 @@ def home(request: Request):
     <a href="{str(request.url)}docs"><h1>Documentation</h1></a><br>
     <a href="{str(request.url)}redoc"><h1>ReDoc</h1></a>
     """
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return registry.render()
@@ -1,4 +1,6 @@
 import asyncio
+import os
+from secrets import token_hex
 from typing import AsyncGenerator
 
 import pytest
@@ -8,9 +10,14 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
+# Обязательные настройки приложения, которых может не быть в окружении тестов
+os.environ.setdefault("DOWNLOAD_URL_SECRET", "test-download-secret")
+
 from src.database import get_async_session, metadata
 from src.config import (TEST_DB_HOST, TEST_DB_NAME, TEST_DB_PASS, TEST_DB_PORT,
                         TEST_DB_USER)
+from src.auth import dependencies
+from src.auth.rate_limit import MemoryRateLimiter
 from src.main import app
 
 # DATABASE
@@ -47,6 +54,16 @@ def event_loop(request):
 #         yield ac
 
 
+@pytest.fixture(autouse=True)
+def rate_limiter(monkeypatch):
+
+    """ Свежий лимитер на каждый тест: все логины набора идут с 127.0.0.1 и иначе упираются в лимит по адресу """
+
+    limiter = MemoryRateLimiter(shards=1, max_keys=1000)
+    monkeypatch.setattr(dependencies, "rate_limiter", limiter)
+    return limiter
+
+
 @pytest.fixture
 async def client():
     host, port = "127.0.0.1", "8000"
@@ -58,4 +75,28 @@ async def client():
         yield client
 
 
+@pytest.fixture(scope="function")
+async def access_token_fixture(client: TestClient):
+    email = f"{token_hex(5)}@example.com"
+    username = token_hex(5)
+    password = token_hex(5)
+
+    data = {
+        "email": email,
+        "username": username,
+        "is_superuser": False,
+        "password": password
+    }
+
+    response = await client.post("/registration/", json=data)
+    assert response.status_code == 200
+
+    login_params = {
+        "username": username,
+        "password": password
+    }
+
+    login_response = await client.post("/login/", query_string=login_params)
+    assert login_response.status_code == 200
 
+    return login_response.json()["tokens"]["access_token"]
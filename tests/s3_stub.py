@@ -0,0 +1,102 @@
+from email.utils import formatdate
+from hashlib import md5
+from urllib.parse import parse_qs, unquote
+from uuid import uuid4
+from xml.etree import ElementTree
+
+
+class S3Stub:
+
+    """ Минимальная замена S3/MinIO для тестов: объекты, диапазоны, multipart и копирование """
+
+    def __init__(self, bucket: str, access_key: str):
+        self.bucket = bucket
+        self.access_key = access_key
+        self.objects: dict[str, bytes] = {}
+        self.uploads: dict[str, dict[int, bytes]] = {}
+
+    async def __call__(self, scope, receive, send):
+        method = scope["method"]
+        headers = {name.decode().lower(): value.decode() for name, value in scope["headers"]}
+        query = {name: values[0] for name, values in parse_qs(scope["query_string"].decode(), keep_blank_values=True).items()}
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        if not headers.get("authorization", "").startswith(f"AWS4-HMAC-SHA256 Credential={self.access_key}/"):
+            return await self._respond(send, 403)
+
+        bucket, _, key = unquote(scope["raw_path"].decode()).lstrip("/").partition("/")
+        if bucket != self.bucket:
+            return await self._respond(send, 404)
+
+        if method == "POST" and "uploads" in query:
+            upload_id = uuid4().hex
+            self.uploads[upload_id] = {}
+            return await self._respond(send, 200, f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>".encode())
+
+        if method == "POST" and "uploadId" in query:
+            parts = self.uploads.pop(query["uploadId"])
+            numbers = [int(element.text) for element in ElementTree.fromstring(body).iter("PartNumber")]
+            self.objects[key] = b"".join(parts[number] for number in numbers)
+            return await self._respond(send, 200, b"<CompleteMultipartUploadResult/>")
+
+        if method == "PUT" and "uploadId" in query:
+            if "x-amz-copy-source" in headers:
+                start, end = headers["x-amz-copy-source-range"].removeprefix("bytes=").split("-")
+                data = self._copy_source(headers)[int(start):int(end) + 1]
+                etag = f'"{md5(data).hexdigest()}"'
+                self.uploads[query["uploadId"]][int(query["partNumber"])] = data
+                return await self._respond(send, 200, f"<CopyPartResult><ETag>{etag}</ETag></CopyPartResult>".encode())
+
+            self.uploads[query["uploadId"]][int(query["partNumber"])] = body
+            return await self._respond(send, 200, headers={"etag": f'"{md5(body).hexdigest()}"'})
+
+        if method == "DELETE" and "uploadId" in query:
+            self.uploads.pop(query["uploadId"], None)
+            return await self._respond(send, 204)
+
+        if method == "PUT":
+            self.objects[key] = self._copy_source(headers) if "x-amz-copy-source" in headers else body
+            return await self._respond(send, 200)
+
+        if method == "DELETE":
+            self.objects.pop(key, None)
+            return await self._respond(send, 204)
+
+        if key not in self.objects:
+            return await self._respond(send, 404)
+
+        data = self.objects[key]
+        response_headers = {"last-modified": formatdate(usegmt=True), "content-length": str(len(data))}
+
+        if method == "HEAD":
+            return await self._respond(send, 200, headers=response_headers)
+
+        if "range" in headers:
+            start, end = headers["range"].removeprefix("bytes=").split("-")
+            data = data[int(start):int(end) + 1 if end else None]
+            response_headers["content-length"] = str(len(data))
+            return await self._respond(send, 206, data, response_headers)
+
+        return await self._respond(send, 200, data, response_headers)
+
+    def _copy_source(self, headers: dict[str, str]) -> bytes:
+        _, _, key = unquote(headers["x-amz-copy-source"]).lstrip("/").partition("/")
+        return self.objects[key]
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes = b"", headers: dict[str, str] | None = None):
+        headers = headers or {}
+        headers.setdefault("content-length", str(len(body)))
+
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.encode(), value.encode()) for name, value in headers.items()],
+        })
+        await send({"type": "http.response.body", "body": body})
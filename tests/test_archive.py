@@ -0,0 +1,45 @@
+import zipfile
+
+from io import BytesIO
+from secrets import token_bytes
+
+import pytest
+
+from src.api import archive
+from src.api.archive import ArchiveEntry, iter_zip
+from src.api.storage import LocalStorage
+
+
+async def _chunks(data: bytes, size: int = 1000):
+    for offset in range(0, len(data), size):
+        yield data[offset:offset + size]
+
+
+class TestArchive:
+
+    @pytest.mark.parametrize("force_zip64", [False, True])
+    async def test_iter_zip(self, tmp_path, monkeypatch, force_zip64):
+        if force_zip64:
+            monkeypatch.setattr(archive, "_needs_zip64", lambda size: True)
+
+        storage = LocalStorage(str(tmp_path))
+        text = b"hello world " * 10_000
+        image = token_bytes(5000)
+        await storage.put_stream("blobs/text", _chunks(text))
+        await storage.put_stream("blobs/image", _chunks(image))
+
+        entries = [
+            ArchiveEntry(name="docs/"),
+            ArchiveEntry(name="docs/readme.txt", key="blobs/text", size=len(text)),
+            ArchiveEntry(name="photo.jpg", key="blobs/image", size=len(image)),
+        ]
+        data = b"".join([chunk async for chunk in iter_zip(storage, entries)])
+
+        with zipfile.ZipFile(BytesIO(data)) as zf:
+            assert zf.testzip() is None
+            assert zf.namelist() == ["docs/", "docs/readme.txt", "photo.jpg"]
+            assert zf.getinfo("docs/").is_dir()
+            assert zf.getinfo("docs/readme.txt").compress_type == zipfile.ZIP_DEFLATED
+            assert zf.getinfo("photo.jpg").compress_type == zipfile.ZIP_STORED
+            assert zf.read("docs/readme.txt") == text
+            assert zf.read("photo.jpg") == image
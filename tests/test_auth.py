@@ -1,34 +1,47 @@
+import asyncio
+import threading
+import time
+
+from datetime import datetime, timedelta, timezone
+
 from secrets import token_hex
 
+import asyncpg
+import fakeredis
+import httpx
+import jwt
+
 import pytest
-from async_asgi_testclient import TestClient
 
+from async_asgi_testclient import TestClient
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
 
-@pytest.fixture(scope="function")
-async def access_token_fixture(client: TestClient):
-    email = f"{token_hex(5)}@example.com"
-    username = token_hex(5)
-    password = token_hex(5)
+from src.auth import dependencies, exceptions, hashing, service
+from src.auth.hashing import PasswordHasher, password_hasher, pbkdf2
+from src.auth.dao import RefreshTokenDAO, UserDAO
+from src.auth.models import Refresh_token
+from src.auth.rate_limit import MemoryRateLimiter, RateLimit, RedisRateLimiter
+from src.auth.service import TokenCrud
+from src.auth.tasks import REFRESH_TOKENS_SWEPT, sweep_refresh_tokens
+from src.auth.keys import JWKSCache, KeyStore, decode_access_token, encode_access_token
+from src.auth.token_cache import TokenCache, VerifiedToken
+from src.auth.user_cache import UserCache, UserCacheListener
+from src.config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
 
-    data = {
-        "email": email,
-        "username": username,
-        "is_superuser": False,
-        "password": password
-    }
+from .conftest import async_session_maker
 
-    response = await client.post("/registration/", json=data)
-    assert response.status_code == 200
 
-    login_params = {
-        "username": username,
-        "password": password
-    }
+def write_key(path, kid: str, private_key, public_only: bool = False) -> None:
+    if public_only:
+        data = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    else:
+        data = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
 
-    login_response = await client.post("/login/", query_string=login_params)
-    assert login_response.status_code == 200
+    (path / f"{kid}.pem").write_bytes(data)
 
-    return login_response.json()["tokens"]["access_token"]
 
 class TestAuth:
     
@@ -55,6 +68,318 @@ class TestAuth:
         response = await client.post("/login/", query_string=params)
         assert response.status_code == 200
 
+    async def test_logout_revokes_access_tokens(self, client: TestClient):
+        response = await client.post("/login/", query_string={"username": self.username, "password": self.password})
+        tokens = response.json()["tokens"]
+
+        response = await client.get("/get_folders", query_string={"token": tokens["access_token"]})
+        assert response.status_code == 200
+
+        response = await client.post("/logout/", headers={"Cookie": f"refresh_token={tokens['refresh_token']}"})
+        assert response.status_code == 200
+
+        response = await client.get("/get_folders", query_string={"token": tokens["access_token"]})
+        assert response.status_code == 401
+
+        response = await client.post("/login/", query_string={"username": self.username, "password": self.password})
+        response = await client.get("/get_folders", query_string={"token": response.json()["tokens"]["access_token"]})
+        assert response.status_code == 200
+
+    async def test_invalid_token(self, client: TestClient):
+        response = await client.get("/get_folders", query_string={"token": "not-a-token"})
+        assert response.status_code == 401
+
+    def test_token_cache(self):
+        cache = TokenCache(max_size=2, version_ttl=60)
+
+        cache.put("expired", VerifiedToken("user", 0, time.time() - 1))
+        assert cache.get("expired") is None
+
+        cache.put("a", VerifiedToken("user", 0, time.time() + 60))
+        cache.put("b", VerifiedToken("user", 0, time.time() + 60))
+        cache.get("a")
+        cache.put("c", VerifiedToken("user", 0, time.time() + 60))
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+
+        cache.set_version("user", 3)
+        assert cache.get_version("user") == 3
+        cache.forget_user("user")
+        assert cache.get_version("user") is None
+
+    async def test_user_lookups_are_cached(self, client: TestClient, monkeypatch):
+        calls = []
+        find_one_or_none = UserDAO.find_one_or_none.__func__
+
+        async def counting_find_one_or_none(cls, db, *filter, **filter_by):
+            calls.append(filter)
+            return await find_one_or_none(cls, db, *filter, **filter_by)
+
+        monkeypatch.setattr(UserDAO, "find_one_or_none", classmethod(counting_find_one_or_none))
+
+        response = await client.get("/get_user", query_string={"username": self.username})
+        user_id = response.json()["id"]
+
+        for params in ({"username": self.username}, {"email": self.email}, {"user_id": user_id}):
+            response = await client.get("/get_user", query_string=params)
+            assert response.json()["id"] == user_id
+
+        assert len(calls) <= 1
+
+    async def test_delete_user_invalidates_cache(self, client: TestClient):
+        username = token_hex(5)
+        data = {"email": f"{username}@example.com", "username": username, "is_superuser": False, "password": token_hex(5)}
+        await client.post("/registration/", json=data)
+
+        response = await client.get("/get_user", query_string={"username": username})
+        assert response.json()["username"] == username
+
+        response = await client.delete("/delete_user", query_string={"username": username})
+        assert response.status_code == 200
+
+        response = await client.get("/get_user", query_string={"username": username})
+        assert response.json() is None
+
+    async def test_user_cache_listener(self):
+        cache = UserCache(max_size=10, ttl=60)
+        cache._put({"id": "user", "username": "name", "email": "mail"})
+
+        listener = UserCacheListener(cache, f"test_{token_hex(4)}")
+        listener.start()
+        try:
+            connection = await asyncpg.connect(
+                host=DB_HOST, port=DB_PORT, user=DB_USER, password=DB_PASS, database=DB_NAME)
+            try:
+                # Слушатель сбрасывает кэш при подключении, после этого кладем запись снова
+                for _ in range(50):
+                    listeners = await connection.fetchval(
+                        "SELECT count(*) FROM pg_stat_activity WHERE query LIKE $1", f"LISTEN %{listener.channel}%")
+                    if listeners:
+                        break
+                    await asyncio.sleep(0.1)
+
+                cache._put({"id": "user", "username": "name", "email": "mail"})
+                await connection.execute("SELECT pg_notify($1, 'user')", listener.channel)
+
+                for _ in range(50):
+                    if cache._get_row("id", "user") is None:
+                        break
+                    await asyncio.sleep(0.1)
+
+                assert cache._get_row("username", "name") is None
+            finally:
+                await connection.close()
+        finally:
+            await listener.stop()
+
+    async def test_login_when_hasher_is_saturated(self, client: TestClient, monkeypatch):
+        monkeypatch.setattr(password_hasher, "pending", password_hasher.max_pending)
+
+        response = await client.post("/login/", query_string={"username": self.username, "password": self.password})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == str(password_hasher.retry_after)
+
+    @pytest.mark.parametrize("executor_type", ["thread", "process"])
+    async def test_password_hasher_executors(self, executor_type):
+        hasher = PasswordHasher(executor_type, max_workers=1, max_pending=2, retry_after=1)
+        try:
+            assert await hasher.hash("password", "salt", 1000) == pbkdf2("password", "salt", 1000)
+        finally:
+            hasher.shutdown()
+
+    async def test_password_hasher_counts_cancelled_work(self, monkeypatch):
+        release = threading.Event()
+        monkeypatch.setattr(hashing, "pbkdf2", lambda *args: release.wait(5) and "hash")
+
+        hasher = PasswordHasher("thread", max_workers=1, max_pending=1, retry_after=1)
+        try:
+            task = asyncio.create_task(hasher.hash("password", "salt", 1))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+            # Запрос отменен, но PBKDF2 в пуле еще идет и занимает место в очереди
+            with pytest.raises(exceptions.ServiceBusy):
+                await hasher.hash("password", "salt", 1)
+
+            release.set()
+            for _ in range(100):
+                if hasher.pending == 0:
+                    break
+                await asyncio.sleep(0.01)
+
+            assert hasher.pending == 0
+            assert await hasher.hash("password", "salt", 1) == "hash"
+        finally:
+            release.set()
+            hasher.shutdown()
+
+    async def test_key_rotation(self, tmp_path):
+        write_key(tmp_path, "2024-01", ed25519.Ed25519PrivateKey.generate(), public_only=True)
+        write_key(tmp_path, "2024-02", ec.generate_private_key(ec.SECP256R1()))
+        key_store = KeyStore.from_directory(str(tmp_path))
+
+        assert key_store.signing_kid == "2024-02"
+        assert {key["alg"] for key in key_store.jwks()["keys"]} == {"EdDSA", "ES256"}
+
+        token = encode_access_token({"sub": "user"}, key_store)
+        assert jwt.get_unverified_header(token) == {"alg": "ES256", "kid": "2024-02", "typ": "JWT"}
+        assert (await decode_access_token(token, key_store))["sub"] == "user"
+
+        with pytest.raises(ValueError):
+            KeyStore.from_directory(str(tmp_path), signing_kid="2024-01")
+
+        # Подмена алгоритма в заголовке не помогает: алгоритм берется из ключа
+        forged = jwt.encode({"sub": "user"}, "secret", algorithm="HS256", headers={"kid": "2024-02"})
+        with pytest.raises(jwt.PyJWTError):
+            await decode_access_token(forged, key_store)
+
+        with pytest.raises(jwt.InvalidKeyError):
+            await decode_access_token(jwt.encode({}, "secret", headers={"kid": "unknown"}), key_store)
+
+    async def test_jwks_cache(self, tmp_path):
+        write_key(tmp_path, "current", ed25519.Ed25519PrivateKey.generate())
+        key_store = KeyStore.from_directory(str(tmp_path))
+        requests = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests.append(request)
+            return httpx.Response(200, json=key_store.jwks())
+
+        cache = JWKSCache("http://api/.well-known/jwks.json", ttl=60, min_refresh=60, transport=httpx.MockTransport(handler))
+        verifier = KeyStore([])
+
+        token = encode_access_token({"sub": "user"}, key_store)
+        assert (await decode_access_token(token, verifier, cache))["sub"] == "user"
+        assert (await decode_access_token(token, verifier, cache))["sub"] == "user"
+
+        # Незнакомый kid не вызывает повторного запроса раньше min_refresh
+        with pytest.raises(jwt.InvalidKeyError):
+            await decode_access_token(jwt.encode({}, "secret", headers={"kid": "unknown"}), verifier, cache)
+
+        assert len(requests) == 1
+
+    async def test_login_with_asymmetric_keys(self, client: TestClient, tmp_path, monkeypatch):
+        write_key(tmp_path, "current", ed25519.Ed25519PrivateKey.generate())
+        key_store = KeyStore.from_directory(str(tmp_path))
+        monkeypatch.setattr(service, "get_key_store", lambda: key_store)
+
+        response = await client.post("/login/", query_string={"username": self.username, "password": self.password})
+        access_token = response.json()["tokens"]["access_token"]
+        assert jwt.get_unverified_header(access_token)["kid"] == "current"
+
+        response = await client.get("/get_folders", query_string={"token": access_token})
+        assert response.status_code == 200
+
+    async def _add_refresh_tokens(self, client: TestClient, ages: list[timedelta]) -> list[str]:
+        response = await client.get("/get_user", query_string={"username": self.username})
+        user_id = response.json()["id"]
+        tokens = [token_hex(16) for _ in ages]
+
+        async with async_session_maker() as db:
+            for token, age in zip(tokens, ages):
+                await RefreshTokenDAO.add(db, {
+                    "refresh_token": token,
+                    "expires_at": 60,
+                    "created_at": datetime.now(timezone.utc) - age,
+                    "user_id": user_id,
+                })
+            await db.commit()
+
+        return tokens
+
+    async def _refresh_token_exists(self, token: str) -> bool:
+        async with async_session_maker() as db:
+            return await RefreshTokenDAO.find_one_or_none(db, Refresh_token.refresh_token == token) is not None
+
+    async def test_sweep_refresh_tokens(self, client: TestClient):
+        expired, fresh = await self._add_refresh_tokens(client, [timedelta(days=1), timedelta(0)])
+        swept = REFRESH_TOKENS_SWEPT.value()
+
+        await sweep_refresh_tokens()
+
+        assert not await self._refresh_token_exists(expired)
+        assert await self._refresh_token_exists(fresh)
+        assert REFRESH_TOKENS_SWEPT.value() > swept
+
+    async def test_sweep_skips_when_locked(self, client: TestClient):
+        expired, = await self._add_refresh_tokens(client, [timedelta(days=1)])
+
+        async with async_session_maker() as other:
+            assert await RefreshTokenDAO.try_lock_sweep(other)
+
+            async with async_session_maker() as db:
+                assert await TokenCrud(db).collect_expired_refresh_tokens() == 0
+
+            await other.rollback()
+
+        assert await self._refresh_token_exists(expired)
+
+        async with async_session_maker() as db:
+            assert await TokenCrud(db).collect_expired_refresh_tokens() >= 1
+
+    async def test_refresh_with_expired_token(self, client: TestClient):
+        expired, = await self._add_refresh_tokens(client, [timedelta(days=1)])
+
+        response = await client.patch("/refresh_tokens", query_string={"token": expired})
+        assert response.status_code == 401
+        assert not await self._refresh_token_exists(expired)
+
+    async def test_memory_rate_limiter(self, monkeypatch):
+        limiter = MemoryRateLimiter(shards=4, max_keys=8)
+        limit = RateLimit(per_minute=60, burst=2)
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now)
+
+        assert await limiter.acquire("key", limit) == 0
+        assert await limiter.acquire("key", limit) == 0
+        assert await limiter.acquire("key", limit) == pytest.approx(1)
+        assert await limiter.acquire("other", limit) == 0
+
+        now += 1
+        assert await limiter.acquire("key", limit) == 0
+
+        for i in range(100):
+            await limiter.acquire(f"flood-{i}", limit)
+        assert sum(len(shard) for shard in limiter._shards) <= 8
+
+    async def test_redis_rate_limiter(self):
+        limiter = RedisRateLimiter(fakeredis.FakeAsyncRedis())
+        limit = RateLimit(per_minute=1, burst=1)
+
+        assert await limiter.acquire("key", limit) == 0
+        assert 0 < await limiter.acquire("key", limit) <= 60
+        assert await limiter.acquire("other", limit) == 0
+
+        await limiter.close()
+
+    async def test_login_rate_limit(self, client: TestClient, monkeypatch):
+        monkeypatch.setattr(dependencies, "LOGIN_USERNAME_LIMIT", RateLimit(per_minute=1, burst=1))
+        params = {"username": token_hex(5), "password": token_hex(5)}
+
+        response = await client.post("/login/", query_string=params)
+        assert response.status_code != 429
+
+        response = await client.post("/login/", query_string=params)
+        assert response.status_code == 429
+        assert 0 < int(response.headers["retry-after"]) <= 60
+
+    async def test_refresh_rate_limit(self, client: TestClient, monkeypatch):
+        monkeypatch.setattr(dependencies, "REFRESH_TOKEN_LIMIT", RateLimit(per_minute=1, burst=1))
+        token = token_hex(16)
+
+        response = await client.patch("/refresh_tokens", query_string={"token": token})
+        assert response.status_code == 401
+
+        response = await client.patch("/refresh_tokens", query_string={"token": token})
+        assert response.status_code == 429
+
+    async def test_jwks_endpoint(self, client: TestClient):
+        response = await client.get("/.well-known/jwks.json")
+        assert response.status_code == 200
+        assert "keys" in response.json()
+        assert response.headers["cache-control"].startswith("public")
         
     async def test_create_folder(self, client: TestClient, access_token_fixture):
         # Проверка, что у нас есть access_token от предыдущего теста
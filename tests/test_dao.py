@@ -0,0 +1,116 @@
+import hashlib
+import os
+
+from secrets import token_hex
+
+import pytest
+from sqlalchemy import event
+
+from src.api.dao import BlobDAO, FileDAO
+from src.api.models import Blob
+from src.api.schemas import CreateFile
+from src.auth.dao import UserDAO
+
+from .conftest import async_session_maker, engine_test
+
+
+def _blobs(count: int) -> list[dict]:
+    return [{"hash": hashlib.sha256(os.urandom(16)).hexdigest(), "size": i} for i in range(count)]
+
+
+@pytest.fixture
+async def db():
+    async with async_session_maker() as session:
+        yield session
+        await session.rollback()
+
+
+class TestBulkDAO:
+
+    async def test_add_many_in_chunks(self, db):
+        rows = _blobs(25)
+        rows[3]["ref_count"] = 5
+
+        added = await BlobDAO.add_many(db, rows, chunk_size=10)
+        assert [blob.hash for blob in added] == [row["hash"] for row in rows]
+        assert (added[3].ref_count, added[4].ref_count) == (5, 0)
+
+        assert await BlobDAO.add_many(db, _blobs(3), returning=False) == []
+        assert await BlobDAO.add_many(db, []) == []
+
+    async def test_upsert_many(self, db):
+        rows = _blobs(5)
+        await BlobDAO.add_many(db, rows[:2], returning=False)
+
+        # DO NOTHING: в результат попадают только вставленные строки
+        inserted = await BlobDAO.upsert_many(db, rows, index_elements=[Blob.hash], returning=True, chunk_size=2)
+        assert sorted(blob.hash for blob in inserted) == sorted(row["hash"] for row in rows[2:])
+
+        updated = await BlobDAO.upsert_many(
+            db, [{**row, "size": 100, "ref_count": 2} for row in rows[:2]], index_elements=[Blob.hash], set_=["size"],
+            returning=True)
+        assert [(blob.size, blob.ref_count) for blob in updated] == [(100, 0), (100, 0)]
+
+        counted = await BlobDAO.upsert_many(
+            db, [{**rows[0], "ref_count": 3}], index_elements=[Blob.hash],
+            set_=lambda excluded: {"ref_count": Blob.ref_count + excluded.ref_count}, returning=True)
+        assert counted[0].ref_count == 3
+
+    async def test_upsert_many_skips_conflicts(self, db):
+        user = await UserDAO.add(db, {
+            "id": token_hex(8), "email": f"{token_hex(5)}@example.com", "username": token_hex(5), "hashed_password": "-"})
+
+        def create_file(name: str) -> CreateFile:
+            return CreateFile(id=token_hex(8), file_name=name, file_extension="bin", file_path=f"/{user.id}/{name}.bin",
+                              file_size=1, user_id=user.id)
+
+        await FileDAO.add_new(db, [create_file("taken")])
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine_test.sync_engine, "before_cursor_execute", listener)
+        try:
+            # Занятый путь не возвращает строку: остальные файлы пачки вставляются тем же запросом
+            inserted = await FileDAO.add_new(db, [create_file("a"), create_file("taken"), create_file("b")])
+        finally:
+            event.remove(engine_test.sync_engine, "before_cursor_execute", listener)
+
+        assert sorted(file.file_name for file in inserted) == ["a", "b"]
+        assert len(statements) == 1
+
+    async def test_update_many(self, db):
+        rows = _blobs(7)
+        await BlobDAO.add_many(db, rows, returning=False)
+
+        changed = [{"hash": row["hash"], "size": row["size"] + 10} for row in rows[:5]]
+        assert await BlobDAO.update_many(db, changed, key="hash", chunk_size=2) == 5
+
+        blobs = {blob.hash: blob.size for blob in await BlobDAO.find_all(db, Blob.hash.in_([row["hash"] for row in rows]))}
+        assert [blobs[row["hash"]] for row in rows] == [10, 11, 12, 13, 14, 5, 6]
+
+        with pytest.raises(ValueError):
+            await BlobDAO.update_many(db, [{"hash": rows[0]["hash"], "size": 1}, {"hash": rows[1]["hash"]}], key="hash")
+
+
+class TestStreamDAO:
+
+    async def test_iter_batches(self, db):
+        rows = _blobs(25)
+        await BlobDAO.add_many(db, rows, returning=False)
+        hashes = [row["hash"] for row in rows]
+
+        batches = [batch async for batch in BlobDAO.iter_batches(db, Blob.hash.in_(hashes), fetch_size=10)]
+        assert [len(batch) for batch in batches] == [10, 10, 5]
+        assert sorted(blob.hash for batch in batches for blob in batch) == sorted(hashes)
+        assert all(isinstance(blob, Blob) for batch in batches for blob in batch)
+
+    async def test_stream_columns(self, db):
+        rows = _blobs(7)
+        await BlobDAO.add_many(db, rows, returning=False)
+
+        streamed = [row async for row in BlobDAO.stream(
+            db, Blob.hash.in_([row["hash"] for row in rows]),
+            columns=[Blob.hash, Blob.size], order_by=[Blob.size.desc()], fetch_size=3)]
+
+        assert [tuple(row) for row in streamed] == [(row["hash"], row["size"]) for row in reversed(rows)]
+        assert streamed[0].size == 6
@@ -0,0 +1,743 @@
+import asyncio
+import hashlib
+import os
+import time
+import zipfile
+
+from io import BytesIO
+from secrets import token_bytes, token_hex
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from async_asgi_testclient import TestClient
+
+from sqlalchemy import func, update
+
+from src.api import service
+from src.api.dao import FolderDAO, UserUsageDAO
+from src.api.models import DeleteJob, Folder, FolderStats, UserUsage
+from src.api.service import BlobService, FileManager
+from src.api.signing import check_download_secret, sign_download
+from src.api.storage import get_storage
+from src.api.tasks import collect_orphaned_blobs, purge_trash, reconcile_user_usage, run_delete_jobs
+
+from .conftest import async_session_maker
+
+
+def _multipart(field_name: str, files: list[tuple[str, bytes]]) -> tuple[bytes, str]:
+
+    """ async_asgi_testclient не умеет несколько файлов в одном поле, собираем тело сами """
+
+    boundary = token_hex(16)
+    body = b"".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field_name}"; filename="{name}"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n".encode() + content + b"\r\n"
+        for name, content in files
+    ) + f"--{boundary}--\r\n".encode()
+
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class TestFiles:
+
+    async def test_upload_file(self, client: TestClient, access_token_fixture):
+        # Файл больше одного чанка, чтобы проверить потоковую запись
+        content = token_bytes(3 * 1024 * 1024 + 17)
+        file_name = f"{token_hex(5)}.bin"
+
+        response = await client.post(
+            "/upload_file",
+            query_string={"token": access_token_fixture},
+            files={"file": (file_name, BytesIO(content), "application/octet-stream")}
+        )
+        assert response.status_code == 200
+
+        db_file = response.json()
+        assert db_file["file_size"] == len(content)
+
+        response = await client.get(f"/get_file/{db_file['id']}", query_string={"token": access_token_fixture})
+        assert response.content == content
+
+        stored = await get_storage().stat(BlobService.get_blob_key(db_file["blob_hash"]))
+        assert stored.size == len(content)
+
+    async def test_upload_duplicate_content(self, client: TestClient, access_token_fixture):
+        content = token_bytes(1024)
+        token = {"token": access_token_fixture}
+
+        db_files = []
+        for _ in range(2):
+            response = await client.post(
+                "/upload_file",
+                query_string=token,
+                files={"file": (f"{token_hex(5)}.bin", BytesIO(content), "application/octet-stream")}
+            )
+            assert response.status_code == 200
+            db_files.append(response.json())
+
+        blob_hash = db_files[0]["blob_hash"]
+        assert blob_hash == db_files[1]["blob_hash"]
+        assert await get_storage().stat(BlobService.get_blob_key(blob_hash)) is not None
+
+        response = await client.delete("/delete_file", query_string={**token, "file_id": db_files[0]["id"]})
+        assert response.status_code == 200
+        assert await get_storage().stat(BlobService.get_blob_key(blob_hash)) is not None
+
+        response = await client.get(f"/get_file/{db_files[1]['id']}", query_string=token)
+        assert response.content == content
+
+        response = await client.delete("/delete_file", query_string={**token, "file_id": db_files[1]["id"], "permanent": "true"})
+        assert response.status_code == 200
+        # Первый файл еще в корзине и держит blob
+        assert await get_storage().stat(BlobService.get_blob_key(blob_hash)) is not None
+
+        await client.delete("/empty_trash", query_string=token)
+        await purge_trash()
+        # Объект удаляет сборщик, а не транзакция, которая освободила blob
+        assert await get_storage().stat(BlobService.get_blob_key(blob_hash)) is not None
+
+        await collect_orphaned_blobs()
+        assert await get_storage().stat(BlobService.get_blob_key(blob_hash)) is None
+
+    async def test_released_blob_survives_rollback(self, client: TestClient, access_token_fixture):
+        token = {"token": access_token_fixture}
+
+        response = await client.post(
+            "/upload_file",
+            query_string=token,
+            files={"file": (f"{token_hex(5)}.bin", BytesIO(token_bytes(512)), "application/octet-stream")}
+        )
+        db_file = response.json()
+        blob_key = BlobService.get_blob_key(db_file["blob_hash"])
+
+        async with async_session_maker() as db:
+            await BlobService(db, get_storage()).release(db_file["blob_hash"])
+            await db.rollback()
+
+        await collect_orphaned_blobs()
+        assert await get_storage().stat(blob_key) is not None
+
+        response = await client.get(f"/get_file/{db_file['id']}", query_string=token)
+        assert response.status_code == 200
+
+    async def test_upload_session(self, client: TestClient, access_token_fixture):
+        chunk_size = 256 * 1024
+        content = token_bytes(3 * chunk_size + 100)
+        token = {"token": access_token_fixture}
+
+        response = await client.post(
+            "/create_upload_session",
+            query_string=token,
+            json={"file_name": f"{token_hex(5)}.bin", "file_size": len(content), "chunk_size": chunk_size}
+        )
+        assert response.status_code == 200
+
+        session = response.json()
+        assert session["chunk_count"] == 4
+        assert session["missing"] == [0, 1, 2, 3]
+
+        # Чанки приходят не по порядку
+        for chunk_index in (3, 1, 0):
+            offset = chunk_index * chunk_size
+            response = await client.put(
+                f"/upload_chunk/{session['id']}/{chunk_index}",
+                query_string=token,
+                data=content[offset:offset + chunk_size]
+            )
+            assert response.status_code == 200
+
+        response = await client.post(f"/finalize_upload_session/{session['id']}", query_string=token)
+        assert response.status_code == 409
+
+        response = await client.get(f"/get_upload_session/{session['id']}", query_string=token)
+        assert response.json()["missing"] == [2]
+        assert [chunk["offset"] for chunk in response.json()["received"]] == [0, chunk_size, 3 * chunk_size]
+
+        response = await client.put(
+            f"/upload_chunk/{session['id']}/2", query_string=token, data=content[:chunk_size + 1])
+        assert response.status_code == 400
+
+        response = await client.put(
+            f"/upload_chunk/{session['id']}/2", query_string=token, data=content[2 * chunk_size:3 * chunk_size])
+        assert response.status_code == 200
+
+        response = await client.post(f"/finalize_upload_session/{session['id']}", query_string=token)
+        assert response.status_code == 200
+
+        db_file = response.json()
+        assert db_file["file_size"] == len(content)
+
+        response = await client.get(f"/get_file/{db_file['id']}", query_string=token)
+        assert response.content == content
+
+        response = await client.get(f"/get_upload_session/{session['id']}", query_string=token)
+        assert response.status_code == 404
+
+    async def test_get_file_ranges_and_validators(self, client: TestClient, access_token_fixture):
+        content = token_bytes(10_000)
+        token = {"token": access_token_fixture}
+
+        response = await client.post(
+            "/upload_file",
+            query_string=token,
+            files={"file": (f"{token_hex(5)}.bin", BytesIO(content), "application/octet-stream")}
+        )
+        db_file = response.json()
+        url = f"/get_file/{db_file['id']}"
+
+        response = await client.get(url, query_string=token)
+        etag = response.headers["etag"]
+        assert etag == f'"{db_file["blob_hash"]}"'
+        assert response.headers["accept-ranges"] == "bytes"
+
+        response = await client.get(url, query_string=token, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        response = await client.get(
+            url, query_string=token, headers={"If-Modified-Since": response.headers["last-modified"]})
+        assert response.status_code == 304
+
+        response = await client.get(url, query_string=token, headers={"Range": "bytes=100-199"})
+        assert response.status_code == 206
+        assert response.headers["content-range"] == "bytes 100-199/10000"
+        assert response.content == content[100:200]
+
+        response = await client.get(url, query_string=token, headers={"Range": "bytes=0-9,-10"})
+        assert response.status_code == 206
+        assert response.headers["content-type"].startswith("multipart/byteranges")
+        assert int(response.headers["content-length"]) == len(response.content)
+        assert content[:10] in response.content and content[-10:] in response.content
+
+        response = await client.get(url, query_string=token, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        assert response.status_code == 200
+        assert response.content == content
+
+        response = await client.get(url, query_string=token, headers={"Range": "bytes=0-9", "If-Range": etag})
+        assert response.status_code == 206
+
+        response = await client.get(url, query_string=token, headers={"Range": "bytes=20000-"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == "bytes */10000"
+
+    async def test_signed_download_link(self, client: TestClient, access_token_fixture):
+        content = token_bytes(4096)
+
+        response = await client.post(
+            "/upload_file",
+            query_string={"token": access_token_fixture},
+            files={"file": (f"{token_hex(5)}.txt", BytesIO(content), "text/plain")}
+        )
+        db_file = response.json()
+
+        response = await client.get(
+            f"/get_file_link/{db_file['id']}", query_string={"token": access_token_fixture, "expires_in": 60})
+        assert response.status_code == 200
+
+        url = urlsplit(response.json()["url"])
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+        # Ссылка работает без токена
+        response = await client.get(url.path, query_string=params)
+        assert response.status_code == 200
+        assert response.content == content
+        assert response.headers["etag"] == f'"{db_file["blob_hash"]}"'
+        assert response.headers["content-type"].startswith("text/plain")
+
+        response = await client.get(url.path, query_string=params, headers={"Range": "bytes=0-9"})
+        assert response.status_code == 206
+        assert response.content == content[:10]
+
+        response = await client.get(url.path, query_string={**params, "name": "other.txt"})
+        assert response.status_code == 403
+
+        expires = int(time.time()) - 1
+        expired = {**params, "expires": expires, "signature": sign_download(
+            db_file["id"], params["key"], params["name"], expires)}
+        response = await client.get(url.path, query_string=expired)
+        assert response.status_code == 403
+
+    async def test_download_secret_required(self):
+        with pytest.raises(RuntimeError):
+            check_download_secret(None)
+
+        check_download_secret("secret")
+
+    async def test_download_folder(self, client: TestClient, access_token_fixture):
+        token = {"token": access_token_fixture}
+
+        async def create_folder(name: str, parent_folder_id: int | None = None) -> int:
+            response = await client.post(
+                "/create_folder", query_string=token,
+                json={"folder_name": name, "parent_folder_id": parent_folder_id})
+            assert response.status_code == 200
+            return response.json()["db_folder"]["id"]
+
+        async def upload(name: str, content: bytes, folder_id: int | None = None):
+            query = {**token, "folder_id": folder_id} if folder_id else token
+            response = await client.post(
+                "/upload_file", query_string=query,
+                files={"file": (name, BytesIO(content), "application/octet-stream")})
+            assert response.status_code == 200
+
+        root_id = await create_folder(token_hex(5))
+        nested_id = await create_folder("nested", root_id)
+        await create_folder("empty", nested_id)
+
+        text, image = b"text " * 1000, token_bytes(2048)
+        await upload("notes.txt", text, root_id)
+        await upload("photo.jpg", image, nested_id)
+        await upload(f"{token_hex(5)}.txt", b"outside", None)
+
+        response = await client.get("/download_folder", query_string={**token, "folder_id": root_id})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+
+        with zipfile.ZipFile(BytesIO(response.content)) as zf:
+            assert zf.testzip() is None
+            assert sorted(zf.namelist()) == ["nested/", "nested/empty/", "nested/photo.jpg", "notes.txt"]
+            assert zf.read("notes.txt") == text
+            assert zf.read("nested/photo.jpg") == image
+
+        response = await client.get("/download_folder", query_string={**token, "folder_id": 10 ** 9})
+        assert response.status_code == 404
+
+    async def test_upload_files_batch(self, client: TestClient, access_token_fixture):
+        token = {"token": access_token_fixture}
+        prefix = token_hex(5)
+        shared = token_bytes(512)
+
+        response = await client.post(
+            "/upload_file", query_string=token,
+            files={"file": (f"{prefix}existing.bin", BytesIO(b"existing"), "application/octet-stream")})
+        assert response.status_code == 200
+
+        batch = [
+            (f"{prefix}a.bin", shared),
+            (f"{prefix}b.bin", shared),
+            (f"{prefix}c.bin", token_bytes(2048)),
+            (f"{prefix}a.bin", b"same name"),
+            ("no_extension", b"bad name"),
+            (f"{prefix}existing.bin", b"taken"),
+        ]
+        body, content_type = _multipart("files", batch)
+        response = await client.post(
+            "/upload_files", query_string=token, data=body, headers={"Content-Type": content_type})
+        assert response.status_code == 200
+
+        result = response.json()
+        assert (result["uploaded"], result["failed"]) == (3, 3)
+
+        items = result["files"]
+        assert [item["error"] is None for item in items] == [True, True, True, False, False, False]
+        assert items[0]["blob_hash"] == items[1]["blob_hash"]
+
+        for (_, content), item in zip(batch[:3], items[:3]):
+            response = await client.get(f"/get_file/{item['file_id']}", query_string=token)
+            assert response.content == content
+
+        # Ссылки на blob учтены для обоих файлов с одинаковым содержимым
+        response = await client.delete("/delete_file", query_string={**token, "file_id": items[0]["file_id"]})
+        assert response.status_code == 200
+        assert await get_storage().stat(BlobService.get_blob_key(items[1]["blob_hash"])) is not None
+
+    async def test_folder_files_cursor_pagination(self, client: TestClient, access_token_fixture):
+        token = {"token": access_token_fixture}
+        sizes = [5, 1, 3, 3, 3, 8, 2]
+
+        body, content_type = _multipart("files", [(f"{i}.bin", token_bytes(size)) for i, size in enumerate(sizes)])
+        response = await client.post(
+            "/upload_files", query_string=token, data=body, headers={"Content-Type": content_type})
+        assert response.json()["uploaded"] == len(sizes)
+
+        for order_by, descending in (("size", False), ("name", True), ("created_at", True)):
+            params = {**token, "order_by": order_by, "descending": str(descending).lower(), "limit": 2}
+            pages = []
+
+            while True:
+                response = await client.get("/get_folder_files", query_string=params)
+                assert response.status_code == 200
+                pages.append(response.json())
+
+                if "x-next-cursor" not in response.headers:
+                    break
+                params["cursor"] = response.headers["x-next-cursor"]
+
+            files = [file for page in pages for file in page]
+            assert len(pages) == 4
+            assert len({file["id"] for file in files}) == len(sizes)
+
+            column = {"size": "file_size", "name": "file_name", "created_at": "created_at"}[order_by]
+            keys = [(file[column], file["id"]) for file in files]
+            assert keys == sorted(keys, reverse=descending)
+
+        # Курсор от другой сортировки не принимается
+        response = await client.get("/get_folder_files", query_string={**params, "order_by": "size"})
+        assert response.status_code == 400
+
+    async def test_move_folder_subtree(self, client: TestClient, access_token_fixture):
+        token = {"token": access_token_fixture}
+
+        folder_ids = []
+        for name in ("a", "b", "c"):
+            parent = {"parent_folder_id": folder_ids[-1]} if folder_ids else {}
+            response = await client.post("/create_folder", query_string=token, json={"folder_name": name, **parent})
+            folder_ids.append(response.json()["db_folder"]["id"])
+        a, b, c = folder_ids
+
+        response = await client.post(
+            "/upload_file", query_string={**token, "folder_id": c},
+            files={"file": ("deep.bin", BytesIO(b"deep"), "application/octet-stream")})
+        file_id = response.json()["id"]
+
+        response = await client.get("/get_folder_ancestors", query_string={**token, "folder_id": c})
+        assert [folder["id"] for folder in response.json()] == [a, b, c]
+
+        response = await client.patch("/move_folder", query_string={**token, "folder_id": a, "parent_folder_id": c})
+        assert response.status_code == 400
+
+        response = await client.patch("/move_folder", query_string={**token, "folder_id": b})
+        assert response.status_code == 200
+        assert response.json()["parent_folder_id"] is None
+
+        response = await client.get("/get_folder_ancestors", query_string={**token, "folder_id": c})
+        assert [folder["folder_name"] for folder in response.json()] == ["b", "c"]
+        assert response.json()[-1]["folder_path"].endswith("/b/c")
+
+        response = await client.get("/get_folder_files", query_string={**token, "folder_id": c})
+        assert [file["file_path"] for file in response.json()][0].endswith("/b/c/deep.bin")
+
+        response = await client.get(f"/get_file/{file_id}", query_string=token)
+        assert response.content == b"deep"
+
+    async def test_delete_folder_recursively(self, client: TestClient, access_token_fixture):
+        token = {"token": access_token_fixture}
+        unique = token_bytes(256)
+
+        response = await client.post("/create_folder", query_string=token, json={"folder_name": "trash"})
+        root_id = response.json()["db_folder"]["id"]
+        response = await client.post(
+            "/create_folder", query_string=token, json={"folder_name": "inner", "parent_folder_id": root_id})
+        inner_id = response.json()["db_folder"]["id"]
+
+        file_ids = []
+        for folder_id, name, content in ((root_id, "a.bin", unique), (inner_id, "b.bin", b"kept"), (inner_id, "c.bin", unique)):
+            response = await client.post(
+                "/upload_file", query_string={**token, "folder_id": folder_id},
+                files={"file": (name, BytesIO(content), "application/octet-stream")})
+            file_ids.append(response.json()["id"])
+
+        # Файл из корзины удаляется вместе с папкой и входит в прогресс
+        response = await client.post(
+            "/upload_file", query_string={**token, "folder_id": inner_id},
+            files={"file": ("d.bin", BytesIO(b"trashed"), "application/octet-stream")})
+        await client.delete("/delete_file", query_string={**token, "file_id": response.json()["id"]})
+
+        # Такое же содержимое вне папки не должно пострадать
+        response = await client.post(
+            "/upload_file", query_string=token, files={"file": ("outside.bin", BytesIO(b"kept"), "application/octet-stream")})
+        outside_id = response.json()["id"]
+
+        response = await client.delete("/delete_folder", query_string={**token, "folder_id": root_id})
+        assert response.status_code == 202
+        job = response.json()
+        assert (job["status"], job["total_files"]) == ("pending", 4)
+
+        # Поддерево сразу скрыто, а имя свободно
+        response = await client.get("/get_folders", query_string=token)
+        assert root_id not in [folder["id"] for folder in response.json()]
+        response = await client.get(f"/get_file/{file_ids[1]}", query_string=token)
+        assert response.status_code == 404
+        response = await client.post("/create_folder", query_string=token, json={"folder_name": "trash"})
+        assert response.status_code == 200
+
+        await run_delete_jobs()
+
+        response = await client.get(f"/delete_jobs/{job['id']}", query_string=token)
+        assert (response.json()["status"], response.json()["deleted_files"]) == ("done", 4)
+
+        await collect_orphaned_blobs()
+        assert await get_storage().stat(BlobService.get_blob_key(hashlib.sha256(unique).hexdigest())) is None
+        response = await client.get(f"/get_file/{outside_id}", query_string=token)
+        assert response.content == b"kept"
+
+        async with async_session_maker() as db:
+            assert not await FolderDAO.find_all(db, Folder.id.in_([root_id, inner_id]))
+
+    async def test_delete_job_retries_after_error(self, client: TestClient, access_token_fixture, monkeypatch):
+        token = {"token": access_token_fixture}
+
+        response = await client.post("/create_folder", query_string=token, json={"folder_name": "flaky"})
+        folder_id = response.json()["db_folder"]["id"]
+        for name in ("a.bin", "b.bin"):
+            await client.post(
+                "/upload_file", query_string={**token, "folder_id": folder_id},
+                files={"file": (name, BytesIO(token_bytes(64)), "application/octet-stream")})
+
+        job = (await client.delete("/delete_folder", query_string={**token, "folder_id": folder_id})).json()
+
+        release_many = BlobService.release_many
+
+        async def fail_once(self, blobs):
+            monkeypatch.setattr(BlobService, "release_many", release_many)
+            raise RuntimeError("storage is unavailable")
+
+        monkeypatch.setattr(BlobService, "release_many", fail_once)
+
+        # Пачка упала: задача снова ждет, но не раньше паузы
+        await run_delete_jobs()
+        job = (await client.get(f"/delete_jobs/{job['id']}", query_string=token)).json()
+        assert (job["status"], job["attempts"], job["error"]) == ("pending", 1, "storage is unavailable")
+
+        await run_delete_jobs()
+        assert (await client.get(f"/delete_jobs/{job['id']}", query_string=token)).json()["attempts"] == 1
+
+        async with async_session_maker() as db:
+            await db.execute(update(DeleteJob).where(DeleteJob.id == job["id"]).values(run_after=func.now()))
+            await db.commit()
+
+        await run_delete_jobs()
+        job = (await client.get(f"/delete_jobs/{job['id']}", query_string=token)).json()
+        assert (job["status"], job["deleted_files"], job["error"]) == ("done", 2, None)
+        assert (await client.get("/get_usage", query_string=token)).json()["files"] == 0
+
+    async def test_writes_wait_for_folder_move(self, client: TestClient, access_token_fixture):
+        token = {"token": access_token_fixture}
+
+        response = await client.post("/create_folder", query_string=token, json={"folder_name": "a"})
+        a = response.json()["db_folder"]
+        response = await client.post("/create_folder", query_string=token, json={"folder_name": "b"})
+        b = response.json()["db_folder"]
+        moved_path = os.path.join(b["folder_path"], "a")
+
+        # Перенос a в b начат, но не закоммичен: запись в a должна дождаться его и взять новый путь
+        async with async_session_maker() as db:
+            await FolderDAO.lock_tree(db, a["user_id"])
+            folder = await FolderDAO.find_one_or_none(db, Folder.id == a["id"])
+            await FolderDAO.move_subtree(db, folder, b["id"], FolderDAO.child_tree_path(b["tree_path"], a["id"]), moved_path)
+
+            upload = asyncio.create_task(client.post(
+                "/upload_file", query_string={**token, "folder_id": a["id"]},
+                files={"file": ("late.bin", BytesIO(b"late"), "application/octet-stream")}))
+            create = asyncio.create_task(client.post(
+                "/create_folder", query_string=token, json={"folder_name": "child", "parent_folder_id": a["id"]}))
+
+            await asyncio.sleep(0.3)
+            assert not upload.done() and not create.done()
+            await db.commit()
+
+        response = await upload
+        assert response.json()["file_path"] == os.path.join(moved_path, "late.bin")
+        response = await create
+        assert response.json()["folder_path"] == os.path.join(moved_path, "child")
+
+    async def test_folder_stats(self, client: TestClient, access_token_fixture):
+        token = {"token": access_token_fixture}
+
+        async def sizes(folder_id: int) -> tuple:
+            stats = (await client.get("/get_folder_stats", query_string={**token, "folder_id": folder_id})).json()
+            return stats["direct_files"], stats["direct_bytes"], stats["total_files"], stats["total_bytes"]
+
+        response = await client.post("/create_folder", query_string=token, json={"folder_name": "a"})
+        a = response.json()["db_folder"]
+        response = await client.post("/create_folder", query_string=token, json={"folder_name": "b", "parent_folder_id": a["id"]})
+        b = response.json()["db_folder"]
+        response = await client.post("/create_folder", query_string=token, json={"folder_name": "c", "parent_folder_id": b["id"]})
+        c = response.json()["db_folder"]
+
+        response = await client.post(
+            "/upload_file", query_string={**token, "folder_id": c["id"]},
+            files={"file": ("one.bin", BytesIO(b"123"), "application/octet-stream")})
+        file_id = response.json()["id"]
+
+        body, content_type = _multipart("files", [("two.bin", b"12345"), ("three.bin", b"1234567")])
+        response = await client.post(
+            "/upload_files", query_string={**token, "folder_id": b["id"]}, data=body, headers={"Content-Type": content_type})
+        assert response.json()["uploaded"] == 2
+
+        assert await sizes(a["id"]) == (0, 0, 3, 15)
+        assert await sizes(b["id"]) == (2, 12, 3, 15)
+        assert await sizes(c["id"]) == (1, 3, 1, 3)
+
+        response = await client.get("/get_folders", query_string={**token, "folder_id": a["id"]})
+        assert [(folder["id"], folder["total_bytes"]) for folder in response.json()] == [(b["id"], 15)]
+
+        response = await client.patch("/move_folder", query_string={**token, "folder_id": c["id"], "parent_folder_id": a["id"]})
+        assert response.status_code == 200
+        assert await sizes(a["id"]) == (0, 0, 3, 15)
+        assert await sizes(b["id"]) == (2, 12, 2, 12)
+
+        await client.delete("/delete_file", query_string={**token, "file_id": file_id})
+        assert await sizes(a["id"]) == (0, 0, 2, 12)
+        assert await sizes(c["id"]) == (0, 0, 0, 0)
+
+        response = await client.delete("/delete_folder", query_string={**token, "folder_id": b["id"]})
+        assert response.status_code == 202
+        assert await sizes(a["id"]) == (0, 0, 0, 0)
+        await run_delete_jobs()
+
+        # Сверка находит и исправляет разошедшиеся строки
+        async with async_session_maker() as db:
+            await db.execute(update(FolderStats).where(FolderStats.folder_id == a["id"]).values(total_bytes=100))
+            await db.commit()
+
+            folder_crud = FileManager(db).folder_crud
+            assert await folder_crud.rebuild_stats(a["user_id"]) == 1
+            assert await folder_crud.rebuild_stats(a["user_id"]) == 0
+
+        assert await sizes(a["id"]) == (0, 0, 0, 0)
+
+    async def test_folder_stats_with_concurrent_move(self, client: TestClient, access_token_fixture):
+        token = {"token": access_token_fixture}
+
+        folders = {}
+        for name, parent in (("r1", None), ("r2", None), ("a", "r1")):
+            json = {"folder_name": name, "parent_folder_id": folders[parent]["id"] if parent else None}
+            folders[name] = (await client.post("/create_folder", query_string=token, json=json)).json()["db_folder"]
+        r2, a = folders["r2"], folders["a"]
+
+        response = await client.post(
+            "/upload_file", query_string={**token, "folder_id": a["id"]},
+            files={"file": ("old.bin", BytesIO(b"123"), "application/octet-stream")})
+        old_id = response.json()["id"]
+
+        # Перенос a из r1 в r2 не закоммичен, а в a идут загрузка и удаление: их размеры меняют новых предков
+        async with async_session_maker() as db:
+            await FolderDAO.lock_tree(db, a["user_id"])
+            folder = await FolderDAO.find_one_or_none(db, Folder.id == a["id"])
+            tree_path = FolderDAO.child_tree_path(r2["tree_path"], a["id"])
+            await FileManager(db)._folder_stats.move_subtree(folder, folder.tree_path, tree_path)
+            await FolderDAO.move_subtree(db, folder, r2["id"], tree_path, os.path.join(r2["folder_path"], "a"))
+
+            upload = asyncio.create_task(client.post(
+                "/upload_file", query_string={**token, "folder_id": a["id"]},
+                files={"file": ("late.bin", BytesIO(b"12345"), "application/octet-stream")}))
+            delete = asyncio.create_task(client.delete(
+                "/delete_file", query_string={**token, "file_id": old_id, "permanent": "true"}))
+            await asyncio.sleep(0.3)
+            await db.commit()
+
+        assert (await upload).status_code == 200
+        assert (await delete).status_code == 200
+
+        for name, total_bytes in (("r1", 0), ("r2", 5), ("a", 5)):
+            stats = (await client.get("/get_folder_stats", query_string={**token, "folder_id": folders[name]["id"]})).json()
+            assert stats["total_bytes"] == total_bytes, name
+
+        async with async_session_maker() as db:
+            assert await FileManager(db).folder_crud.rebuild_stats(a["user_id"]) == 0
+
+    async def test_storage_quota(self, client: TestClient, access_token_fixture, monkeypatch):
+        token = {"token": access_token_fixture}
+        monkeypatch.setattr(service, "STORAGE_QUOTA_BYTES", 1000)
+
+        response = await client.post(
+            "/upload_file", query_string=token, files={"file": ("small.bin", BytesIO(b"123456"), "application/octet-stream")})
+        assert response.status_code == 200
+        user_id, file_id = response.json()["user_id"], response.json()["id"]
+
+        response = await client.get("/get_usage", query_string=token)
+        assert response.json() == {"files": 1, "bytes": 6, "quota": 1000}
+
+        # Content-Length больше остатка квоты - отказ до записи байтов
+        response = await client.post(
+            "/upload_file", query_string=token, files={"file": ("big.bin", BytesIO(token_bytes(2000)), "application/octet-stream")})
+        assert response.status_code == 413
+
+        response = await client.post("/create_upload_session", query_string=token, json={
+            "file_name": "big.bin", "file_size": 2000, "chunk_size": 1000})
+        assert response.status_code == 413
+
+        response = await client.get("/get_usage", query_string=token)
+        assert (response.json()["files"], response.json()["bytes"]) == (1, 6)
+
+        # Файл в корзине занимает место, пока его не удалит очистка
+        await client.delete("/delete_file", query_string={**token, "file_id": file_id})
+        response = await client.get("/get_usage", query_string=token)
+        assert (response.json()["files"], response.json()["bytes"]) == (1, 6)
+
+        await client.delete("/empty_trash", query_string=token)
+        await purge_trash()
+        response = await client.get("/get_usage", query_string=token)
+        assert (response.json()["files"], response.json()["bytes"]) == (0, 0)
+
+        # Сверка дописывает расхождение в слот 0
+        async with async_session_maker() as db:
+            await db.execute(update(UserUsage).where(UserUsage.user_id == user_id).values(bytes=UserUsage.bytes + 50))
+            await db.commit()
+            drifted = await UserUsageDAO.get(db, user_id)
+            await db.commit()
+
+            # Пока сверку держит другой воркер, задача ничего не дописывает
+            async with async_session_maker() as other:
+                assert await UserUsageDAO.try_lock_reconcile(other)
+                await reconcile_user_usage()
+                await other.rollback()
+
+            assert await UserUsageDAO.get(db, user_id) == drifted != (0, 0)
+            await db.commit()
+
+            assert await UserUsageDAO.reconcile(db, [user_id]) == [user_id]
+            await db.commit()
+            assert await UserUsageDAO.get(db, user_id) == (0, 0)
+            assert await UserUsageDAO.reconcile(db, [user_id]) == []
+
+    async def test_trash(self, client: TestClient, access_token_fixture):
+        token = {"token": access_token_fixture}
+        content = token_bytes(512)
+
+        response = await client.post("/create_folder", query_string=token, json={"folder_name": "docs"})
+        folder_id = response.json()["db_folder"]["id"]
+
+        file_ids = []
+        for name in ("a.bin", "b.bin", "c.bin"):
+            response = await client.post(
+                "/upload_file", query_string={**token, "folder_id": folder_id},
+                files={"file": (name, BytesIO(content), "application/octet-stream")})
+            file_ids.append(response.json()["id"])
+
+        for file_id in file_ids:
+            response = await client.delete("/delete_file", query_string={**token, "file_id": file_id})
+            assert response.status_code == 200
+
+        response = await client.get("/get_folder_files", query_string={**token, "folder_id": folder_id})
+        assert response.json() == []
+
+        response = await client.get("/get_trash", query_string={**token, "limit": 2})
+        first_page = [item["file_id"] for item in response.json()]
+        response = await client.get("/get_trash", query_string={**token, "limit": 2, "cursor": response.headers["x-next-cursor"]})
+        assert sorted(first_page + [item["file_id"] for item in response.json()]) == sorted(file_ids)
+        assert "x-next-cursor" not in response.headers
+
+        # Имя свободно, поэтому восстановление в занятое место - конфликт
+        response = await client.post(
+            "/upload_file", query_string={**token, "folder_id": folder_id},
+            files={"file": ("a.bin", BytesIO(b"new"), "application/octet-stream")})
+        new_id = response.json()["id"]
+        response = await client.post("/restore_file", query_string={**token, "file_id": file_ids[0]})
+        assert response.status_code == 409
+
+        await client.delete("/delete_file", query_string={**token, "file_id": new_id, "permanent": "true"})
+        response = await client.post("/restore_file", query_string={**token, "file_id": file_ids[0]})
+        assert response.status_code == 200
+        assert response.json()["file_path"].endswith("/docs/a.bin")
+
+        response = await client.get(f"/get_file/{file_ids[0]}", query_string=token)
+        assert response.content == content
+
+        # Очистка не трогает файлы, срок которых не истек
+        await purge_trash()
+        response = await client.get("/get_trash", query_string=token)
+        assert len(response.json()) == 2
+
+        response = await client.delete("/empty_trash", query_string={**token, "file_id": file_ids[1]})
+        assert response.json() == {"expired": 1}
+        await purge_trash()
+
+        response = await client.get("/get_trash", query_string=token)
+        assert [item["file_id"] for item in response.json()] == [file_ids[2]]
+        response = await client.post("/restore_file", query_string={**token, "file_id": file_ids[1]})
+        assert response.status_code == 404
+
+        # Восстановленный файл держит blob
+        assert await get_storage().stat(BlobService.get_blob_key(hashlib.sha256(content).hexdigest())) is not None
@@ -0,0 +1,210 @@
+import json
+
+from datetime import datetime, timezone
+
+import pytest
+
+from sqlalchemy import event, func, insert, select, text
+
+from src.api.dao import BlobDAO, DeletedFileDAO, FileDAO, FolderDAO, FolderStatsDAO, UserUsageDAO
+from src.api.models import DeletedFile, File, Folder
+from src.auth.dao import RefreshTokenDAO, UserDAO
+from src.auth.models import Refresh_token, User
+
+from .conftest import async_session_maker, engine_test
+
+
+# Seq Scan по таблице больше этого числа строк считается регрессией
+SEQ_SCAN_ROW_THRESHOLD = 1000
+
+SEED_USER_ID = "query_plan_seed"
+SEED_USERS = 1500
+# Деревья папок как у живых пользователей: у многих пользователей небольшие, неглубокие деревья
+SEED_TREE_USERS = 300
+SEED_ROOT_FOLDERS = 4
+SEED_CHILD_FOLDERS = 4
+SEED_FILES_PER_FOLDER = 4
+
+
+async def _seed(db) -> None:
+
+    """ Данные, на которых планировщику выгоднее индекс; создаются один раз на базу """
+
+    if await UserDAO.find_one_or_none(db, User.id == SEED_USER_ID):
+        return
+
+    users = [{
+        "id": SEED_USER_ID if i == 0 else f"{SEED_USER_ID}_{i}",
+        "email": f"{SEED_USER_ID}_{i}@example.com",
+        "username": f"{SEED_USER_ID}_{i}",
+        "hashed_password": "-",
+    } for i in range(SEED_USERS)]
+    await db.execute(insert(User), users)
+
+    tree_users = [user["id"] for user in users[:SEED_TREE_USERS]]
+
+    roots = [{
+        "user_id": user_id,
+        "folder_name": f"root{i}",
+        "folder_path": f"/{user_id}/root{i}",
+        "tree_path": "",
+    } for user_id in tree_users for i in range(SEED_ROOT_FOLDERS)]
+    root_ids = (await db.execute(insert(Folder).returning(Folder.id), roots)).scalars().all()
+
+    children = [{
+        "user_id": root["user_id"],
+        "folder_name": f"child{j}",
+        "folder_path": f"{root['folder_path']}/child{j}",
+        "parent_folder_id": root_id,
+        "tree_path": FolderDAO.child_tree_path(FolderDAO.child_tree_path(None, root_id), 0),
+    } for root, root_id in zip(roots, root_ids) for j in range(SEED_CHILD_FOLDERS)]
+    child_ids = (await db.execute(insert(Folder).returning(Folder.id), children)).scalars().all()
+
+    # id известны только после вставки, пути дописываем одним запросом на уровень
+    await db.execute(text("UPDATE folders SET tree_path = '/' || id || '/' WHERE id = ANY(:ids)"), {"ids": root_ids})
+    await db.execute(text(
+        "UPDATE folders SET tree_path = parent.tree_path || folders.id || '/' "
+        "FROM folders AS parent WHERE parent.id = folders.parent_folder_id AND folders.id = ANY(:ids)"), {"ids": child_ids})
+
+    await db.execute(text("INSERT INTO folder_stats (folder_id) SELECT id FROM folders WHERE id = ANY(:ids)"),
+                     {"ids": root_ids + child_ids})
+
+    folders = [(root, root_id) for root, root_id in zip(roots, root_ids)]
+    folders += [(child, child_id) for child, child_id in zip(children, child_ids)]
+
+    files = [{
+        "id": f"{SEED_USER_ID}_{folder_id}_{k}",
+        "user_id": folder["user_id"],
+        "file_path": f"{folder['folder_path']}/{k}.bin",
+        "file_name": f"{k}.bin",
+        "file_extension": "bin",
+        "file_size": k,
+        "folder_id": folder_id,
+    } for folder, folder_id in folders for k in range(SEED_FILES_PER_FOLDER)]
+    await db.execute(insert(File), files)
+
+    # В корзине у каждого по файлу из папки; срок хранения у всех не истек
+    trash = [{
+        "id": f"{file['id']}_trash",
+        "file_id": file["id"],
+        "user_id": file["user_id"],
+        "expires_at": 30 * 24 * 60 * 60,
+    } for file in files if file["file_size"] == 0]
+    await db.execute(insert(DeletedFile), trash)
+
+    tokens = [{
+        "refresh_token": f"{SEED_USER_ID}_{i}",
+        "expires_at": 10 * 365 * 24 * 60 * 60,
+        "user_id": user["id"],
+    } for i, user in enumerate(users)]
+    await db.execute(insert(Refresh_token), tokens)
+
+    await db.commit()
+
+
+@pytest.fixture
+async def seeded():
+    async with async_session_maker() as db:
+        await _seed(db)
+
+        for table in ("users", "folders", "folder_stats", "files", "deleted_files", "user_usage", "refresh_tokens"):
+            await db.execute(text(f"ANALYZE {table}"))
+        await db.commit()
+
+        root_id = (await db.execute(select(func.min(Folder.id)).where(
+            Folder.user_id == SEED_USER_ID, Folder.parent_folder_id.is_(None)))).scalar_one()
+        child_id = (await db.execute(select(func.max(Folder.id)).where(
+            Folder.user_id == SEED_USER_ID, Folder.parent_folder_id.isnot(None)))).scalar_one()
+
+        child = await FolderDAO.find_one_or_none(db, Folder.id == child_id)
+
+    return {"user_id": SEED_USER_ID, "root_id": root_id, "child_id": child_id, "child": child}
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    scans = [plan["Relation Name"]] if plan["Node Type"] == "Seq Scan" else []
+    for child in plan.get("Plans", []):
+        scans += _seq_scans(child)
+    return scans
+
+
+HOT_QUERIES = {
+    "files_page_first": lambda db, s: FileDAO.find_folder_page(
+        db, s["user_id"], s["child_id"], "name", False, None, 50),
+    "files_page_after": lambda db, s: FileDAO.find_folder_page(
+        db, s["user_id"], s["child_id"], "created_at", True, (datetime.now(timezone.utc), "~"), 50),
+    "files_page_size": lambda db, s: FileDAO.find_folder_page(
+        db, s["user_id"], s["child_id"], "size", False, (1, ""), 50),
+    "files_in_subtree": lambda db, s: FileDAO.find_in_subtree(db, s["user_id"], s["root_id"]),
+    "file_by_id": lambda db, s: FileDAO.find_one_or_none(
+        db, File.id == f"{SEED_USER_ID}_{s['child_id']}_0", File.user_id == s["user_id"]),
+    "folder_has_files": lambda db, s: FileDAO.find_all(db, File.folder_id == s["child_id"], limit=1),
+    "root_folders": lambda db, s: FolderDAO.find_all(
+        db, Folder.parent_folder_id == None, Folder.user_id == s["user_id"]),  # noqa: E711
+    "child_folders": lambda db, s: FolderDAO.find_all(
+        db, Folder.parent_folder_id == s["root_id"], Folder.user_id == s["user_id"]),
+    "folder_subtree": lambda db, s: FolderDAO.find_subtree(db, s["user_id"], s["root_id"]),
+    "folder_ancestors": lambda db, s: FolderDAO.find_ancestors(db, s["user_id"], s["child"]),
+    "folder_move": lambda db, s: FolderDAO.move_subtree(
+        db, s["child"], None, FolderDAO.child_tree_path(None, s["child"].id), f"/{SEED_USER_ID}/moved"),
+    "files_mark_deleted": lambda db, s: FileDAO.mark_deleted_in_subtree(
+        db, s["user_id"], s["child"].tree_path, s["child"].folder_path, "/deleted"),
+    "folders_mark_deleted": lambda db, s: FolderDAO.mark_subtree_deleted(db, s["child"], "/deleted"),
+    "files_delete_batch": lambda db, s: FileDAO.delete_batch_in_subtree(db, s["user_id"], s["child"].tree_path, 500),
+    "folders_delete_batch": lambda db, s: FolderDAO.delete_batch_in_subtree(db, s["user_id"], s["child"].tree_path, 500),
+    "folder_children_with_stats": lambda db, s: FolderDAO.find_children_with_stats(db, s["user_id"], s["root_id"]),
+    "folder_tree_paths": lambda db, s: FolderDAO.find_tree_paths(db, [s["root_id"], s["child_id"]]),
+    "folder_owners_page": lambda db, s: FolderDAO.find_user_ids(db, SEED_USER_ID, 100),
+    "folder_stats_apply": lambda db, s: FolderStatsDAO.apply(
+        db, {s["child_id"]: (1, 10, 1, 10), s["root_id"]: (0, 0, 1, 10)}),
+    "folder_stats_rebuild": lambda db, s: FolderStatsDAO.rebuild(db, s["user_id"]),
+    "trash_page_first": lambda db, s: DeletedFileDAO.find_user_page(db, s["user_id"], None, 50),
+    "trash_page_after": lambda db, s: DeletedFileDAO.find_user_page(
+        db, s["user_id"], (datetime.now(timezone.utc), "~"), 50),
+    "trash_restore": lambda db, s: DeletedFileDAO.find_for_restore(db, s["user_id"], f"{SEED_USER_ID}_{s['child_id']}_0"),
+    "trash_expire": lambda db, s: DeletedFileDAO.expire(db, s["user_id"]),
+    "trash_purge": lambda db, s: DeletedFileDAO.purge_batch(db, datetime.now(timezone.utc), 500),
+    "blobs_orphaned": lambda db, s: BlobDAO.lock_orphaned(db, 500),
+    "usage_get": lambda db, s: UserUsageDAO.get(db, s["user_id"]),
+    "usage_add": lambda db, s: UserUsageDAO.add(db, s["user_id"], 1, 10),
+    "usage_reconcile": lambda db, s: UserUsageDAO.reconcile(db, [f"{SEED_USER_ID}_{i}" for i in range(1, 11)]),
+    "user_by_username": lambda db, s: UserDAO.find_one_or_none(db, User.username == f"{SEED_USER_ID}_7"),
+    "user_by_email": lambda db, s: UserDAO.find_one_or_none(db, User.email == f"{SEED_USER_ID}_7@example.com"),
+    "refresh_token_by_value": lambda db, s: RefreshTokenDAO.find_one_or_none(
+        db, Refresh_token.refresh_token == f"{SEED_USER_ID}_7"),
+    "refresh_token_by_user": lambda db, s: RefreshTokenDAO.find_all(
+        db, Refresh_token.user_id == f"{SEED_USER_ID}_7"),
+    "refresh_tokens_expired": lambda db, s: RefreshTokenDAO.delete_expired(db, datetime.now(timezone.utc), 1000),
+}
+
+
+class TestQueryPlans:
+
+    @pytest.mark.parametrize("name", HOT_QUERIES)
+    async def test_hot_query_uses_indexes(self, seeded, name):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, parameters))
+
+        async with async_session_maker() as db:
+            event.listen(engine_test.sync_engine, "before_cursor_execute", record)
+            try:
+                await HOT_QUERIES[name](db, seeded)
+            finally:
+                event.remove(engine_test.sync_engine, "before_cursor_execute", record)
+
+            connection = await db.connection()
+            reltuples = dict((await connection.execute(text(
+                "SELECT relname, reltuples FROM pg_class WHERE relkind = 'r'"))).all())
+
+            assert statements
+            for statement, parameters in statements:
+                result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                plan = result.scalar_one()
+                plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+                large = [table for table in _seq_scans(plan) if reltuples.get(table, 0) > SEQ_SCAN_ROW_THRESHOLD]
+                assert not large, f"{name}: Seq Scan on {large}\n{statement}\n{json.dumps(plan, indent=2)}"
+
+            await db.rollback()
@@ -0,0 +1,119 @@
+import os
+from secrets import token_bytes
+
+import pytest
+from starlette.requests import Request
+
+from src.api.config import ACCEL_REDIRECT_PREFIX
+from src.api.responses import RangeNotSatisfiable, build_file_response, parse_range_header
+from src.api.storage import get_storage
+
+
+async def _chunks(data: bytes):
+    yield data
+
+
+def _request(headers: dict[str, str] | None = None, extensions: dict | None = None) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/get_file",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "extensions": extensions or {},
+    })
+
+
+async def _run(response, request: Request) -> list[dict]:
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await response(request.scope, None, send)
+    return messages
+
+
+class TestRanges:
+
+    @pytest.mark.parametrize("header, expected", [
+        (None, None),
+        ("items=0-1", None),
+        ("bytes=0-99", [(0, 99)]),
+        ("bytes=900-", [(900, 999)]),
+        ("bytes=-100", [(900, 999)]),
+        ("bytes=-5000", [(0, 999)]),
+        ("bytes=990-5000", [(990, 999)]),
+        ("bytes=0-9, 20-29", [(0, 9), (20, 29)]),
+        ("bytes=20-29,0-9,5-14", [(0, 14), (20, 29)]),
+        ("bytes=0-9,10-19", [(0, 19)]),
+        ("bytes=5000-6000,0-0", [(0, 0)]),
+        ("bytes=9-0", None),
+        ("bytes=a-b", None),
+    ])
+    def test_parse_range_header(self, header, expected):
+        assert parse_range_header(header, 1000) == expected
+
+    @pytest.mark.parametrize("header, size", [
+        ("bytes=1000-", 1000),
+        ("bytes=-0", 1000),
+        ("bytes=0-", 0),
+    ])
+    def test_unsatisfiable_range(self, header, size):
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range_header(header, size)
+
+
+class TestDelivery:
+
+    @pytest.fixture
+    async def stored(self):
+        storage = get_storage()
+        data = token_bytes(1000)
+        await storage.put_stream("blobs/delivery-test", _chunks(data))
+        yield storage, "blobs/delivery-test", data
+        await storage.delete("blobs/delivery-test")
+
+    async def test_x_accel_redirect(self, stored):
+        storage, key, data = stored
+
+        response = build_file_response(
+            _request(), storage, key, len(data), "application/octet-stream", etag='"abc"', delivery_mode="x-accel")
+
+        location = response.headers["x-accel-redirect"]
+        assert location.startswith(ACCEL_REDIRECT_PREFIX)
+        assert location.endswith(os.path.basename(storage.local_path(key)))
+        assert response.body == b""
+
+        response = build_file_response(
+            _request({"If-None-Match": '"abc"'}), storage, key, len(data), "application/octet-stream",
+            etag='"abc"', delivery_mode="x-accel")
+        assert response.status_code == 304
+
+    async def test_x_sendfile(self, stored):
+        storage, key, data = stored
+
+        response = build_file_response(
+            _request(), storage, key, len(data), "application/octet-stream", delivery_mode="x-sendfile")
+
+        assert response.headers["x-sendfile"] == storage.local_path(key)
+
+    async def test_sendfile_with_zerocopy_extension(self, stored):
+        storage, key, data = stored
+        request = _request({"Range": "bytes=10-19"}, {"http.response.zerocopysend": {}})
+
+        response = build_file_response(request, storage, key, len(data), "application/octet-stream", delivery_mode="sendfile")
+        messages = await _run(response, request)
+
+        assert messages[0]["status"] == 206
+        assert messages[1]["type"] == "http.response.zerocopysend"
+        assert (messages[1]["offset"], messages[1]["count"]) == (10, 10)
+
+    async def test_sendfile_without_extension(self, stored):
+        storage, key, data = stored
+        request = _request()
+
+        response = build_file_response(request, storage, key, len(data), "application/octet-stream", delivery_mode="sendfile")
+        messages = await _run(response, request)
+
+        assert messages[0]["status"] == 200
+        assert b"".join(message.get("body", b"") for message in messages[1:]) == data